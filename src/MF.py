@@ -1,65 +1,77 @@
+import json
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor as RequestPool
+from datetime import date
 
-from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
-from apscheduler.schedulers.blocking import BlockingScheduler
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-
-sched = BlockingScheduler(
-    executors={
-        "threadpool": ThreadPoolExecutor(max_workers=1),
-        "processpool": ProcessPoolExecutor(max_workers=1),
-    }
-)
-print("🟢 MF: started")
-
-
-def setup_chrome_driver():
-    """Set up and return the Chrome WebDriver."""
-    userdata_dir = "selenium/mf"
-    os.makedirs(userdata_dir, exist_ok=True)
-    print(f"🔧 MF: Created userdata directory at {userdata_dir}")
-
-    options = Options()
-    options.binary_location = "/usr/bin/chromium"
-    options.add_argument("--user-data-dir=" + userdata_dir)
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=640,480")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-desktop-notifications")
-    options.add_argument("--blink-settings=imagesEnabled=false")
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.79 Safari/537.36"
-    )
-    options.add_experimental_option("useAutomationExtension", False)
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+from slack_sdk import WebClient
 
-    print("⚙️ MF: WebDriver options set")
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    driver.implicitly_wait(300)
-    return driver
+from browser import USER_AGENT, browser_context, count_commands, report_page, selenium_helpers
+from lifecycle import DRY_RUN, handle_signals
+from logs import setup_logging
+from metrics import Metrics
+from scheduler import scheduler
+
+# 環境変数から設定を取得 (記録したページを再生するときは差し替える)
+BASE_URL = os.environ.get("MF_BASE_URL", "https://moneyforward.com")
+# click: リンクごとに WebDriver で操作 / script: 1 回のスクリプトでクリック / http: 更新エンドポイントに直接リクエスト
+REFRESH_MODE = os.environ.get("MF_REFRESH_MODE", "http")
+REFRESH_CONCURRENCY = int(os.environ.get("MF_REFRESH_CONCURRENCY", 4))
+REFRESH_POLL_SECONDS = float(os.environ.get("MF_REFRESH_POLL_SECONDS", 5))
+REFRESH_DEADLINE_SECONDS = float(os.environ.get("MF_REFRESH_DEADLINE_SECONDS", 600))
+DIGEST_CHANNEL = os.environ.get("MF_DIGEST_CHANNEL", "#moneyforward")
+
+metrics = Metrics("MF")
+
+# 口座ごとのスナップショット (1 行 1 件の追記専用、同じ口座・同じ日の行は後のものが優先)
+SNAPSHOT_FILE = "data/MF/snapshots.jsonl"
+
+# 口座一覧ページの読み取り
+ACCOUNT_ROW_SELECTOR = "#account-table tr"
+ACCOUNT_TABLE_MARKER = b'id="account-table"'
+BALANCE_PATTERN = re.compile(r"-?[\d,]+(?=円)")
+UPDATED_PATTERN = re.compile(r"\d{1,2}/\d{1,2} \d{1,2}:\d{2}")
+
+# 「更新」リンクと、直接リクエストを送るのに必要な情報を 1 回で集める
+COLLECT_REFRESH_LINKS_SCRIPT = """
+const links = Array.from(document.querySelectorAll("a")).filter((a) => a.textContent.trim() === "更新");
+const csrf = document.querySelector("meta[name=csrf-token]");
+return {
+    csrfToken: csrf ? csrf.content : null,
+    links: links.map((a) => ({
+        href: a.href,
+        method: (a.dataset.method || "get").toUpperCase(),
+        account: (a.closest("li, tr") || a.parentElement).innerText.split("\\n")[0].trim(),
+    })),
+};
+"""
+# href を指定したときはそのリンクだけをクリックする
+CLICK_REFRESH_LINKS_SCRIPT = """
+const hrefs = arguments[0];
+const links = Array.from(document.querySelectorAll("a")).filter(
+    (a) => a.textContent.trim() === "更新" && (!hrefs || hrefs.includes(a.href))
+);
+links.forEach((a) => a.click());
+return links.length;
+"""
 
 
 def login_to_moneyforward(driver):
     """Handles logging into the MoneyForward website."""
+    By, EC, WebDriverWait = selenium_helpers()
+
     wait = WebDriverWait(driver, 300)
 
-    print("🌐 MF: Navigating to https://moneyforward.com/")
-    driver.get("https://moneyforward.com/")
+    print(f"🌐 MF: Navigating to {BASE_URL}/")
+    driver.get(BASE_URL + "/")
 
     if driver.title == "マネーフォワード ME":
         print("✅ MF: init() already logged in")
         return True
 
     print("🚪 MF: Not logged in, navigating to sign in page")
-    driver.get("https://moneyforward.com/sign_in")
+    driver.get(BASE_URL + "/sign_in")
 
     input_id = wait.until(EC.visibility_of_element_located((By.NAME, "mfid_user[email]")))
     print("🔑 MF: init() url: " + driver.current_url)
@@ -93,9 +105,9 @@ def login_to_moneyforward(driver):
     return True
 
 
-def init():
+def init(driver):
     print("🔵 MF: init() started")
-    driver = setup_chrome_driver()
+    driver.implicitly_wait(300)
 
     if not login_to_moneyforward(driver):
         return None
@@ -104,12 +116,21 @@ def init():
     return driver
 
 
-def update_all(driver):
-    print("🔵 MF: update_all() started")
-    wait = WebDriverWait(driver, 30)
+def http_session(driver):
+    """Returns a requests session carrying the browser's MoneyForward cookies."""
+    import requests
+
+    session = requests.Session()
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    session.headers.update({"User-Agent": USER_AGENT, "Referer": BASE_URL + "/"})
+    return session
+
+
+def click_each_link(driver):
+    """Clicks the refresh links one WebDriver call at a time (kept for comparison)."""
+    By, _, _ = selenium_helpers()
 
-    driver.get("https://moneyforward.com/")
-    wait.until(EC.visibility_of_element_located((By.ID, "js-cf-manual-payment-entry-submit-button")))
     a_elements = driver.find_elements(By.TAG_NAME, "a")
     refreshed_cnt = 0
     for a_elem in a_elements:
@@ -119,27 +140,265 @@ def update_all(driver):
                 refreshed_cnt += 1
         except Exception as e:
             print("⚠️ MF: update_all() error: " + str(e))
+    return refreshed_cnt
+
+
+def refresh_via_http(driver):
+    """
+    Collects the refresh links in one script call and requests their endpoints directly with the
+    browser's session cookies, REFRESH_CONCURRENCY at a time, using each link's data-method (GET if it
+    has none). Only a 2xx counts as sent; redirects are not followed, so an expired session that
+    redirects to the sign-in page counts as failed. Links that fail are clicked instead.
+    """
+    import requests
+
+    collected = driver.execute_script(COLLECT_REFRESH_LINKS_SCRIPT)
+    session = http_session(driver)
+    session.headers.update(
+        {
+            "X-Requested-With": "XMLHttpRequest",
+            "Accept": "text/javascript, application/javascript, */*",
+        }
+    )
+    if collected["csrfToken"]:
+        session.headers["X-CSRF-Token"] = collected["csrfToken"]
+
+    def refresh(link):
+        start = time.perf_counter()
+        try:
+            response = session.request(link["method"], link["href"], timeout=30, allow_redirects=False)
+            ok = 200 <= response.status_code < 300
+            if response.is_redirect:
+                print(f"⚠️ MF: refresh of {link['account']} redirected to {response.headers.get('Location')}")
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ MF: refresh of {link['account']} failed: {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        print(f"⏱️ MF: refresh {'sent' if ok else 'failed'} for {link['account']} in {elapsed * 1000:.0f} ms")
+        return link, ok
+
+    with RequestPool(max_workers=REFRESH_CONCURRENCY) as pool:
+        results = list(pool.map(refresh, collected["links"]))
+
+    failed = [link["href"] for link, ok in results if not ok]
+    if failed:
+        print(f"🔁 MF: falling back to clicking {len(failed)} links")
+        driver.execute_script(CLICK_REFRESH_LINKS_SCRIPT, failed)
+    return len(results)
+
+
+def update_all(driver, mode=REFRESH_MODE):
+    By, EC, WebDriverWait = selenium_helpers()
+
+    print("🔵 MF: update_all() started")
+    wait = WebDriverWait(driver, 30)
+
+    driver.get(BASE_URL + "/")
+    wait.until(EC.visibility_of_element_located((By.ID, "js-cf-manual-payment-entry-submit-button")))
+    report_page(driver, "MF top")
+
+    start = time.perf_counter()
+    with count_commands(driver) as commands:
+        if mode == "click":
+            refreshed_cnt = click_each_link(driver)
+        elif mode == "script":
+            refreshed_cnt = driver.execute_script(CLICK_REFRESH_LINKS_SCRIPT, None)
+        else:
+            refreshed_cnt = refresh_via_http(driver)
+    elapsed = time.perf_counter() - start
+    print(f"🔢 MF: update_all() sent {sum(commands.values())} WebDriver commands in {mode} mode ({elapsed:.2f} s)")
     print(f"🔄 MF: Refreshed {refreshed_cnt} elements")
+    metrics.inc("mf_refreshed_accounts_total", refreshed_cnt, mode=mode)
+    metrics.observe("mf_refresh_request_seconds", elapsed, mode=mode)
     print("✅ MF: update_all() done")
+    return refreshed_cnt
 
 
-if __name__ == "__main__":
+def parse_accounts(html):
+    """Reads id, name, balance, last-updated time and refreshing state of every account on the account list."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    accounts = []
+    for row in soup.select(ACCOUNT_ROW_SELECTOR):
+        link = row.select_one('a[href*="/accounts/show/"]')
+        if not link:
+            continue
+        text = row.get_text(" ", strip=True)
+        balance = BALANCE_PATTERN.search(text)
+        updated = UPDATED_PATTERN.search(text)
+        accounts.append(
+            {
+                "id": link["href"].rstrip("/").split("/")[-1],
+                "name": link.get_text(strip=True),
+                "balance": int(balance.group().replace(",", "")) if balance else None,
+                "updated": updated.group() if updated else None,
+                "refreshing": "更新中" in text,
+            }
+        )
+    return accounts
+
+
+def fetch_account_table(session):
+    """Returns the account list page read only up to the end of the account table; the rest is never downloaded."""
+    with session.get(BASE_URL + "/accounts", timeout=30, stream=True) as response:
+        response.raise_for_status()
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=16 * 1024):
+            body += chunk
+            start = body.find(ACCOUNT_TABLE_MARKER)
+            if start != -1 and body.find(b"</table>", start) != -1:
+                break
+        return body.decode(response.encoding or "utf-8", errors="replace")
+
+
+def wait_for_refresh(session, started_at):
+    """
+    Polls the account table over HTTP until no account is refreshing or REFRESH_DEADLINE_SECONDS have passed
+    since `started_at`. The interval starts at REFRESH_POLL_SECONDS and backs off up to 30 s.
+    Returns the accounts from the last poll.
+    """
+    print("🔵 MF: wait_for_refresh() started")
+    deadline = started_at + REFRESH_DEADLINE_SECONDS
+    interval = REFRESH_POLL_SECONDS
+    settled = {}
+    polls = 0
+    while True:
+        accounts = parse_accounts(fetch_account_table(session))
+        polls += 1
+        now = time.monotonic()
+        for account in accounts:
+            if not account["refreshing"]:
+                settled.setdefault(account["id"], now - started_at)
+
+        refreshing = [account["name"] for account in accounts if account["refreshing"]]
+        if not refreshing:
+            break
+        if now + interval > deadline:
+            print(f"⚠️ MF: wait_for_refresh() deadline reached, still refreshing: {', '.join(refreshing)}")
+            break
+        time.sleep(interval)
+        interval = min(interval * 1.5, 30)
+
+    for account in accounts:
+        if account["id"] in settled:
+            print(f"⏱️ MF: {account['name']} settled within {settled[account['id']]:.0f} s")
+        else:
+            print(f"⏱️ MF: {account['name']} did not settle")
+    print(f"✅ MF: wait_for_refresh() done after {polls} polls")
+    return accounts
+
+
+def load_snapshots():
+    """Returns {account_id: {date: snapshot}} from SNAPSHOT_FILE."""
+    snapshots = {}
+    if os.path.exists(SNAPSHOT_FILE):
+        with open(SNAPSHOT_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                snapshot = json.loads(line)
+                snapshots.setdefault(snapshot["id"], {})[snapshot["date"]] = snapshot
+    return snapshots
+
+
+def record_snapshots(accounts):
+    """
+    Appends a snapshot for each account whose last-updated time or balance differs from its latest stored one.
+    Unchanged accounts are skipped, so a day with no refreshes writes nothing.
+    """
+    snapshots = load_snapshots()
+    today = date.today().isoformat()
+    changed = []
+    for account in accounts:
+        if account["balance"] is None:
+            continue
+        history = snapshots.get(account["id"])
+        latest = history[max(history)] if history else None
+        if latest and latest["updated"] == account["updated"] and latest["balance"] == account["balance"]:
+            continue
+        changed.append(
+            {
+                "id": account["id"],
+                "name": account["name"],
+                "balance": account["balance"],
+                "updated": account["updated"],
+                "date": today,
+            }
+        )
+
+    os.makedirs(os.path.dirname(SNAPSHOT_FILE), exist_ok=True)
+    with open(SNAPSHOT_FILE, "a", encoding="utf-8") as f:
+        for snapshot in changed:
+            f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+    print(f"💾 MF: record_snapshots() stored {len(changed)} of {len(accounts)} accounts")
+    metrics.set("mf_accounts", len(accounts))
+    metrics.inc("mf_snapshots_total", len(changed))
+    return changed
+
+
+def send_digest():
+    """Posts today's balance change per account, compared with each account's previous day in the local store."""
+    today = date.today().isoformat()
+    lines = []
+    total = 0
+    for history in load_snapshots().values():
+        if today not in history:
+            continue
+        current = history[today]
+        previous_days = [day for day in history if day < today]
+        if not previous_days:
+            continue
+        delta = current["balance"] - history[max(previous_days)]["balance"]
+        if delta:
+            total += delta
+            lines.append(f"・{current['name']}: {delta:+,}円 (残高 {current['balance']:,}円)")
+
+    if not lines:
+        print("✅ MF: send_digest() no changes to report")
+        return
+    message = f"残高の変化: {total:+,}円\n" + "\n".join(lines)
     try:
-        print("🚀 MF: Main execution started")
-        update_all(init())
+        client = WebClient(token=os.environ["SLACK_BOT_TOKEN"])
+        client.chat_postMessage(channel=DIGEST_CHANNEL, text=message)
+        print(f"✅ MF: send_digest() sent {len(lines)} accounts to {DIGEST_CHANNEL}")
     except Exception as e:
-        print("⚠️ MF: __main__ error: " + str(e))
+        print("⚠️ MF: send_digest() error... " + str(e))
 
 
-@sched.scheduled_job("cron", minute="15", hour="7", executor="threadpool", misfire_grace_time=60 * 60)
+# ブラウザの枠は browser_context() が取る。更新の完了待ちの間は枠を持たないよう、resource は指定しない
+@scheduler.cron("MF.update_all", metrics, minute="15", hour="7")
 def scheduled_job():
     print("📅 MF: ----- update_all started -----")
-    driver = init()
-    if driver != None:
-        update_all(driver)
-        driver.quit()
+    try:
+        with metrics.job("update_all") as run:
+            session = None
+            with browser_context("mf") as driver:
+                if init(driver) is not None:
+                    started_at = time.monotonic()
+                    update_all(driver)
+                    session = http_session(driver)
+                else:
+                    run.fail()
+            # 待つのは HTTP だけなので、ブラウザの枠を返してから待つ
+            if session is not None:
+                record_snapshots(wait_for_refresh(session, started_at))
+    finally:
+        # 更新や記録が失敗しても、保存済みのスナップショットから差分を送る
+        send_digest()
     print("✅ MF: ----- update_all done -----")
 
 
-sched.start()
-print("🟢 MF: initialized")
+if __name__ == "__main__":
+    setup_logging("MF")
+    handle_signals()
+    print("🟢 MF: started")
+    try:
+        if not DRY_RUN:
+            print("🚀 MF: Main execution started")
+            with browser_context("mf") as driver:
+                update_all(init(driver))
+    except Exception as e:
+        print("⚠️ MF: __main__ error: " + str(e))
+
+    metrics.start()
+    scheduler.run()
+    print("🟢 MF: initialized")
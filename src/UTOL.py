@@ -3,58 +3,31 @@ import os
 import pickle
 from time import sleep
 
-from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
-from apscheduler.schedulers.blocking import BlockingScheduler
-from bs4 import BeautifulSoup
 from slack_sdk import WebClient
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+from browser import browser_context, report_page, selenium_helpers
+from lifecycle import DRY_RUN, handle_signals
+from logs import setup_logging
+from metrics import Metrics
+from scheduler import scheduler
 
-sched = BlockingScheduler(
-    executors={
-        "threadpool": ThreadPoolExecutor(max_workers=5),
-        "processpool": ProcessPoolExecutor(max_workers=1),
-    }
-)
+# 環境変数から設定を取得 (記録したページを再生するときは差し替える)
+BASE_URL = os.environ.get("UTOL_BASE_URL", "https://utol.ecc.u-tokyo.ac.jp")
+PAGE_SETTLE_SECONDS = float(os.environ.get("UTOL_PAGE_SETTLE_SECONDS", 15))
 
-print("🟢 UTOL: started")
+metrics = Metrics("UTOL")
 
 
-def init():
-    print("🔵 UTOL: init() started")
+def init(driver):
+    By, EC, WebDriverWait = selenium_helpers()
 
-    userdata_dir = "selenium/utol"
-    os.makedirs(userdata_dir, exist_ok=True)
-    print(f"🔧 UTOL: Created userdata directory at {userdata_dir}")
-
-    options = Options()
-    options.binary_location = "/usr/bin/chromium"
-    options.add_argument("--user-data-dir=" + userdata_dir)
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=640,480")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-desktop-notifications")
-    options.add_argument("--blink-settings=imagesEnabled=false")
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.79 Safari/537.36"
-    )
-    options.add_experimental_option("useAutomationExtension", False)
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    print("🔵 UTOL: init() started")
 
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
     wait = WebDriverWait(driver, 300)
     driver.implicitly_wait(300)
 
     try:
-        driver.get("https://utol.ecc.u-tokyo.ac.jp/saml/login?disco=true")
+        driver.get(BASE_URL + "/saml/login?disco=true")
         # wait.until(EC.visibility_of_element_located((By.ID, "pageContents")))
         if driver.title != "時間割":
             input_id = wait.until(EC.visibility_of_element_located((By.NAME, "loginfmt")))
@@ -100,8 +73,10 @@ def init():
 
 
 def getTaskList(driver):
+    By, EC, WebDriverWait = selenium_helpers()
+
     print("🔵 UTOL: getTaskList() started")
-    driver.get("https://utol.ecc.u-tokyo.ac.jp/lms/task")
+    driver.get(BASE_URL + "/lms/task")
     wait = WebDriverWait(driver, 30)
 
     check_button = wait.until(EC.visibility_of_element_located((By.ID, "status_2")))
@@ -110,9 +85,18 @@ def getTaskList(driver):
     check_button.click()
     check_button = wait.until(EC.visibility_of_element_located((By.ID, "status_4")))
     check_button.click()
-    sleep(15)
+    sleep(PAGE_SETTLE_SECONDS)
+    report_page(driver, "UTOL task list")
+
+    taskList = parseTaskList(driver.page_source)
+    print(f"✅ UTOL: getTaskList() found {len(taskList)} tasks")
+    return taskList
+
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+def parseTaskList(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
     tasks = soup.find_all("div", class_="result_list_line")
 
     taskList = []
@@ -123,10 +107,9 @@ def getTaskList(driver):
                 "contents": task.contents[3].contents[1].text,
                 "title": task.contents[5].contents[1].text.replace("\n", ""),
                 "deadline": task.contents[7].contents[5].text,
-                "link": "https://utol.ecc.u-tokyo.ac.jp" + task.contents[5].contents[1].attrs["href"],
+                "link": BASE_URL + task.contents[5].contents[1].attrs["href"],
             }
         )
-    print(f"✅ UTOL: getTaskList() found {len(taskList)} tasks")
     return taskList
 
 
@@ -164,9 +147,19 @@ def sendTasks(tasks):
 
 def getUpdates(driver):
     print("🔵 UTOL: getUpdates() started")
-    driver.get("https://utol.ecc.u-tokyo.ac.jp/updateinfo?openStatus=0&selectedUpdInfoButton=2")
-    sleep(15)
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    driver.get(BASE_URL + "/updateinfo?openStatus=0&selectedUpdInfoButton=2")
+    sleep(PAGE_SETTLE_SECONDS)
+    report_page(driver, "UTOL updates")
+
+    updateList = parseUpdates(driver.page_source)
+    print(f"✅ UTOL: getUpdates() found {len(updateList)} updates")
+    return updateList
+
+
+def parseUpdates(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
     updates = soup.find_all(
         "div",
         class_="update-info-student contents-display-flex-exchange-sp update-info-cell",
@@ -181,26 +174,17 @@ def getUpdates(driver):
                 "course": data[5].text.replace("\n", ""),
                 "content": data[7].text.replace("\n", ""),
                 "info": data[9].text.replace("\n", "")[1:-18],
-                "link": "https://utol.ecc.u-tokyo.ac.jp" + data[9].contents[1].attrs["value"],
+                "link": BASE_URL + data[9].contents[1].attrs["value"],
             }
         )
-    print(f"✅ UTOL: getUpdates() found {len(updateList)} updates")
     return updateList
 
 
-def sendUpdates(updates):
-    print("🔵 UTOL: sendUpdates() started")
-    data = []
-    try:
-        with open("data/UTOL/updates.pkl", "rb") as f:
-            data = pickle.load(f)
-        print("✅ UTOL: sendUpdates() loaded previous updates")
-    except:
-        print("⚠️ UTOL: sendUpdates() updates.pkl open error")
-
+def diffUpdates(previous, updates):
+    """Returns the Slack attachments for the updates that are not in `previous`."""
     sendLists = []
     for update in updates:
-        if update not in data:
+        if update not in previous:
             colorStr = "#f5f5f5"
             if update["content"] == "課題" or update["content"] == "テスト":
                 colorStr = "danger"
@@ -221,6 +205,20 @@ def sendUpdates(updates):
                     "text": update["info"],
                 }
             )
+    return sendLists
+
+
+def sendUpdates(updates):
+    print("🔵 UTOL: sendUpdates() started")
+    data = []
+    try:
+        with open("data/UTOL/updates.pkl", "rb") as f:
+            data = pickle.load(f)
+        print("✅ UTOL: sendUpdates() loaded previous updates")
+    except:
+        print("⚠️ UTOL: sendUpdates() updates.pkl open error")
+
+    sendLists = diffUpdates(data, updates)
 
     if sendLists:
         sendMessageToSlack("#utol-updates", "", json.dumps(sendLists))
@@ -233,33 +231,40 @@ def sendUpdates(updates):
     print("✅ UTOL: sendUpdates() saved updates")
 
 
-@sched.scheduled_job("cron", minute="45", hour="18", executor="threadpool", misfire_grace_time=60 * 60)
+@scheduler.cron("UTOL.sendTasks", metrics, resource="chromium", minute="45", hour="18")
 def scheduled_job_sendTasks():
     print("📅 UTOL: ----- sendTasks started -----")
-    driver = init()
-    if driver:
-        sendTasks(getTaskList(driver))
-        driver.quit()
+    with metrics.job("sendTasks") as run, browser_context("utol") as driver:
+        if init(driver):
+            sendTasks(getTaskList(driver))
+        else:
+            run.fail()
     print("✅ UTOL: ----- sendTasks done -----")
 
 
-@sched.scheduled_job("cron", minute="0,10,20,30,40,50", executor="threadpool", misfire_grace_time=60 * 60)
+@scheduler.cron("UTOL.sendUpdates", metrics, resource="chromium", minute="0,10,20,30,40,50")
 def scheduled_job_sendUpdates():
     print("📅 UTOL: ----- sendUpdates started -----")
-    driver = init()
-    if driver:
-        sendUpdates(getUpdates(driver))
-        driver.quit()
+    with metrics.job("sendUpdates") as run, browser_context("utol") as driver:
+        if init(driver):
+            sendUpdates(getUpdates(driver))
+        else:
+            run.fail()
     print("✅ UTOL: ----- sendUpdates done -----")
 
 
 if __name__ == "__main__":
+    setup_logging("UTOL")
+    handle_signals()
+    print("🟢 UTOL: started")
     try:
-        print("🚀 UTOL: Main execution started")
-        sendTasks(getTaskList(init()))
+        if not DRY_RUN:
+            print("🚀 UTOL: Main execution started")
+            with browser_context("utol") as driver:
+                sendTasks(getTaskList(init(driver)))
     except Exception as e:
         print("⚠️ UTOL: __main__ error: " + str(e))
 
-
-sched.start()
-print("🟢 UTOL: Execution completed")
+    metrics.start()
+    scheduler.run()
+    print("🟢 UTOL: Execution completed")
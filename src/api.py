@@ -1,11 +1,12 @@
 import os
 
-from flask import Flask, request
-from google_auth_oauthlib.flow import InstalledAppFlow
+from flask import Flask, Response, jsonify, request
 from waitress import serve
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-print("api: started")
+from lifecycle import handle_signals
+from logs import setup_logging
+from metrics import MetricsCollector
 
 # 環境変数から設定を取得
 YOUTUBE_CLIENT_SECRET_FILE = os.environ["YOUTUBE_CLIENT_SECRET_FILE"]
@@ -24,6 +25,9 @@ flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=1, x_proto=1, x_host=1,
 # YouTube API の認証
 @flask_app.route("/usercallback")
 def usercallback():
+    # 認可のときしか使わず読み込みが重いので、ここでインポートする
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     try:
         flow = InstalledAppFlow.from_client_secrets_file(
             YOUTUBE_CLIENT_SECRET_FILE,
@@ -43,5 +47,31 @@ def usercallback():
         return f"Authorization failed: {e!r}"
 
 
+# 各プロセスから送られてくるメトリクス
+collector = MetricsCollector()
+
+
+@flask_app.route("/metrics")
+def metrics():
+    return Response(collector.render(), mimetype="text/plain; version=0.0.4")
+
+
+@flask_app.route("/healthz")
+def healthz_all():
+    results = {component: collector.health(component) for component in collector.components()}
+    healthy = all(ok for ok, _ in results.values())
+    return jsonify({component: details for component, (_, details) in results.items()}), 200 if healthy else 503
+
+
+@flask_app.route("/healthz/<component>")
+def healthz(component):
+    healthy, details = collector.health(component)
+    return jsonify(details), 200 if healthy else 503
+
+
 if __name__ == "__main__":
-    serve(flask_app, host="localhost", port=8001)
+    setup_logging("api")
+    handle_signals()
+    print("api: started")
+    collector.start()
+    serve(flask_app, host="localhost", port=int(os.environ.get("API_PORT", 8001)))
@@ -0,0 +1,546 @@
+import fcntl
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import scrape_replay
+
+# 環境変数から設定を取得
+CHROMIUM_PATH = os.environ.get("CHROMIUM_PATH", "/usr/bin/chromium")
+BROKER_PORT = int(os.environ.get("BROWSER_BROKER_PORT", 9222))
+BROKER_MAX_CONTEXTS = int(os.environ.get("BROWSER_MAX_CONTEXTS", 1))
+BROKER_ENABLED = os.environ.get("BROWSER_BROKER", "1") != "0"
+BLOCKING_ENABLED = os.environ.get("BROWSER_BLOCKING", "1") != "0"
+# 遮断したリソースのサイズの推定に使う、最近読み込んだ URL の数
+RESOURCE_SIZES_MAX = int(os.environ.get("BROWSER_RESOURCE_SIZES_MAX", 2000))
+
+BROKER_DIR = "selenium/broker"
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.79 Safari/537.36"
+)
+CHROMIUM_ARGS = [
+    "--headless",
+    "--disable-gpu",
+    "--window-size=640,480",
+    "--no-sandbox",
+    "--disable-blink-features=AutomationControlled",
+    "--disable-extensions",
+    "--disable-desktop-notifications",
+    "--blink-settings=imagesEnabled=false",
+    "--user-agent=" + USER_AGENT,
+]
+HIDE_WEBDRIVER_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+# スクレイパーが使わないリソース
+STATIC_RESOURCE_PATTERNS = [
+    "*.css",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.svg",
+    "*.ico",
+]
+TRACKER_PATTERNS = [
+    "*://*.google-analytics.com/*",
+    "*://*.googletagmanager.com/*",
+    "*://*.doubleclick.net/*",
+    "*://*.facebook.net/*",
+    "*://*.hotjar.com/*",
+    "*://*.clarity.ms/*",
+    "*://*.karte.io/*",
+    "*://*.nr-data.net/*",
+    "*://*.newrelic.com/*",
+]
+
+# サイトごとのリクエストブロックポリシー
+# deny に一致するリクエストはブロックし、allow に一致するものは deny より優先して通す
+BLOCK_POLICIES = {
+    "utol": {
+        "allow": [
+            # Microsoft のサインイン画面はスクリプトとスタイルがないと動かない
+            "*://login.microsoftonline.com/*",
+            "*://aadcdn.msauth.net/*",
+            "*://aadcdn.msftauth.net/*",
+        ],
+        "deny": [
+            *TRACKER_PATTERNS,
+            *(f"*://utol.ecc.u-tokyo.ac.jp/{p}" for p in STATIC_RESOURCE_PATTERNS),
+        ],
+    },
+    "mf": {
+        "allow": ["*://id.moneyforward.com/*"],
+        "deny": [
+            *TRACKER_PATTERNS,
+            *(f"*://moneyforward.com/{p}" for p in STATIC_RESOURCE_PATTERNS),
+            *(f"*://*.moneyforward.com/{p}" for p in STATIC_RESOURCE_PATTERNS),
+            "*://*.ads-twitter.com/*",
+            "*://*.yahoo.co.jp/*",
+        ],
+    },
+}
+RESOURCE_SIZES_FILE = "selenium/broker/resource_sizes.json"
+
+# Network.setCookies が受け付けるフィールド
+COOKIE_PARAM_KEYS = ["name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires"]
+# スレッドごとに保持しているコンテキスト枠
+_held = threading.local()
+# RESOURCE_SIZES_FILE の内容 (最初の page_stats() で読み込む)。古く使われていないものが先頭
+_resource_sizes = None
+_resource_sizes_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def selenium_helpers():
+    """Returns (By, expected_conditions, WebDriverWait) for the scraping code."""
+    # selenium は読み込みが重いので、起動時ではなく使うときにインポートする
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    return By, expected_conditions, WebDriverWait
+
+
+@contextmanager
+def acquire_slot(name):
+    """
+    Blocks until one of the BROKER_MAX_CONTEXTS slots is free, across threads and processes.
+    A thread that already holds a slot (e.g. a scheduler job that took it before opening browser_context)
+    gets the same one again instead of waiting for a second.
+    """
+    if getattr(_held, "slot", None) is not None:
+        yield _held.slot
+        return
+    os.makedirs(BROKER_DIR, exist_ok=True)
+    waited = False
+    while True:
+        for i in range(BROKER_MAX_CONTEXTS):
+            with _file_lock(f"{BROKER_DIR}/slot-{i}.lock", blocking=False) as locked:
+                if locked:
+                    print(f"🔒 browser: {name} acquired slot {i}")
+                    _held.slot = i
+                    try:
+                        yield i
+                    finally:
+                        _held.slot = None
+                    return
+        if not waited:
+            print(f"⏳ browser: {name} waiting for a free slot")
+            waited = True
+        time.sleep(1)
+
+
+def _debugger_version(port=BROKER_PORT):
+    import requests
+
+    try:
+        response = requests.get(f"http://127.0.0.1:{port}/json/version", timeout=1)
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def ensure_browser(timeout=30, port=BROKER_PORT, directory=BROKER_DIR):
+    """
+    Starts the shared Chromium unless it is already listening on `port`. Returns its pid, or None
+    when a browser this function did not start is already listening there.
+    """
+    os.makedirs(directory, exist_ok=True)
+    pid_file = f"{directory}/chromium.pid"
+    with _file_lock(f"{directory}/launch.lock"):
+        if _debugger_version(port):
+            if not os.path.exists(pid_file):
+                return None
+            with open(pid_file) as f:
+                return int(f.read())
+
+        print("🔧 browser: launching shared Chromium")
+        process = subprocess.Popen(
+            [
+                CHROMIUM_PATH,
+                f"--remote-debugging-port={port}",
+                f"--user-data-dir={directory}/profile",
+                *CHROMIUM_ARGS,
+                "about:blank",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # 起動したプロセスが終了しても Chromium は残す
+            start_new_session=True,
+        )
+        with open(pid_file, "w") as f:
+            f.write(str(process.pid))
+
+        deadline = time.monotonic() + timeout
+        while not _debugger_version(port):
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"shared Chromium did not start (exit code {process.poll()})")
+            time.sleep(0.2)
+        print(f"✅ browser: shared Chromium listening on port {port} (pid {process.pid})")
+        return process.pid
+
+
+def _load_cookies(driver, name):
+    path = f"selenium/{name}/cookies.json"
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        cookies = json.load(f)
+    params = [{k: c[k] for k in COOKIE_PARAM_KEYS if k in c and not (k == "expires" and c.get("session"))} for c in cookies]
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+    print(f"🍪 browser: restored {len(params)} cookies for {name}")
+
+
+def _save_cookies(driver, name):
+    os.makedirs(f"selenium/{name}", exist_ok=True)
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+    with open(f"selenium/{name}/cookies.json", "w", encoding="utf-8") as f:
+        json.dump(cookies, f)
+
+
+def standalone_driver(name, userdata_dir=None):
+    """Launches a dedicated Chromium with its own profile, as the integrations did before the broker."""
+    # selenium は読み込みが重いので、ドライバーを作るときにインポートする
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    userdata_dir = userdata_dir or f"selenium/{name}"
+    os.makedirs(userdata_dir, exist_ok=True)
+
+    options = Options()
+    options.binary_location = CHROMIUM_PATH
+    options.add_argument("--user-data-dir=" + userdata_dir)
+    for arg in CHROMIUM_ARGS:
+        options.add_argument(arg)
+    options.add_experimental_option("useAutomationExtension", False)
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    driver = webdriver.Chrome(options=options)
+    driver.execute_script(HIDE_WEBDRIVER_SCRIPT)
+    driver.execute_cdp_cmd("Network.enable", {})
+    return driver
+
+
+def _attach_context(name, port=BROKER_PORT, cookies=True):
+    """Attaches a WebDriver session to the shared Chromium and opens a tab in a fresh browser context."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_experimental_option("debuggerAddress", f"127.0.0.1:{port}")
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    driver = webdriver.Chrome(options=options)
+
+    context_id = driver.execute_cdp_cmd("Target.createBrowserContext", {"disposeOnDetach": False})["browserContextId"]
+    target_id = driver.execute_cdp_cmd("Target.createTarget", {"url": "about:blank", "browserContextId": context_id})[
+        "targetId"
+    ]
+    deadline = time.monotonic() + 10
+    while target_id not in driver.window_handles:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"tab {target_id} for {name} did not appear")
+        time.sleep(0.1)
+    driver.switch_to.window(target_id)
+
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": HIDE_WEBDRIVER_SCRIPT})
+    driver.execute_cdp_cmd("Network.enable", {})
+    if cookies:
+        _load_cookies(driver, name)
+    return driver, context_id, target_id
+
+
+def apply_request_blocking(driver, name):
+    """
+    Installs the BLOCK_POLICIES entry for `name` with Network.setBlockedURLs.
+    Chromium versions without `urlPatterns` only understand `urls`, so there the allow list is not applied.
+    """
+    policy = BLOCK_POLICIES.get(name)
+    if not BLOCKING_ENABLED or not policy:
+        return
+    driver.execute_cdp_cmd(
+        "Network.setBlockedURLs",
+        {
+            "urls": policy["deny"],
+            "urlPatterns": [
+                *({"urlPattern": p, "block": False} for p in policy["allow"]),
+                *({"urlPattern": p, "block": True} for p in policy["deny"]),
+            ],
+        },
+    )
+    print(f"🚫 browser: blocking {len(policy['deny'])} URL patterns for {name}")
+
+
+def _load_resource_sizes():
+    if not os.path.exists(RESOURCE_SIZES_FILE):
+        return {}
+    with open(RESOURCE_SIZES_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _resource_key(url):
+    # クエリはリクエストごとに変わることが多く、キーに含めるとファイルが際限なく大きくなる
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def _record_resource_sizes(loaded, blocked):
+    """
+    Records the sizes of the `loaded` resources ({url: bytes}) and returns the estimated size of each
+    `blocked` URL. RESOURCE_SIZES_FILE keeps the RESOURCE_SIZES_MAX most recently used URLs and is only
+    rewritten when a size changed; it is read again just before, to keep what other processes wrote.
+    """
+    global _resource_sizes
+    with _resource_sizes_lock:
+        if _resource_sizes is None:
+            _resource_sizes = _load_resource_sizes()
+        changes = {}
+        for url, size in loaded.items():
+            key = _resource_key(url)
+            if _resource_sizes.get(key) != size:
+                changes[key] = size
+        blocked_keys = [_resource_key(url) for url in blocked]
+        estimates = [_resource_sizes.get(key, 0) for key in blocked_keys]
+        used = [key for key in [*blocked_keys, *(_resource_key(url) for url in loaded)] if key in _resource_sizes]
+        if changes:
+            sizes = _load_resource_sizes()
+            sizes.update((key, sizes.pop(key)) for key in used if key in sizes)
+            for key, size in changes.items():
+                sizes.pop(key, None)
+                sizes[key] = size
+            for key in list(sizes)[: max(0, len(sizes) - RESOURCE_SIZES_MAX)]:
+                del sizes[key]
+            os.makedirs(os.path.dirname(RESOURCE_SIZES_FILE), exist_ok=True)
+            tmp_path = f"{RESOURCE_SIZES_FILE}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sizes, f)
+            os.replace(tmp_path, RESOURCE_SIZES_FILE)
+            _resource_sizes = sizes
+        else:
+            # 書き込まなくても、使った順はメモリ上で保っておく
+            _resource_sizes.update((key, _resource_sizes.pop(key)) for key in used)
+        return estimates
+
+
+def read_network_events(driver):
+    """Drains the performance log and returns the CDP messages recorded since the previous call."""
+    return [json.loads(entry["message"])["message"] for entry in driver.get_log("performance")]
+
+
+def page_stats(driver, events):
+    """
+    Summarizes the network activity in `events` (see read_network_events()).
+    Blocked requests never download anything, so their size is estimated from the last load that
+    fetched the same URL, ignoring the query (e.g. a run with BROWSER_BLOCKING=0).
+    """
+    urls = {}
+    loaded_sizes = {}
+    blocked_urls = []
+    for message in events:
+        params = message.get("params", {})
+        if message["method"] == "Network.requestWillBeSent":
+            urls[params["requestId"]] = params["request"]["url"]
+        elif message["method"] == "Network.loadingFinished":
+            loaded_sizes[params["requestId"]] = params.get("encodedDataLength", 0)
+        elif message["method"] == "Network.loadingFailed" and params.get("blockedReason"):
+            blocked_urls.append(urls.get(params["requestId"]))
+
+    blocked_sizes = _record_resource_sizes(
+        {urls[request_id]: size for request_id, size in loaded_sizes.items() if request_id in urls},
+        [url for url in blocked_urls if url],
+    )
+
+    timing = driver.execute_script(
+        "const n = performance.getEntriesByType('navigation')[0]; return n ? n.loadEventEnd - n.startTime : null;"
+    )
+    return {
+        "loaded_requests": len(loaded_sizes),
+        "loaded_bytes": sum(loaded_sizes.values()),
+        "blocked_requests": len(blocked_urls),
+        "blocked_bytes_estimate": sum(blocked_sizes),
+        "load_ms": timing,
+    }
+
+
+def report_page(driver, label):
+    """
+    Prints page_stats() for the page that was just scraped.
+    With SCRAPE_CAPTURE_DIR set, the responses behind the page are also recorded for scrape_replay.py.
+    """
+    try:
+        events = read_network_events(driver)
+        if scrape_replay.CAPTURE_DIR:
+            scrape_replay.capture_page(driver, label, events)
+        stats = page_stats(driver, events)
+    except Exception as e:
+        print(f"⚠️ browser: failed to collect page stats for {label}: {e}")
+        return None
+    load_ms = f"{stats['load_ms']:.0f} ms" if stats["load_ms"] is not None else "n/a"
+    print(
+        f"📊 browser: {label}: loaded {stats['loaded_requests']} requests ({stats['loaded_bytes'] / 1024:.1f} KiB), "
+        f"blocked {stats['blocked_requests']} requests (~{stats['blocked_bytes_estimate'] / 1024:.1f} KiB), load {load_ms}"
+    )
+    return stats
+
+
+@contextmanager
+def count_commands(driver):
+    """Counts the WebDriver commands `driver` sends while the block runs, by command name."""
+    counts = Counter()
+    execute = driver.execute
+
+    def counting_execute(driver_command, params=None):
+        counts[driver_command] += 1
+        return execute(driver_command, params)
+
+    driver.execute = counting_execute
+    try:
+        yield counts
+    finally:
+        del driver.execute
+
+
+def _detach_context(driver, name, context_id, target_id, cookies=True):
+    try:
+        if cookies:
+            _save_cookies(driver, name)
+    except Exception as e:
+        print(f"⚠️ browser: failed to save cookies for {name}: {e}")
+    try:
+        driver.execute_cdp_cmd("Target.closeTarget", {"targetId": target_id})
+        driver.switch_to.window(driver.window_handles[0])
+        driver.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": context_id})
+    except Exception as e:
+        print(f"⚠️ browser: failed to dispose context for {name}: {e}")
+    # debuggerAddress で接続したセッションの quit() はブラウザを終了しない
+    driver.quit()
+
+
+@contextmanager
+def browser_context(name):
+    """
+    Yields a WebDriver for the integration `name` running in an isolated context of the shared Chromium.
+    Cookies are kept per integration in selenium/<name>/cookies.json, and at most BROKER_MAX_CONTEXTS
+    contexts are open at once across all processes. Set BROWSER_BROKER=0 to fall back to a dedicated browser.
+    Requests matching BLOCK_POLICIES[name] are blocked unless BROWSER_BLOCKING=0.
+    """
+    with acquire_slot(name):
+        if not BROKER_ENABLED:
+            driver = standalone_driver(name)
+            apply_request_blocking(driver, name)
+            try:
+                yield driver
+            finally:
+                driver.quit()
+            return
+
+        ensure_browser()
+        driver, context_id, target_id = _attach_context(name)
+        apply_request_blocking(driver, name)
+        print(f"🟢 browser: opened context for {name}")
+        try:
+            yield driver
+        finally:
+            _detach_context(driver, name, context_id, target_id)
+            print(f"🔴 browser: closed context for {name}")
+
+
+def _tree_rss(pid):
+    import psutil
+
+    process = psutil.Process(pid)
+    total = 0
+    for p in [process, *process.children(recursive=True)]:
+        try:
+            total += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(names=("utol", "mf")):
+    """
+    Compares dedicated browsers per integration against contexts in a shared Chromium. Both run on
+    throwaway profiles, and the shared one on its own port, so the live broker and cookies are untouched.
+    """
+    mib = 1024 * 1024
+
+    with tempfile.TemporaryDirectory(prefix="browser-measure-") as directory:
+        start = time.perf_counter()
+        drivers = [standalone_driver(f"measure-{name}", f"{directory}/{name}") for name in names]
+        cold_start = (time.perf_counter() - start) / len(names)
+        standalone_rss = sum(_tree_rss(d.service.process.pid) for d in drivers)
+        for d in drivers:
+            d.quit()
+
+        port = _free_port()
+        broker_pid = ensure_browser(port=port, directory=f"{directory}/broker")
+        if broker_pid is None:
+            print(f"⚠️ browser: another browser took port {port}, not measuring the shared one")
+            return
+        try:
+            start = time.perf_counter()
+            contexts = [_attach_context(f"measure-{name}", port, cookies=False) for name in names]
+            warm_start = (time.perf_counter() - start) / len(names)
+            broker_rss = _tree_rss(broker_pid) + sum(_tree_rss(driver.service.process.pid) for driver, _, _ in contexts)
+            for driver, context_id, target_id in contexts:
+                _detach_context(driver, "measure", context_id, target_id, cookies=False)
+        finally:
+            import psutil
+
+            # プロファイルを消す前に、計測用の Chromium が終わるのを待つ
+            os.kill(broker_pid, signal.SIGTERM)
+            try:
+                psutil.Process(broker_pid).wait(timeout=10)
+            except (psutil.NoSuchProcess, psutil.TimeoutExpired):
+                pass
+
+    print(f"📊 browser: {len(names)} dedicated browsers: {standalone_rss / mib:.1f} MiB RSS, {cold_start:.2f} s per start")
+    print(
+        f"📊 browser: shared browser with {len(names)} contexts: {broker_rss / mib:.1f} MiB RSS, {warm_start:.2f} s per context"
+    )
+    print(
+        f"📊 browser: saved {(standalone_rss - broker_rss) / mib:.1f} MiB resident memory, "
+        f"avoided {cold_start - warm_start:.2f} s cold start per job"
+    )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["measure"]:
+        measure()
+    else:
+        print(f"🟢 browser: shared Chromium pid {ensure_browser()}")
@@ -0,0 +1,318 @@
+# blocks.py
+
+import time
+from datetime import datetime  # Import datetime for current date
+
+# Message building for main.py, kept free of Slack clients so it can be benchmarked (see src/hotpath_bench.py)
+
+# Mapping for status codes to human-readable strings and emojis
+STATUS_MAP = {
+    2: "⛔️ Unavailable",
+    1: "⚠️ Limited",
+    0: "✅ Available",
+}
+
+# Mapping for status codes to colors
+STATUS_COLOR_MAP = {
+    2: "#E0BBE4",  # Soft Red/Pink for Unavailable
+    1: "#FFD34F",  # Yellowish-Orange for Limited
+    0: "#A5D6A7",  # Soft Green for Available
+}
+
+MAX_PAVILIONS_DISPLAY = 50  # Limit to display in one message
+MAX_SLOTS_DISPLAY = 15  # Limit number of time slots to display directly as fields
+MAX_SEARCH_RESULTS_DISPLAY = 20
+
+
+def get_status_text(status_code):
+    """Converts status code to human-readable text with emoji."""
+    return STATUS_MAP.get(status_code, f"Unknown Status ({status_code}) ❓")
+
+
+def get_status_color(status_code):
+    """Returns the color hex code for a given status."""
+    return STATUS_COLOR_MAP.get(status_code, "#B0BEC5")  # Light grey for unknown/default
+
+
+def get_expo_ticket_link(pavilion_id, ids_list):
+    """
+    Constructs the specific Expo ticket link.
+    Args:
+        pavilion_id (str): The ID of the pavilion (event_id).
+        ids_list (list): A list of user-specified IDs (e.g., ticket IDs).
+    Returns:
+        str: The constructed URL.
+    """
+    today_date_str = datetime.now().strftime("%Y%m%d")  # Format today's date as YYYYMMDD
+    ids_param = ",".join(ids_list) if ids_list else ""  # Join IDs with comma
+
+    # Base URL components
+    base_url = "https://ticket.expo2025.or.jp/event_time/"
+    params = {
+        "id": ids_param,
+        "event_id": pavilion_id,
+        "screen_id": "108",
+        "lottery": "5",
+        "entrance_date": today_date_str,
+    }
+
+    # Construct query string
+    query_string = "&".join([f"{k}={v}" for k, v in params.items() if v])
+    return f"{base_url}?{query_string}"
+
+
+def change_notifications(changes, watched_codes, data_manager, ids_list):
+    """
+    Returns the attachments to post, one list per changed time slot of a watched pavilion.
+    Args:
+        changes (dict): Detected changes from DataManager.apply_updates.
+        watched_codes (list): Codes of watched pavilions.
+        data_manager (DataManager): Source of pavilion names.
+        ids_list (list): Ticket IDs for the booking link.
+    """
+    notifications = []
+    for code, time_changes in changes.items():
+        if code in watched_codes:
+            pavilion_name = data_manager.get_pavilion_name(code)
+            # Pavilion ID is 'code' in our data
+            current_expo_link = get_expo_ticket_link(pavilion_id=code, ids_list=ids_list)
+
+            for time_slot, (old_status, new_status) in time_changes.items():
+                # Only notify if the status has actually changed meaningfully
+                if old_status != new_status:
+                    new_status_text = get_status_text(new_status)
+
+                    # Determine color based on the new status
+                    attachment_color = get_status_color(new_status)
+
+                    # --- Construct the simple legacy attachment for status change notification ---
+                    notifications.append(
+                        [
+                            {
+                                "color": attachment_color,
+                                "title": f"{new_status_text[0]} {pavilion_name} ({code})",  # Title of the attachment
+                                "fields": [
+                                    {
+                                        "title": "Time Slot",
+                                        "value": f"{time_slot[:2]}:{time_slot[2:]}",
+                                        "short": True,
+                                    },
+                                    {
+                                        "title": "Current Status",  # Only show current status as requested
+                                        "value": new_status_text,
+                                        "short": True,
+                                    },
+                                    {
+                                        "title": "Book URL",  # New field for the booking link
+                                        "value": f"<{current_expo_link}|Link>",
+                                        "short": True,
+                                    },
+                                ],
+                            }
+                        ]
+                    )
+    return notifications
+
+
+def help_blocks():
+    """Returns the blocks for /help_expo."""
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "Hello! I can help you monitor Expo 2025 pavilion availability. Here are my commands: 🤖",
+            },
+        },
+        {"type": "divider"},
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "• `/list_all_expo` : Show a list of all known pavilions and their codes. 📋\n"
+                "• `/search_expo [QUERY]` : Search for pavilions by name (e.g., `/search_expo 日本館`). 🔎\n"
+                "• `/watch_expo [CODE]` : Add a pavilion to your watch list. (e.g., `/watch_expo HOH0`) 👀\n"
+                "• `/unwatch_expo [CODE]` : Remove a pavilion from your watch list. (e.g., `/unwatch_expo HOH0`) 🚫\n"
+                "• `/list_watched_expo` : Show pavilions you are currently watching. 🔔\n"
+                "• `/set_ticket_ids [ID1,ID2,...]` : Set your personal ticket IDs for booking links. (e.g., `/set_ticket_ids 12345,67890`) 🎫\n"  # NEW COMMAND
+                "• `/show_status_expo [CODE]` : Show the current availability status for a specific pavilion. (e.g., `/show_status_expo HOH0`) 📊\n"
+                "I will notify you via Slack when the availability status of a watched pavilion changes! ✨",
+            },
+        },
+    ]
+
+
+def pavilion_list_blocks(pavilions_info):
+    """Returns the blocks for /list_all_expo."""
+    # Sort by name for better readability
+    pavilions_info.sort(key=lambda x: x["name"])
+
+    message_blocks = [
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": "Here are all the pavilions I know: 🏛️"},
+        },
+        {"type": "divider"},
+    ]
+
+    # Concatenate pavilion list into a single markdown block for length
+    pavilion_list_text = ""
+    for i, p in enumerate(pavilions_info):
+        if i >= MAX_PAVILIONS_DISPLAY:
+            pavilion_list_text += f"\n_... and {len(pavilions_info) - i} more. Use `/search_expo` to find specific ones!_"
+            break
+        pavilion_list_text += f"• `{p['code']}`: {p['name']}\n"
+
+    if pavilion_list_text:
+        message_blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": pavilion_list_text}})
+
+    message_blocks.append(
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "\nUse `/watch_expo [CODE]` to start monitoring! 👀",
+            },
+        }
+    )
+    return message_blocks
+
+
+def watched_list_blocks(watched_codes, data_manager):
+    """Returns the blocks for /list_watched_expo."""
+    message_blocks = [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "You are currently watching these pavilions: 🔍",
+            },
+        },
+        {"type": "divider"},
+    ]
+
+    watched_list_text = ""
+    for code in watched_codes:
+        pavilion_name = data_manager.get_pavilion_name(code)
+        watched_list_text += f"• *{pavilion_name}* (`{code}`)\n"
+
+    if watched_list_text:
+        message_blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": watched_list_text}})
+    return message_blocks
+
+
+def status_blocks(pavilion_name, pavilion_url, schedules, current_expo_link):
+    """Returns the blocks for /show_status_expo."""
+    # Sort schedules by time
+    sorted_schedules = sorted(schedules.items())
+
+    # Prepare fields for availability status
+    status_fields = []
+
+    for i, (time_slot, status) in enumerate(sorted_schedules):
+        if i >= MAX_SLOTS_DISPLAY:
+            status_fields.append(
+                {
+                    "type": "mrkdwn",
+                    "text": f"_{len(sorted_schedules) - i} more time slots..._",
+                }
+            )
+            break
+        status_fields.append(
+            {
+                "type": "mrkdwn",
+                "text": f"*Time {time_slot[:2]}:{time_slot[2:]}:* {get_status_text(status)}",
+            }
+        )
+
+    message_blocks = [
+        {
+            "type": "header",  # Header block for the main title
+            "text": {
+                "type": "plain_text",
+                "text": f"📊 Current Availability: {pavilion_name}",
+                "emoji": True,
+            },
+        },
+        {"type": "divider"},
+    ]
+
+    # Add booking link in a section
+    message_blocks.append(
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*Booking Link:* <{current_expo_link}|Click to Book> 🎟️",
+            },
+        }
+    )
+
+    # Add original pavilion URL if different and available (optional, might remove if link above is sufficient)
+    if pavilion_url and pavilion_url != current_expo_link:
+        message_blocks.append(
+            {
+                "type": "context",
+                "elements": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f"Original Pavilion Info: <{pavilion_url}|Link>",
+                    }
+                ],
+            }
+        )
+
+    message_blocks.append({"type": "divider"})
+    message_blocks.append({"type": "section", "fields": status_fields})
+
+    message_blocks.append({"type": "divider"})
+    message_blocks.append(
+        {
+            "type": "context",
+            "elements": [
+                {
+                    "type": "mrkdwn",
+                    "text": "Last updated: <!date^"
+                    + str(int(time.time()))
+                    + "^{date_num} {time_secs}|Fallback Time>",  # Dynamic timestamp
+                }
+            ],
+        }
+    )
+    return message_blocks
+
+
+def search_blocks(query, search_results):
+    """Returns the blocks for /search_expo."""
+    message_blocks = [
+        {
+            "type": "header",  # Header block for search results
+            "text": {
+                "type": "plain_text",
+                "text": f"🔍 Found {len(search_results)} pavilion(s) matching '{query}':",
+                "emoji": True,
+            },
+        },
+        {"type": "divider"},
+    ]
+
+    search_list_text = ""
+    for i, p in enumerate(search_results):
+        if i >= MAX_SEARCH_RESULTS_DISPLAY:
+            search_list_text += f"\n_... and {len(search_results) - i} more results. Please refine your search._ 💡"
+            break
+        search_list_text += f"• `{p['code']}`: {p['name']}\n"
+
+    if search_list_text:
+        message_blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": search_list_text}})
+
+    message_blocks.append(
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "Use `/watch_expo [CODE]` or `/show_status_expo [CODE]` with the code to get more details! ✨",
+            },
+        }
+    )
+    return message_blocks
@@ -1,13 +1,15 @@
 import json
 import logging
+import os
 
 import requests
+from feed_recorder import recorder
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Logging is configured by the entry point (see src/logs.py)
+logger = logging.getLogger("expo.data_fetcher")
 
-# Base URL for the Expo API
-BASE_URL = "https://expo.ebii.net/api"
+# Base URL for the Expo API (src/expo_standin.py serves the same endpoints locally)
+BASE_URL = os.environ.get("EXPO_API_BASE_URL", "https://expo.ebii.net/api")
 
 
 def fetch_data_json():
@@ -19,12 +21,17 @@ def fetch_data_json():
     try:
         response = requests.get(url)
         response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to fetch data.json: {e}")
-        return None
+        body = response.json()
+        recorder.record("data", body)
+        return body
+    # requests raises a JSONDecodeError that is also a RequestException, so check it first
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to decode data.json response: {e}")
+        recorder.record("data", error=response.text)
+        logger.error("Failed to decode data.json response: %s", e)
+        return None
+    except requests.exceptions.RequestException as e:
+        recorder.record("data", error=e)
+        logger.error("Failed to fetch data.json: %s", e)
         return None
 
 
@@ -37,21 +44,28 @@ def fetch_add_json():
     try:
         response = requests.get(url)
         response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to fetch add.json: {e}")
-        return None
+        body = response.json()
+        recorder.record("add", body)
+        return body
+    # requests raises a JSONDecodeError that is also a RequestException, so check it first
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to decode add.json response: {e}")
+        recorder.record("add", error=response.text)
+        logger.error("Failed to decode add.json response: %s", e)
+        return None
+    except requests.exceptions.RequestException as e:
+        recorder.record("add", error=e)
+        # Called every second: keep the format constant so that repeated failures are sampled
+        logger.error("Failed to fetch add.json: %s", e)
         return None
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     # Example usage:
     data = fetch_data_json()
     if data:
-        logging.info(f"Fetched data.json. First pavilion: {data[0]['n']}")
+        logger.info(f"Fetched data.json. First pavilion: {data[0]['n']}")
 
     add_data = fetch_add_json()
     if add_data:
-        logging.info(f"Fetched add.json. Keys: {list(add_data.keys())}")
+        logger.info(f"Fetched add.json. Keys: {list(add_data.keys())}")
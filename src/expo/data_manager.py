@@ -2,8 +2,8 @@
 
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Logging is configured by the entry point (see src/logs.py)
+logger = logging.getLogger("expo.data_manager")
 
 
 class DataManager:
@@ -19,7 +19,7 @@ class DataManager:
         This should be called periodically (e.g., every minute) to ensure consistency.
         """
         if not data_json:
-            logging.warning("No data_json provided for initial load.")
+            logger.warning("No data_json provided for initial load.")
             return
 
         new_pavilion_data = {}
@@ -45,7 +45,7 @@ class DataManager:
 
         self.current_pavilion_data = new_pavilion_data
         self.current_status_only = new_status_only
-        logging.info(f"Successfully loaded initial data for {len(self.current_pavilion_data)} pavilions.")
+        logger.info(f"Successfully loaded initial data for {len(self.current_pavilion_data)} pavilions.")
 
     def apply_updates(self, add_json):
         """
@@ -83,13 +83,13 @@ class DataManager:
                             if code not in detected_changes:
                                 detected_changes[code] = {}
                             detected_changes[code][time_slot] = (old_status, new_status)
-                            logging.debug(f"Status changed for {code} at {time_slot}: {old_status} -> {new_status}")
+                            logger.debug("Status changed for %s at %s: %s -> %s", code, time_slot, old_status, new_status)
                         # else:
                         # If old_status == new_status, it's not a new change, so we do nothing.
                         # This is crucial for preventing duplicate notifications.
             # else:
             # This case is handled by data_manager, just log if needed
-            # logging.debug(f"Received update for unknown pavilion code: {code}")
+            # logger.debug(f"Received update for unknown pavilion code: {code}")
 
         return detected_changes
 
@@ -114,6 +114,7 @@ class DataManager:
 data_manager = DataManager()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     initial_data = [
         {
             "c": "HOH0",
@@ -129,25 +130,25 @@ if __name__ == "__main__":
         },
     ]
     data_manager.load_initial_data(initial_data)
-    logging.info(f"Initial status for HOH0: {data_manager.get_specific_pavilion_status('HOH0')}")
+    logger.info(f"Initial status for HOH0: {data_manager.get_specific_pavilion_status('HOH0')}")
 
     # Simulate an update where status changes (should notify)
     sample_add_data_change = {"HOH0": [{"t": "1040", "s": 1}]}  # Change from 2 to 1
     changes = data_manager.apply_updates(sample_add_data_change)
-    logging.info(f"Detected changes (expected change): {changes}")  # Should show {'HOH0': {'1040': (2, 1)}}
+    logger.info(f"Detected changes (expected change): {changes}")  # Should show {'HOH0': {'1040': (2, 1)}}
 
     # Simulate an update where status is the same (should NOT notify)
     sample_add_data_no_change = {
         "HOH0": [{"t": "1040", "s": 1}]  # Still 1, no actual change
     }
     changes_no_notify = data_manager.apply_updates(sample_add_data_no_change)
-    logging.info(f"Detected changes (expected no change): {changes_no_notify}")  # Should be {}
+    logger.info(f"Detected changes (expected no change): {changes_no_notify}")  # Should be {}
 
     # Simulate an update where status changes again
     sample_add_data_revert_change = {
         "HOH0": [{"t": "1040", "s": 2}]  # Change from 1 to 2
     }
     changes_revert = data_manager.apply_updates(sample_add_data_revert_change)
-    logging.info(f"Detected changes (expected revert): {changes_revert}")  # Should show {'HOH0': {'1040': (1, 2)}}
+    logger.info(f"Detected changes (expected revert): {changes_revert}")  # Should show {'HOH0': {'1040': (1, 2)}}
 
-    logging.info(f"Final status for HOH0: {data_manager.get_specific_pavilion_status('HOH0')}")
+    logger.info(f"Final status for HOH0: {data_manager.get_specific_pavilion_status('HOH0')}")
@@ -1,19 +1,17 @@
 import json
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
 
 import requests
-from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
-from apscheduler.schedulers.blocking import BlockingScheduler
 
-sched = BlockingScheduler(
-    executors={
-        "threadpool": ThreadPoolExecutor(max_workers=1),
-        "processpool": ProcessPoolExecutor(max_workers=1),
-    }
-)
-print("🟢 expo: started")
+# src/ の共通モジュールを読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lifecycle import handle_signals  # noqa: E402
+from logs import setup_logging  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from scheduler import scheduler  # noqa: E402
 
 # --- Configuration ---
 API_URL = "https://ticket.expo2025.or.jp/api/d/schedules/2025/6"
@@ -23,6 +21,8 @@ TARGET_DAYS = ["20"]
 TARGET_TIME = "0700"
 STATE_FILE = Path("previous_state.json")
 
+metrics = Metrics("expo-reserve")
+
 headers = {
     "Cookie": COOKIE,
     "User-Agent": "Mozilla/5.0",
@@ -126,6 +126,9 @@ def main():
 
 
 if __name__ == "__main__":
+    setup_logging("expo-reserve")
+    handle_signals()
+    print("🟢 expo: started")
     try:
         print("🚀 expo: Main execution started")
         main()
@@ -135,12 +138,15 @@ if __name__ == "__main__":
         notify_slack_error(error_msg)
 
 
-@sched.scheduled_job("cron", hour="*", minute="*", second="0", executor="threadpool", misfire_grace_time=60 * 60)
+# 毎分の確認なので、ずらすのは数秒にとどめる
+@scheduler.cron("expo.reserve", metrics, jitter=5, hour="*", minute="*", second="0")
 def scheduled_job():
     print("📅 expo: ----- main started -----")
     main()
     print("✅ expo: ----- main done -----")
 
 
-sched.start()
-print("🟢 expo: initialized")
+if __name__ == "__main__":
+    print("🟢 expo: initialized")
+    metrics.start()
+    scheduler.run()
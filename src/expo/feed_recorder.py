@@ -0,0 +1,256 @@
+# feed_recorder.py
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# Logging is configured by the entry point (see src/logs.py)
+logger = logging.getLogger("expo.feed_recorder")
+
+# Directory for captured data.json/add.json responses; recording is off when empty
+RECORD_DIR = os.environ.get("EXPO_FEED_RECORD_DIR", "")
+# Start a new segment file after this many seconds
+SEGMENT_SECONDS = float(os.environ.get("EXPO_FEED_SEGMENT_SECONDS", 60 * 60))
+# Write a full body instead of a delta every this many records of one kind
+KEYFRAME_EVERY = int(os.environ.get("EXPO_FEED_KEYFRAME_EVERY", 600))
+# Delete the oldest segments once all of them take more than this
+MAX_BYTES = int(float(os.environ.get("EXPO_FEED_MAX_MIB", 1024)) * 2**20)
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def json_delta(old, new):
+    """
+    Returns the change from `old` to `new` at the top level: changed keys of a dict (add.json), or
+    changed items of a list (data.json). Returns None when a full body is smaller or the types differ.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        delta = {"set": {key: value for key, value in new.items() if old.get(key) != value or key not in old}}
+        removed = [key for key in old if key not in new]
+        if removed:
+            delta["del"] = removed
+        changed = len(delta["set"]) + len(removed)
+    elif isinstance(old, list) and isinstance(new, list):
+        delta = {"len": len(new), "set": {str(i): item for i, item in enumerate(new) if i >= len(old) or old[i] != item}}
+        changed = len(delta["set"])
+    else:
+        return None
+    return delta if changed * 2 <= max(len(new), 1) else None
+
+
+def apply_delta(old, delta):
+    """Rebuilds the body that json_delta() was computed for."""
+    if "len" in delta:
+        new = old[: delta["len"]] + [None] * (delta["len"] - len(old))
+        for index, item in delta["set"].items():
+            new[int(index)] = item
+        return new
+    new = {key: value for key, value in old.items() if key not in delta.get("del", ())}
+    new.update(delta["set"])
+    return new
+
+
+class FeedRecorder:
+    """
+    Appends every Expo API response to gzip segments in `directory`, one JSON record per line:
+    {"t": time, "k": "data" | "add"} with "f" (full body), "d" (delta from the previous body of the
+    same kind) or "e" (fetch error). Consecutive add.json bodies are nearly identical, and a data.json
+    body is larger than the gzip window, so deltas are what keeps recording cheap enough to leave on.
+    Each segment starts with full bodies so it can be read on its own.
+
+    record() only queues the response; a background thread computes the delta and writes it, as
+    src/logs.py does for logging, so the 1 s fetch loop never waits on disk.
+    """
+
+    def __init__(self, directory=RECORD_DIR, segment_seconds=SEGMENT_SECONDS, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self._segment_seconds = segment_seconds
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+        self._segment_started_at = 0
+        # kind -> (previous body, records since the last full body)
+        self._previous = {}
+
+    def _rotate(self, now):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{now:.3f}{SEGMENT_SUFFIX}")
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._segment_started_at = now
+        self._previous = {}
+        segments = list_segments(self.directory)
+        sizes = {segment: os.path.getsize(segment) for segment in segments}
+        while len(segments) > 1 and sum(sizes.values()) > self._max_bytes:
+            oldest = segments.pop(0)
+            os.remove(oldest)
+            del sizes[oldest]
+            logger.info("Deleted old feed segment %s", oldest)
+
+    def record(self, kind, body=None, error=None):
+        """Queues one response body, or the error of a failed fetch, for the writer thread."""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="feed-recorder", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        self._queue.put((time.time(), kind, body, error))
+
+    def flush(self, timeout=5):
+        """Blocks until everything queued so far is written, or `timeout` seconds have passed."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            self._write(*item)
+
+    def _write(self, now, kind, body, error):
+        entry = {"t": round(now, 3), "k": kind}
+        try:
+            if self._file is None or now - self._segment_started_at >= self._segment_seconds:
+                self._rotate(now)
+            if error is not None:
+                entry["e"] = str(error)
+            else:
+                previous, count = self._previous.get(kind, (None, KEYFRAME_EVERY))
+                delta = json_delta(previous, body) if count < KEYFRAME_EVERY else None
+                if delta is None:
+                    entry["f"] = body
+                    count = 0
+                else:
+                    entry["d"] = delta
+                self._previous[kind] = (body, count + 1)
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._file.flush()
+        except OSError as e:
+            # Recording must never break fetching
+            logger.error("Failed to record %s: %s", kind, e)
+
+
+def list_segments(directory):
+    """Returns the segment paths in `directory`, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)]
+    return [os.path.join(directory, name) for name in sorted(names, key=lambda name: float(name[: -len(SEGMENT_SUFFIX)]))]
+
+
+def read_records(directory):
+    """Yields (time, kind, body, error) for every recorded response, with deltas applied."""
+    for path in list_segments(directory):
+        previous = {}
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    kind = entry["k"]
+                    if "e" in entry:
+                        yield entry["t"], kind, None, entry["e"]
+                        continue
+                    if "f" in entry:
+                        body = entry["f"]
+                    elif kind in previous:
+                        body = apply_delta(previous[kind], entry["d"])
+                    else:
+                        logger.warning("Delta without a full body in %s, skipping it", path)
+                        continue
+                    previous[kind] = body
+                    yield entry["t"], kind, body, None
+        except (EOFError, json.JSONDecodeError):
+            # The segment being written, or one cut off by a crash
+            logger.warning("Feed segment %s ends early", path)
+
+
+def stream(directory, speed=1.0):
+    """Yields the records of read_records() spaced as they were recorded, `speed` times faster (0: no waiting)."""
+    first_recorded_at = None
+    started_at = time.monotonic()
+    for record in read_records(directory):
+        if first_recorded_at is None:
+            first_recorded_at = record[0]
+        if speed > 0:
+            delay = (record[0] - first_recorded_at) / speed - (time.monotonic() - started_at)
+            if delay > 0:
+                time.sleep(delay)
+        yield record
+
+
+def replay(directory, speed=0, manager=None):
+    """
+    Feeds the captured responses into a DataManager and returns what it detected and how long it took,
+    for profiling and regression checks.
+    """
+    from data_manager import DataManager
+
+    manager = manager or DataManager()
+    report = {"data": 0, "add": 0, "errors": 0, "changes": 0, "load_seconds": 0.0, "apply_seconds": 0.0}
+    for _, kind, body, error in stream(directory, speed):
+        if error is not None:
+            report["errors"] += 1
+            continue
+        report[kind] += 1
+        started_at = time.perf_counter()
+        if kind == "data":
+            manager.load_initial_data(body)
+            report["load_seconds"] += time.perf_counter() - started_at
+        else:
+            changes = manager.apply_updates(body)
+            report["apply_seconds"] += time.perf_counter() - started_at
+            report["changes"] += sum(len(time_changes) for time_changes in changes.values())
+    report["load_seconds"] = round(report["load_seconds"], 4)
+    report["apply_seconds"] = round(report["apply_seconds"], 4)
+    return report
+
+
+def storage(directory):
+    """Returns the size on disk against the size of the same responses as plain JSON."""
+    records = 0
+    raw_bytes = 0
+    first = last = None
+    for recorded_at, _, body, error in read_records(directory):
+        records += 1
+        raw_bytes += len(json.dumps(body if error is None else error, ensure_ascii=False).encode())
+        first = first or recorded_at
+        last = recorded_at
+    stored_bytes = sum(os.path.getsize(segment) for segment in list_segments(directory))
+    span = (last - first) if records > 1 else 0
+    return {
+        "segments": len(list_segments(directory)),
+        "records": records,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "ratio": round(raw_bytes / stored_bytes, 1) if stored_bytes else None,
+        "stored_mib_per_day": round(stored_bytes / span * 86400 / 2**20, 2) if span else None,
+    }
+
+
+# Initialize the recorder (does nothing unless EXPO_FEED_RECORD_DIR is set)
+recorder = FeedRecorder()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) == 3 and sys.argv[1] == "storage":
+        print(json.dumps(storage(sys.argv[2])))
+    elif len(sys.argv) in (3, 4) and sys.argv[1] == "replay":
+        print(json.dumps(replay(sys.argv[2], float(sys.argv[3]) if len(sys.argv) == 4 else 0)))
+    else:
+        print("usage: feed_recorder.py storage DIR | replay DIR [SPEED]")
+        sys.exit(1)
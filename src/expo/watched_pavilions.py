@@ -2,8 +2,8 @@ import json
 import logging
 import os
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Logging is configured by the entry point (see src/logs.py)
+logger = logging.getLogger("expo.watched_pavilions")
 
 # File to store watched pavilions
 WATCHED_FILE = "watched_pavilions.json"
@@ -28,27 +28,27 @@ class WatchedPavilionManager:
                     data = json.load(f)
                     if isinstance(data, list):
                         self.watched_codes = set(data)
-                        logging.info(f"Loaded {len(self.watched_codes)} watched pavilions from {WATCHED_FILE}")
+                        logger.info(f"Loaded {len(self.watched_codes)} watched pavilions from {WATCHED_FILE}")
                     else:
-                        logging.warning(f"Watched pavilions file {WATCHED_FILE} is not a list. Starting with empty set.")
+                        logger.warning(f"Watched pavilions file {WATCHED_FILE} is not a list. Starting with empty set.")
                         self.watched_codes = set()
             except json.JSONDecodeError as e:
-                logging.error(f"Error decoding {WATCHED_FILE}: {e}. Starting with empty set.")
+                logger.error(f"Error decoding {WATCHED_FILE}: {e}. Starting with empty set.")
                 self.watched_codes = set()
             except Exception as e:
-                logging.error(f"An unexpected error occurred loading {WATCHED_FILE}: {e}. Starting with empty set.")
+                logger.error(f"An unexpected error occurred loading {WATCHED_FILE}: {e}. Starting with empty set.")
                 self.watched_codes = set()
         else:
-            logging.info(f"Watched pavilions file {WATCHED_FILE} not found. Starting with empty set.")
+            logger.info(f"Watched pavilions file {WATCHED_FILE} not found. Starting with empty set.")
 
     def _save_watched_pavilions(self):
         """Saves watched pavilions to a JSON file."""
         try:
             with open(WATCHED_FILE, "w", encoding="utf-8") as f:
                 json.dump(list(self.watched_codes), f, indent=4, ensure_ascii=False)
-            logging.info(f"Saved {len(self.watched_codes)} watched pavilions to {WATCHED_FILE}")
+            logger.info(f"Saved {len(self.watched_codes)} watched pavilions to {WATCHED_FILE}")
         except IOError as e:
-            logging.error(f"Error saving {WATCHED_FILE}: {e}")
+            logger.error(f"Error saving {WATCHED_FILE}: {e}")
 
     def _load_user_ticket_ids(self):
         """Loads user-specific ticket IDs from a JSON file."""
@@ -58,27 +58,27 @@ class WatchedPavilionManager:
                     data = json.load(f)
                     if isinstance(data, dict):
                         self.user_ticket_ids = data
-                        logging.info(f"Loaded {len(self.user_ticket_ids)} user ticket ID entries from {USER_TICKET_IDS_FILE}")
+                        logger.info(f"Loaded {len(self.user_ticket_ids)} user ticket ID entries from {USER_TICKET_IDS_FILE}")
                     else:
-                        logging.warning(f"User ticket IDs file {USER_TICKET_IDS_FILE} is not a dict. Starting with empty dict.")
+                        logger.warning(f"User ticket IDs file {USER_TICKET_IDS_FILE} is not a dict. Starting with empty dict.")
                         self.user_ticket_ids = {}
             except json.JSONDecodeError as e:
-                logging.error(f"Error decoding {USER_TICKET_IDS_FILE}: {e}. Starting with empty dict.")
+                logger.error(f"Error decoding {USER_TICKET_IDS_FILE}: {e}. Starting with empty dict.")
                 self.user_ticket_ids = {}
             except Exception as e:
-                logging.error(f"An unexpected error occurred loading {USER_TICKET_IDS_FILE}: {e}. Starting with empty dict.")
+                logger.error(f"An unexpected error occurred loading {USER_TICKET_IDS_FILE}: {e}. Starting with empty dict.")
                 self.user_ticket_ids = {}
         else:
-            logging.info(f"User ticket IDs file {USER_TICKET_IDS_FILE} not found. Starting with empty dict.")
+            logger.info(f"User ticket IDs file {USER_TICKET_IDS_FILE} not found. Starting with empty dict.")
 
     def _save_user_ticket_ids(self):
         """Saves user-specific ticket IDs to a JSON file."""
         try:
             with open(USER_TICKET_IDS_FILE, "w", encoding="utf-8") as f:
                 json.dump(self.user_ticket_ids, f, indent=4, ensure_ascii=False)
-            logging.info(f"Saved {len(self.user_ticket_ids)} user ticket ID entries to {USER_TICKET_IDS_FILE}")
+            logger.info(f"Saved {len(self.user_ticket_ids)} user ticket ID entries to {USER_TICKET_IDS_FILE}")
         except IOError as e:
-            logging.error(f"Error saving {USER_TICKET_IDS_FILE}: {e}")
+            logger.error(f"Error saving {USER_TICKET_IDS_FILE}: {e}")
 
     def add_pavilion(self, code):
         """
@@ -115,7 +115,7 @@ class WatchedPavilionManager:
         """
         self.user_ticket_ids[user_id] = [str(id).strip() for id in ids if str(id).strip()]  # Ensure strings and non-empty
         self._save_user_ticket_ids()
-        logging.info(f"Set ticket IDs for user {user_id}: {self.user_ticket_ids[user_id]}")
+        logger.info(f"Set ticket IDs for user {user_id}: {self.user_ticket_ids[user_id]}")
 
     def get_user_ticket_ids(self, user_id):
         """
@@ -129,32 +129,33 @@ class WatchedPavilionManager:
 watched_pavilion_manager = WatchedPavilionManager()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     # Example usage:
-    logging.info(f"Initial watched list: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"Initial watched list: {watched_pavilion_manager.get_watched_list()}")
 
     watched_pavilion_manager.add_pavilion("HOH0")
     watched_pavilion_manager.add_pavilion("H1HF")
-    logging.info(f"After adding HOH0, H1HF: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"After adding HOH0, H1HF: {watched_pavilion_manager.get_watched_list()}")
 
     watched_pavilion_manager.add_pavilion("HOH0")  # Should return False
-    logging.info(f"After adding HOH0 again: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"After adding HOH0 again: {watched_pavilion_manager.get_watched_list()}")
 
     watched_pavilion_manager.remove_pavilion("H1HF")
-    logging.info(f"After removing H1HF: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"After removing H1HF: {watched_pavilion_manager.get_watched_list()}")
 
     watched_pavilion_manager.remove_pavilion("UNKNOWN_CODE")  # Should return False
-    logging.info(f"After removing UNKNOWN_CODE: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"After removing UNKNOWN_CODE: {watched_pavilion_manager.get_watched_list()}")
 
     watched_pavilion_manager.add_pavilion("TEST1")
     watched_pavilion_manager.add_pavilion("TEST2")
-    logging.info(f"Final watched list: {watched_pavilion_manager.get_watched_list()}")
+    logger.info(f"Final watched list: {watched_pavilion_manager.get_watched_list()}")
 
     # Test user ticket IDs
     user_id = "U1234567890"
     watched_pavilion_manager.set_user_ticket_ids(user_id, ["ID_A", "ID_B"])
-    logging.info(f"Ticket IDs for {user_id}: {watched_pavilion_manager.get_user_ticket_ids(user_id)}")
+    logger.info(f"Ticket IDs for {user_id}: {watched_pavilion_manager.get_user_ticket_ids(user_id)}")
 
     watched_pavilion_manager.set_user_ticket_ids(user_id, ["ID_C"])
-    logging.info(f"Updated Ticket IDs for {user_id}: {watched_pavilion_manager.get_user_ticket_ids(user_id)}")
+    logger.info(f"Updated Ticket IDs for {user_id}: {watched_pavilion_manager.get_user_ticket_ids(user_id)}")
 
-    logging.info(f"Ticket IDs for unknown user: {watched_pavilion_manager.get_user_ticket_ids('UUNKNOWN')}")
+    logger.info(f"Ticket IDs for unknown user: {watched_pavilion_manager.get_user_ticket_ids('UUNKNOWN')}")
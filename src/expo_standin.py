@@ -0,0 +1,356 @@
+import importlib.util
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from logs import setup_logging
+
+# 環境変数から設定を取得
+PAVILIONS = int(os.environ.get("EXPO_STANDIN_PAVILIONS", 200))
+SLOTS = int(os.environ.get("EXPO_STANDIN_SLOTS", 40))
+# 1 秒あたりに状態が変わる枠の数
+CHANGES_PER_SECOND = float(os.environ.get("EXPO_STANDIN_CHANGES_PER_SECOND", 2))
+# 変化のうち、FLAP_SECONDS 以内に元の状態へ戻るものの割合
+FLAP_RATE = float(os.environ.get("EXPO_STANDIN_FLAP_RATE", 0.2))
+FLAP_SECONDS = float(os.environ.get("EXPO_STANDIN_FLAP_SECONDS", 1.5))
+# 1 秒あたりに障害 (503) が始まる確率と、その長さ
+OUTAGE_RATE = float(os.environ.get("EXPO_STANDIN_OUTAGE_RATE", 0.01))
+OUTAGE_SECONDS = float(os.environ.get("EXPO_STANDIN_OUTAGE_SECONDS", 5))
+# add.json はこの秒数以内に変わった枠の現在の状態を返す
+ADD_WINDOW_SECONDS = float(os.environ.get("EXPO_STANDIN_ADD_WINDOW_SECONDS", 10))
+# 負荷試験でウォッチするパビリオンの割合
+WATCHED_FRACTION = float(os.environ.get("EXPO_STANDIN_WATCHED_FRACTION", 0.2))
+SEED = int(os.environ.get("EXPO_STANDIN_SEED", 0))
+TICK_SECONDS = 0.1
+CHANNEL_ID = "CSTANDIN"
+
+
+class FeedGenerator:
+    """
+    Synthetic pavilion availability in the shapes of the Expo API: data.json is the full state and
+    add.json the slots changed in the last ADD_WINDOW_SECONDS. Every change is logged with its time so
+    that notifications can be matched to it.
+    """
+
+    def __init__(
+        self,
+        pavilions=PAVILIONS,
+        slots=SLOTS,
+        changes_per_second=CHANGES_PER_SECOND,
+        flap_rate=FLAP_RATE,
+        outage_rate=OUTAGE_RATE,
+        seed=SEED,
+    ):
+        self._rng = random.Random(seed)
+        self._changes_per_second = changes_per_second
+        self._flap_rate = flap_rate
+        self._outage_rate = outage_rate
+        self._lock = threading.Lock()
+        times = [f"{(540 + 15 * i) // 60 % 24:02d}{(540 + 15 * i) % 60:02d}" for i in range(slots)]
+        self.status = {f"C{i:04d}": {t: self._rng.randrange(3) for t in times} for i in range(pavilions)}
+        self._codes = list(self.status)
+        self._times = times
+        self._due = 0.0
+        self._flaps = []
+        self._recent = deque()
+        # [at, code, time, status]
+        self.changes = []
+        self.outages = []
+        self._outage_until = 0.0
+
+    def _change(self, now, code, slot, status):
+        self.status[code][slot] = status
+        self.changes.append([now, code, slot, status])
+        self._recent.append((now, code, slot))
+
+    def tick(self, now, elapsed):
+        with self._lock:
+            self._due += self._changes_per_second * elapsed
+            while self._due >= 1:
+                self._due -= 1
+                code = self._rng.choice(self._codes)
+                slot = self._rng.choice(self._times)
+                old = self.status[code][slot]
+                self._change(now, code, slot, (old + self._rng.randrange(1, 3)) % 3)
+                if self._rng.random() < self._flap_rate:
+                    self._flaps.append((now + self._rng.uniform(0.1, FLAP_SECONDS), code, slot, old))
+            for flap in [flap for flap in self._flaps if flap[0] <= now]:
+                self._flaps.remove(flap)
+                self._change(now, *flap[1:])
+            while self._recent and self._recent[0][0] < now - ADD_WINDOW_SECONDS:
+                self._recent.popleft()
+            if now >= self._outage_until and self._rng.random() < self._outage_rate * elapsed:
+                self._outage_until = now + OUTAGE_SECONDS
+                self.outages.append([now, self._outage_until])
+
+    def in_outage(self, now):
+        return now < self._outage_until
+
+    def data_json(self):
+        with self._lock:
+            return [
+                {
+                    "c": code,
+                    "n": f"Pavilion {code}",
+                    "u": f"https://www.expo2025.or.jp/pavilions/{code}",
+                    "s": [{"t": t, "s": s} for t, s in schedules.items()],
+                }
+                for code, schedules in self.status.items()
+            ]
+
+    def add_json(self):
+        with self._lock:
+            changed = {}
+            for _, code, slot in self._recent:
+                changed.setdefault(code, set()).add(slot)
+            return {code: [{"t": t, "s": self.status[code][t]} for t in sorted(slots)] for code, slots in changed.items()}
+
+    def run(self):
+        """Advances the feed every TICK_SECONDS, for the life of the process."""
+        last = time.time()
+        while True:
+            time.sleep(TICK_SECONDS)
+            now = time.time()
+            self.tick(now, now - last)
+            last = now
+
+
+class StandinState:
+    def __init__(self, generator):
+        self.generator = generator
+        self.lock = threading.Lock()
+        # [received_at, code, time] per notified slot
+        self.notifications = []
+        self.messages = 0
+        self.requests = {"data": 0, "add": 0, "failed": 0}
+
+
+def _notified_slots(attachments):
+    """Returns (code, time) for each attachment built by expo/blocks.py change_notifications()."""
+    slots = []
+    for attachment in attachments or []:
+        code = attachment.get("title", "").rsplit("(", 1)[-1].rstrip(")")
+        fields = {field["title"]: field["value"] for field in attachment.get("fields", [])}
+        slots.append((code, fields.get("Time Slot", "").replace(":", "")))
+    return slots
+
+
+def _make_handler(state):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            generator = state.generator
+            if self.path == "/standin/stats":
+                with state.lock:
+                    self._reply(
+                        200,
+                        {
+                            "changes": generator.changes,
+                            "outages": generator.outages,
+                            "notifications": state.notifications,
+                            "messages": state.messages,
+                            "requests": state.requests,
+                        },
+                    )
+                return
+            if self.path not in ("/api/data", "/api/add"):
+                self._reply(404, {"error": "not found"})
+                return
+            kind = self.path.rsplit("/", 1)[-1]
+            outage = generator.in_outage(time.time())
+            with state.lock:
+                state.requests[kind] += 1
+                state.requests["failed"] += outage
+            if outage:
+                self._reply(503, {"error": "outage"})
+            else:
+                self._reply(200, generator.data_json() if kind == "data" else generator.add_json())
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(body or "{}")
+            else:
+                params = {key: values[0] for key, values in parse_qs(body).items()}
+            method = self.path.rsplit("/", 1)[-1]
+            if method == "auth.test":
+                self._reply(200, {"ok": True, "user_id": "USTANDIN", "bot_id": "BSTANDIN", "team_id": "TSTANDIN"})
+            elif method == "chat.postMessage":
+                attachments = params.get("attachments")
+                if isinstance(attachments, str):
+                    attachments = json.loads(attachments)
+                now = time.time()
+                with state.lock:
+                    state.messages += 1
+                    state.notifications.extend([now, code, slot] for code, slot in _notified_slots(attachments))
+                self._reply(200, {"ok": True, "channel": params.get("channel"), "ts": f"{now:.6f}"})
+            else:
+                self._reply(200, {"ok": False, "error": "unknown_method"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandinHandler
+
+
+def start_standin(generator, port=0):
+    """Serves the Expo API and the Slack Web API methods the bot uses locally. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(StandinState(generator)))
+    threading.Thread(target=generator.run, daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _summary(latencies):
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return {
+        "median": round(statistics.median(latencies), 3),
+        "p95": round(latencies[int(len(latencies) * 0.95)], 3),
+        "max": round(latencies[-1], 3),
+    }
+
+
+def analyze(stats, watched, started_at):
+    """Matches each notification to the latest change of its slot and counts watched changes never notified."""
+    changes = [change for change in stats["changes"] if change[0] >= started_at]
+    by_slot = {}
+    for at, code, slot, status in changes:
+        by_slot.setdefault((code, slot), []).append(at)
+    latencies = []
+    notified = set()
+    for received_at, code, slot in stats["notifications"]:
+        times = [at for at in by_slot.get((code, slot), []) if at <= received_at]
+        if times:
+            latencies.append(received_at - times[-1])
+            notified.add((code, slot, times[-1]))
+    watched_changes = [(code, slot, at) for at, code, slot, status in changes if code in watched]
+    missed = [change for change in watched_changes if change not in notified]
+    return {
+        "changes": len(changes),
+        "watched_changes": len(watched_changes),
+        "missed_watched_changes": len(missed),
+        "detection_latency_seconds": _summary(latencies),
+        "notifications": len(stats["notifications"]),
+        "messages": stats["messages"],
+        "outages": len([outage for outage in stats["outages"] if outage[1] >= started_at]),
+    }
+
+
+def load(seconds=60):
+    """
+    Runs the monitor threads of expo/main.py against a stand-in in another process, so the
+    stand-in does not share the GIL or CPU time with the monitor, and reports detection latency,
+    CPU per add.json poll and notification volume.
+    """
+    import psutil
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-u", os.path.abspath(__file__), "serve", str(port)])
+    os.environ.update(
+        {
+            "EXPO_API_BASE_URL": f"{base_url}/api",
+            "SLACK_API_BASE_URL": f"{base_url}/slack/api/",
+            "SLACK_BOT_TOKEN": "xoxb-standin",
+            "SLACK_EXPO_NOTIFICATION_CHANNEL_ID": CHANNEL_ID,
+        }
+    )
+    for _ in range(50):
+        try:
+            urllib.request.urlopen(f"{base_url}/standin/stats").close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    # ログは JSON 行にするが、この出力 (print) はそのまま残す
+    setup_logging("expo_standin", capture_print=False)
+    # watched_pavilions.json などはカレントディレクトリに書かれる
+    os.chdir(tempfile.mkdtemp())
+    expo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expo")
+    sys.path.insert(0, expo_dir)
+    spec = importlib.util.spec_from_file_location("expo_main", os.path.join(expo_dir, "main.py"))
+    expo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(expo)
+
+    expo.data_manager.load_initial_data(expo.fetch_data_json())
+    codes = [info["code"] for info in expo.data_manager.get_all_pavilions_info()]
+    watched = set(random.Random(SEED).sample(codes, max(1, round(len(codes) * WATCHED_FRACTION))))
+    for code in watched:
+        expo.watched_pavilion_manager.add_pavilion(code)
+
+    started_at = time.time()
+    threads = {
+        name: threading.Thread(target=target, name=name, daemon=True)
+        for name, target in (("add.json", expo.monitor_add_json), ("data.json", expo.monitor_data_json))
+    }
+    for thread in threads.values():
+        thread.start()
+    print(f"🔁 expo_standin: monitoring {len(codes)} pavilions ({len(watched)} watched) for {seconds:g} s")
+    time.sleep(seconds)
+
+    cpu = {thread.id: thread.user_time + thread.system_time for thread in psutil.Process().threads()}
+    polls = sum(value for name, labels, value in expo.metrics.snapshot()["counters"] if name == "expo_add_json_polls_total")
+    with urllib.request.urlopen(f"{base_url}/standin/stats") as response:
+        stats = json.load(response)
+    server.terminate()
+    server.wait()
+
+    add_cpu = cpu.get(threads["add.json"].native_id, 0.0)
+    report = {
+        "seconds": seconds,
+        "pavilions": len(codes),
+        "slots": SLOTS,
+        "watched": len(watched),
+        "changes_per_second": CHANGES_PER_SECOND,
+        "flap_rate": FLAP_RATE,
+        "outage_rate": OUTAGE_RATE,
+        "polls": polls,
+        "failed_requests": stats["requests"]["failed"],
+        "add_json_cpu_ms_per_poll": round(add_cpu / polls * 1000, 3) if polls else None,
+        "data_json_cpu_ms": round(cpu.get(threads["data.json"].native_id, 0.0) * 1000, 1),
+        **analyze(stats, watched, started_at),
+    }
+    report["notifications_per_minute"] = round(report["notifications"] / seconds * 60, 1)
+    print(json.dumps(report))
+    return report
+
+
+if __name__ == "__main__":
+    if not (sys.argv[1:2] in (["serve"], ["load"]) and len(sys.argv) <= 3):
+        print("usage: expo_standin.py serve [PORT] | load [SECONDS]")
+        sys.exit(1)
+
+    if sys.argv[1] == "serve":
+        server, base_url = start_standin(FeedGenerator(), int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+        print(f"🔁 expo_standin: serving the Expo API at {base_url}/api and the Slack Web API at {base_url}/slack/api/")
+        threading.Event().wait()
+    else:
+        load(float(sys.argv[2]) if len(sys.argv) > 2 else 60)
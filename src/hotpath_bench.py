@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# src/expo のモジュールを読み込めるようにする
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "expo"))
+from blocks import (  # noqa: E402
+    change_notifications,
+    get_expo_ticket_link,
+    pavilion_list_blocks,
+    search_blocks,
+    status_blocks,
+    watched_list_blocks,
+)
+from data_manager import DataManager  # noqa: E402
+from watched_pavilions import WatchedPavilionManager  # noqa: E402
+
+from import_bench import _revision  # noqa: E402
+from logs import setup_logging  # noqa: E402
+
+HISTORY_FILE = "data/bench/hotpath_bench.jsonl"
+# 1 つずつ値を変え、残りは BASELINE のままにする
+BASELINE = {"pavilions": 1000, "slots": 50, "churn": 0.01}
+SWEEPS = {
+    "pavilions": (10, 100, 1000, 10000),
+    "slots": (10, 50, 100, 500),
+    "churn": (0.001, 0.01, 0.1, 0.5),
+}
+# UTOL の更新一覧は 1 ページ数十件なので、パビリオンとは別の件数で測る
+UTOL_BASELINE = {"items": 100, "churn": 0.1}
+UTOL_SWEEPS = {"items": (10, 100, 1000), "churn": (0.01, 0.1, 0.5)}
+# ウォッチするパビリオンの割合
+WATCHED_FRACTION = 0.1
+TICKET_IDS = ["12345", "67890"]
+SEED = 0
+
+
+def _points(baseline, sweeps):
+    points = []
+    for name, values in sweeps.items():
+        for value in values:
+            point = {**baseline, name: value}
+            if point not in points:
+                points.append(point)
+    return points
+
+
+def synthetic_data(pavilions, slots):
+    """Returns a data.json body with `slots` time slots per pavilion, starting at 09:00 a minute apart."""
+    rng = random.Random(SEED)
+    times = [f"{(540 + i) // 60:02d}{(540 + i) % 60:02d}" for i in range(slots)]
+    return [
+        {
+            "c": f"C{i:05d}",
+            "n": f"Pavilion {i}",
+            "u": f"https://example.com/pavilions/{i}",
+            "s": [{"t": t, "s": rng.randrange(3)} for t in times],
+        }
+        for i in range(pavilions)
+    ]
+
+
+def synthetic_add(data_json, churn):
+    """Returns an add.json body that changes the status of `churn` of all time slots."""
+    rng = random.Random(SEED)
+    slots = len(data_json[0]["s"])
+    total = len(data_json) * slots
+    add_json = {}
+    for index in rng.sample(range(total), max(1, round(total * churn))):
+        item = data_json[index // slots]
+        slot = item["s"][index % slots]
+        add_json.setdefault(item["c"], []).append({"t": slot["t"], "s": (slot["s"] + rng.randrange(1, 3)) % 3})
+    return add_json
+
+
+def synthetic_utol_updates(items, churn):
+    """Returns (previous, current) UTOL update lists where `churn` of the current ones are new."""
+    new = max(1, round(items * churn))
+    updates = [
+        {
+            "date": f"2026/10/{i % 28 + 1:02d}",
+            "course": f"Course {i % 20}",
+            "content": ("課題", "お知らせ", "教材", "テスト")[i % 4],
+            "info": f"Update {i}",
+            "link": f"https://utol.ecc.u-tokyo.ac.jp/lms/course?idnumber={i}",
+        }
+        for i in range(items + new)
+    ]
+    return updates[:items], updates[new:]
+
+
+def _measure(runs, function, setup=lambda: None):
+    """Returns the median and minimum seconds of `function(setup())`, timing only the function."""
+    samples = []
+    for _ in range(runs):
+        argument = setup()
+        started_at = time.perf_counter()
+        function(argument)
+        samples.append(time.perf_counter() - started_at)
+    return {"median_seconds": round(statistics.median(samples), 7), "min_seconds": round(min(samples), 7)}
+
+
+def _loaded(data_json):
+    manager = DataManager()
+    manager.load_initial_data(data_json)
+    return manager
+
+
+def expo_cases(pavilions, slots, churn, runs):
+    """Yields (case, result) for the Expo hot paths at one size."""
+    data_json = synthetic_data(pavilions, slots)
+    add_json = synthetic_add(data_json, churn)
+    manager = _loaded(data_json)
+    changes = _loaded(data_json).apply_updates(add_json)
+    codes = [item["c"] for item in data_json]
+    watched = random.Random(SEED).sample(codes, max(1, round(pavilions * WATCHED_FRACTION)))
+
+    yield "load_initial_data", _measure(runs, lambda _: DataManager().load_initial_data(data_json))
+    yield "apply_updates", _measure(runs, lambda loaded: loaded.apply_updates(add_json), lambda: _loaded(data_json))
+    yield "change_notifications", _measure(runs, lambda _: change_notifications(changes, watched, manager, TICKET_IDS))
+    yield "pavilion_list_blocks", _measure(runs, lambda _: pavilion_list_blocks(manager.get_all_pavilions_info()))
+    yield "watched_list_blocks", _measure(runs, lambda _: watched_list_blocks(watched, manager))
+    yield (
+        "status_blocks",
+        _measure(
+            runs,
+            lambda _: status_blocks(
+                manager.get_pavilion_name(codes[0]),
+                manager.get_pavilion_url(codes[0]),
+                manager.get_specific_pavilion_status(codes[0]),
+                get_expo_ticket_link(codes[0], TICKET_IDS),
+            ),
+        ),
+    )
+    yield "search_blocks", _measure(runs, lambda _: search_blocks("Pavilion", manager.get_all_pavilions_info()))
+
+    # watched_pavilions.json などはカレントディレクトリに書かれる
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+
+            def fresh_manager():
+                for name in os.listdir(directory):
+                    os.remove(name)
+                return WatchedPavilionManager()
+
+            def watch_all(watched_manager):
+                for code in watched:
+                    watched_manager.add_pavilion(code)
+                watched_manager.set_user_ticket_ids("U0000000000", TICKET_IDS)
+
+            yield "watched_persistence_save", _measure(runs, watch_all, fresh_manager)
+            yield "watched_persistence_load", _measure(runs, lambda _: WatchedPavilionManager())
+        finally:
+            os.chdir(cwd)
+
+
+def utol_cases(items, churn, runs):
+    """Yields (case, result) for the UTOL update diff at one size."""
+    # UTOL は読み込むとスケジューラーにジョブを登録するだけで、起動はしない
+    import UTOL
+
+    previous, updates = synthetic_utol_updates(items, churn)
+    yield "utol_diff_updates", _measure(runs, lambda _: UTOL.diffUpdates(previous, updates))
+
+
+def _key(result):
+    return json.dumps({key: value for key, value in result.items() if not key.endswith("_seconds")}, sort_keys=True)
+
+
+def _previous():
+    """Returns the median seconds of each case in the last run in HISTORY_FILE, keyed by case and size."""
+    if not os.path.exists(HISTORY_FILE):
+        return None, {}
+    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return None, {}
+    report = json.loads(lines[-1])
+    return report["revision"], {_key(result): result["median_seconds"] for result in report["results"]}
+
+
+def bench(runs=5):
+    """Prints the time of every hot path at every size, compared with the last run, and appends them to HISTORY_FILE."""
+    # ログは本番と同じキュー経由にし、計測対象の INFO は出さない (ログ自体のコストは logs.py bench で測る)
+    setup_logging("hotpath_bench", capture_print=False)
+    logging.getLogger().setLevel(logging.WARNING)
+    previous_revision, previous = _previous()
+    report = {"at": time.time(), "revision": _revision(), "runs": runs, "results": []}
+
+    def record(case, size, result):
+        result = {"case": case, **size, **result}
+        report["results"].append(result)
+        sizes = " ".join(f"{name}={value}" for name, value in size.items())
+        line = f"⏱️ hotpath_bench: {case} {sizes}: {result['median_seconds'] * 1000:.3f} ms"
+        before = previous.get(_key(result))
+        if before:
+            line += f" ({(result['median_seconds'] / before - 1) * 100:+.0f}% vs {previous_revision})"
+        print(line)
+
+    for size in _points(BASELINE, SWEEPS):
+        for case, result in expo_cases(size["pavilions"], size["slots"], size["churn"], runs):
+            record(case, size, result)
+    for size in _points(UTOL_BASELINE, UTOL_SWEEPS):
+        for case, result in utol_cases(size["items"], size["churn"], runs):
+            record(case, size, result)
+
+    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+    with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
+    print(json.dumps(report))
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or sys.argv[1:] and not sys.argv[1].isdigit():
+        print("usage: hotpath_bench.py [RUNS]")
+        sys.exit(1)
+    bench(int(sys.argv[1]) if len(sys.argv) == 2 else 5)
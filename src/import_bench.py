@@ -0,0 +1,122 @@
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 起動時間を測るエントリポイント
+ENTRY_POINTS = {
+    "main": "src/main.py",
+    "UTOL": "src/UTOL.py",
+    "MF": "src/MF.py",
+    "video-backup": "src/video-backup.py",
+    "api": "src/api.py",
+    "expo": "src/expo/main.py",
+}
+HISTORY_FILE = "data/bench/import_bench.jsonl"
+TOP_IMPORTS = 5
+# これより前の行はインタプリタ自体の起動 (site など) なので数えない
+MARKER = "import_bench: start"
+
+# インポートだけを実行し、所要時間とメモリを stdout に返す
+CHILD_TEMPLATE = """
+import resource, sys, time
+sys.path[:0] = {paths!r}
+sys.stderr.write("{marker}\\n")
+started_at = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - started_at
+print({{"seconds": elapsed, "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "modules": len(sys.modules)}})
+"""
+
+
+def startup_imports(path):
+    """
+    Returns the import statements an entry script runs before it does any work: the ones at module level
+    and at module level of if/try blocks, but not those inside functions.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    statements = []
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(ast.unparse(node))
+        elif isinstance(node, ast.If) and not _is_main_guard(node):
+            pending[:0] = node.body + node.orelse
+        elif isinstance(node, ast.Try):
+            pending[:0] = node.body
+    return statements
+
+
+def _is_main_guard(node):
+    return isinstance(node.test, ast.Compare) and ast.unparse(node.test) in ("__name__ == '__main__'", '__name__ == "__main__"')
+
+
+def _parse_importtime(stderr):
+    """Returns [(cumulative_us, name)] for the imports that the entry script itself triggered, largest first."""
+    imports = []
+    for line in stderr.split(MARKER, 1)[-1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # 入れ子のインポートは名前が字下げされている
+        if not name[1:].startswith(" "):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+
+def measure(name, path, runs):
+    """Imports the startup dependencies of one entry point in `runs` fresh interpreters."""
+    imports = startup_imports(path)
+    script = CHILD_TEMPLATE.format(paths=[os.path.dirname(path), "src"], marker=MARKER, imports="\n".join(imports))
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True, check=True)
+        samples.append({**ast.literal_eval(result.stdout.strip().splitlines()[-1]), "imports": result.stderr})
+    top = _parse_importtime(samples[-1]["imports"])[:TOP_IMPORTS]
+    return {
+        "entry_point": name,
+        "import_seconds": round(statistics.median(sample["seconds"] for sample in samples), 4),
+        "cold_import_seconds": round(samples[0]["seconds"], 4),
+        "rss_mib": round(statistics.median(sample["maxrss"] for sample in samples) / 2**20, 1),
+        "modules": samples[-1]["modules"],
+        "top_imports": {module: round(us / 1000, 1) for us, module in top},
+    }
+
+
+def bench(runs=5):
+    """Prints import time and memory of every entry point and appends them to HISTORY_FILE."""
+    report = {"at": time.time(), "revision": _revision(), "entry_points": []}
+    for name, path in ENTRY_POINTS.items():
+        result = measure(name, path, runs)
+        report["entry_points"].append(result)
+        heaviest = ", ".join(f"{module} {ms:g} ms" for module, ms in result["top_imports"].items())
+        print(
+            f"⏱️ import_bench: {name}: {result['import_seconds'] * 1000:.0f} ms, {result['rss_mib']} MiB, "
+            f"{result['modules']} modules (heaviest: {heaviest})"
+        )
+    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+    with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
+    print(json.dumps(report))
+    return report
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or sys.argv[1:] and not sys.argv[1].isdigit():
+        print("usage: import_bench.py [RUNS]")
+        sys.exit(1)
+    bench(int(sys.argv[1]) if len(sys.argv) == 2 else 5)
@@ -0,0 +1,56 @@
+import os
+import signal
+import sys
+import threading
+
+# 環境変数から設定を取得
+# 起動だけして実際の処理 (投稿・更新・アップロード) をしない。main.py measure が使う
+DRY_RUN = os.environ.get("SLACKBOT_DRY_RUN", "0") != "0"
+
+# 終了の要求。main.py の host がシグナルを受けて立て、各コンポーネントの待機が抜ける
+stopping = threading.Event()
+
+_hooks = []
+_lock = threading.Lock()
+
+
+def on_shutdown(hook):
+    """Registers `hook()` to run on a graceful shutdown, e.g. to stop a scheduler and wait for its running jobs."""
+    with _lock:
+        _hooks.append(hook)
+    return hook
+
+
+def shutdown():
+    """
+    Sets `stopping` and runs the registered hooks, newest first, in the calling thread. Each hook may block
+    until the work it owns has stopped. A hook that raises does not keep the others from running.
+    """
+    with _lock:
+        if stopping.is_set():
+            return
+        stopping.set()
+        hooks = list(reversed(_hooks))
+    for hook in hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ lifecycle: shutdown hook {getattr(hook, '__qualname__', hook)} failed: {e!r}")
+
+
+def handle_signals():
+    """
+    Makes SIGTERM and SIGINT run shutdown() and then exit, for a component started as its own process
+    by the main.py supervisor. Call it from `__main__` after setup_logging(). Does nothing outside the
+    main thread, as in the main.py host, which handles the signals for all the components it runs.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def handler(signum, frame):
+        print(f"lifecycle: received {signal.Signals(signum).name}, shutting down")
+        shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
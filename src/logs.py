@@ -0,0 +1,279 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# 環境変数から設定を取得
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# ロガーごとのレベル (例: "expo=INFO,expo.data_manager=DEBUG,UTOL=WARNING")
+LOG_LEVELS = {
+    "apscheduler": "WARNING",
+    **dict(item.split("=") for item in os.environ.get("LOG_LEVELS", "").split(",") if item),
+}
+# 同じメッセージは LOG_SAMPLE_SECONDS ごとに LOG_SAMPLE_BURST 件まで出し、残りは件数だけ残す
+LOG_SAMPLE_BURST = int(os.environ.get("LOG_SAMPLE_BURST", 5))
+LOG_SAMPLE_SECONDS = float(os.environ.get("LOG_SAMPLE_SECONDS", 60))
+QUEUE_SIZE = 10000
+MAX_SAMPLE_KEYS = 10000
+# print() の行頭でレベルを決める
+PRINT_LEVELS = {"⚠️": logging.WARNING, "❌": logging.ERROR}
+
+_lock = threading.Lock()
+_listener = None
+# main.py の host で動かすコンポーネントのファイル (絶対パス) -> コンポーネント名
+_component_files = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, component, logger, message, and suppressed when sampling dropped records."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "component": record.component,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ComponentFilter(logging.Filter):
+    """Sets `component` on records that do not carry one, i.e. all but the print() of a hosted component."""
+
+    def __init__(self, component):
+        super().__init__()
+        self._component = component
+
+    def filter(self, record):
+        if not hasattr(record, "component"):
+            record.component = self._component
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Passes the first `burst` records of each message template per `window` seconds and drops the rest.
+    The first record of the next window carries the number dropped as `suppressed`.
+    """
+
+    def __init__(self, burst=LOG_SAMPLE_BURST, window=LOG_SAMPLE_SECONDS):
+        super().__init__()
+        self._burst = burst
+        self._window = window
+        self._lock = threading.Lock()
+        # (logger, level, template) -> [window_started_at, passed, dropped]
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = record.created
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self._window:
+                if len(self._windows) >= MAX_SAMPLE_KEYS:
+                    self._windows = {k: v for k, v in self._windows.items() if now - v[0] < self._window}
+                self._windows[key] = [now, 1, 0]
+                if state and state[2]:
+                    record.suppressed = state[2]
+                return True
+            if state[1] < self._burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the listener falls QUEUE_SIZE records behind, new records are counted and dropped."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # ハンドラーはこれ 1 つなので、レコードをコピーせずにメッセージだけ確定させる
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.msg += "\n" + logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= QUEUE_SIZE:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+def register_component(name, path):
+    """
+    Makes print() from the code in the file `path`, and from whatever that code calls in any thread,
+    log to the logger `name` with component `name`. Used by the main.py host, where all components
+    share one sys.stdout.
+    """
+    _component_files[os.path.abspath(path)] = name
+
+
+def _printing_component():
+    # スケジューラーやジョブキューのスレッドにはスレッドローカルが引き継がれないので、呼び出し元のファイルで決める
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = _component_files.get(frame.f_code.co_filename)
+        if name is not None:
+            return name
+        frame = frame.f_back
+    return None
+
+
+class PrintToLog:
+    """Stands in for sys.stdout so that print() becomes one log record per line."""
+
+    def __init__(self, logger, stream):
+        self._logger = logger
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text):
+        *lines, self._local.buffer = (getattr(self._local, "buffer", "") + text).split("\n")
+        if not any(lines):
+            return len(text)
+        logger, extra = self._logger, None
+        component = _printing_component() if _component_files else None
+        if component is not None:
+            logger, extra = logging.getLogger(component), {"component": component}
+        for line in lines:
+            if line:
+                level = next((level for prefix, level in PRINT_LEVELS.items() if line.startswith(prefix)), logging.INFO)
+                logger.log(level, line, extra=extra)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _formatter():
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s - %(levelname)s - %(component)s - %(name)s - %(message)s")
+
+
+def apply_levels(levels=LOG_LEVELS):
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+def setup_logging(component, capture_print=True):
+    """
+    Sends all logging (and print(), with `capture_print`) of this process through a queue to a
+    background thread that writes LOG_FORMAT lines to stdout, so the calling thread never waits on
+    I/O. Repeated messages are sampled by SampleFilter. Later calls in the same process, as in the
+    consolidated mode of main.py, only apply LOG_LEVELS; there the prints of each component are
+    logged under its own name through register_component().
+
+    Call it from `__main__` only: capturing print() takes over sys.stdout for the whole process, so
+    a module that sets it up on import would break the output of any tool that imports it.
+    """
+    global _listener
+    with _lock:
+        apply_levels()
+        if _listener is not None:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_formatter())
+        queue_handler = DroppingQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(ComponentFilter(component))
+        queue_handler.addFilter(SampleFilter())
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(LOG_LEVEL.upper())
+        _listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        if capture_print:
+            sys.stdout = PrintToLog(logging.getLogger(component), sys.stdout)
+
+
+def flush_logging():
+    """Writes out every queued record and stops the background thread; later records are dropped."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        atexit.unregister(_listener.stop)
+        _listener.stop()
+        _listener = None
+
+
+def bench(iterations=200_000):
+    """Compares loop throughput with logging disabled, written synchronously, and queued with and without sampling."""
+    # PM2 のログ収集と同じく、パイプの先で読み捨てる
+    sink = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    stream = open(sink.stdin.fileno(), "w", encoding="utf-8", closefd=False)
+    logger = logging.getLogger("bench")
+    logger.propagate = False
+    pavilions = {f"P{i:03d}": {"1000": 0} for i in range(100)}
+
+    def loop():
+        started_at = time.perf_counter()
+        for i in range(iterations):
+            # monitor_add_json の 1 回分に相当する軽い処理
+            code = f"P{i % 100:03d}"
+            pavilions[code]["1000"] = i & 3
+            logger.info("applied update for %s at %s", code, "1000")
+        return iterations / (time.perf_counter() - started_at)
+
+    def queued(sample):
+        handler = DroppingQueueHandler(queue.SimpleQueue())
+        handler.addFilter(ComponentFilter("bench"))
+        if sample:
+            handler.addFilter(SampleFilter())
+        target = logging.StreamHandler(stream)
+        target.setFormatter(JsonFormatter())
+        return handler, QueueListener(handler.queue, target)
+
+    sync_handler = logging.StreamHandler(stream)
+    sync_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    modes = {
+        "disabled": (logging.NullHandler(), None, logging.WARNING),
+        "sync basicConfig-style": (sync_handler, None, logging.INFO),
+        "queued": (*queued(sample=False), logging.INFO),
+        "queued + sampling": (*queued(sample=True), logging.INFO),
+    }
+    report = {}
+    for mode, (handler, listener, level) in modes.items():
+        logger.handlers = [handler]
+        logger.setLevel(level)
+        if listener:
+            listener.start()
+        report[mode] = {"iterations_per_second": round(loop())}
+        if listener:
+            listener.stop()
+        if isinstance(handler, DroppingQueueHandler):
+            report[mode]["dropped"] = handler.dropped
+        print(f"📝 logs: {mode}: {report[mode]['iterations_per_second']:,} iterations/s")
+    stream.close()
+    sink.stdin.close()
+    sink.wait()
+    print(json.dumps(report))
+    return report
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["bench"]:
+        print("usage: logs.py bench")
+        sys.exit(1)
+    bench()
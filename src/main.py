@@ -1,17 +1,293 @@
+import json
+import os
+import runpy
+import signal
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 
+import psutil
 from dotenv import load_dotenv
 
 load_dotenv()
 
-print("main: started")
+from lifecycle import shutdown  # noqa: E402
+from logs import flush_logging, register_component, setup_logging  # noqa: E402
+from metrics import Metrics  # noqa: E402
 
-subprocess.Popen(["python3", "-u", "src/UTOL.py"])
-subprocess.Popen(["python3", "-u", "src/MF.py"])
-subprocess.Popen(["python3", "-u", "src/video-backup.py"])
-subprocess.Popen(["python3", "-u", "src/api.py"])
-# subprocess.Popen(["python3", "-u", "src/expo/main.py"])
+# 環境変数から設定を取得
+COMPONENTS = {
+    "UTOL": "src/UTOL.py",
+    "MF": "src/MF.py",
+    "video-backup": "src/video-backup.py",
+    "api": "src/api.py",
+    # "expo": "src/expo/main.py",
+}
+# processes: コンポーネントごとにプロセスを分ける / consolidated: CONSOLIDATE のものを 1 プロセスにまとめる
+MODE = os.environ.get("SUPERVISOR_MODE", "processes")
+CONSOLIDATE = [name for name in os.environ.get("SUPERVISOR_CONSOLIDATE", ",".join(COMPONENTS)).split(",") if name]
+# always: 常に再起動 / on-failure: 異常終了のときだけ再起動 / never: 再起動しない
+RESTART_POLICY = os.environ.get("SUPERVISOR_RESTART", "always")
+RESTART_BACKOFF_INITIAL = float(os.environ.get("SUPERVISOR_BACKOFF_INITIAL_SECONDS", 1))
+RESTART_BACKOFF_MAX = float(os.environ.get("SUPERVISOR_BACKOFF_MAX_SECONDS", 300))
+# この秒数動き続けたら安定したとみなし、バックオフを最初に戻す
+STABLE_SECONDS = float(os.environ.get("SUPERVISOR_STABLE_SECONDS", 60))
+SAMPLE_SECONDS = float(os.environ.get("SUPERVISOR_SAMPLE_SECONDS", 60))
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("SUPERVISOR_SHUTDOWN_GRACE_SECONDS", 20))
+HOST_NAME = "consolidated"
+# COMPONENTS のパスはリポジトリのルートからの相対パス
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-print("main: initialized")
+metrics = Metrics("main")
 
-input()
+
+class Child:
+    """One supervised process, restarted with exponential backoff according to RESTART_POLICY."""
+
+    def __init__(self, name, command, env=None, cwd=None):
+        self.name = name
+        self.command = command
+        self.env = env
+        self.cwd = cwd
+        self.popen = None
+        self.started_at = 0
+        self.restart_at = 0
+        self.backoff = RESTART_BACKOFF_INITIAL
+        self.finished = False
+        # cpu_percent() は前回の呼び出しからの差分なので、同じ Process を使い回す
+        self._processes = {}
+
+    def start(self):
+        self.popen = subprocess.Popen(self.command, env=self.env, cwd=self.cwd)
+        self.started_at = time.monotonic()
+        self._processes = {}
+        print(f"main: started {self.name} (pid {self.popen.pid})")
+
+    def poll(self, stopping):
+        """Starts the child when its restart is due and handles its exit; returns whether it is still running."""
+        now = time.monotonic()
+        if self.finished:
+            return False
+        if self.popen is None:
+            if not stopping and now >= self.restart_at:
+                self.start()
+            return not stopping
+
+        code = self.popen.poll()
+        if code is None:
+            return True
+        uptime = now - self.started_at
+        self.popen = None
+        print(f"main: {self.name} exited with {code} after {uptime:.0f} s")
+        if stopping or RESTART_POLICY == "never" or (RESTART_POLICY == "on-failure" and code == 0):
+            self.finished = True
+            return False
+
+        if uptime >= STABLE_SECONDS:
+            self.backoff = RESTART_BACKOFF_INITIAL
+        self.restart_at = now + self.backoff
+        print(f"main: restarting {self.name} in {self.backoff:.0f} s")
+        self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        metrics.inc("restarts_total", child=self.name)
+        return True
+
+    def signal(self, signum):
+        if self.popen is not None and self.popen.poll() is None:
+            self.popen.send_signal(signum)
+
+    def kill(self):
+        if self.popen is not None and self.popen.poll() is None:
+            print(f"main: {self.name} did not stop in {SHUTDOWN_GRACE_SECONDS:.0f} s, killing it")
+            self.popen.kill()
+            self.popen.wait()
+
+    def sample(self, python_only=False):
+        """Returns (rss, cpu_percent) of the child and its descendants, e.g. the Chromium it started."""
+        if self.popen is None:
+            return 0, 0.0
+        try:
+            root = psutil.Process(self.popen.pid)
+            tree = [root, *root.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return 0, 0.0
+        rss = 0
+        cpu = 0.0
+        processes = {}
+        for process in tree:
+            process = processes[process.pid] = self._processes.get(process.pid, process)
+            try:
+                if python_only and not process.name().startswith("python"):
+                    continue
+                rss += process.memory_info().rss
+                cpu += process.cpu_percent(None)
+            except psutil.NoSuchProcess:
+                pass
+        self._processes = processes
+        return rss, cpu
+
+
+def build_children(mode=MODE, env=None, cwd=None):
+    """
+    Returns the children to supervise; in consolidated mode one host process runs the CONSOLIDATE components.
+    `env` and `cwd` are passed to every child.
+    """
+    names = list(COMPONENTS)
+    children = []
+    if mode == "consolidated":
+        hosted = [name for name in names if name in CONSOLIDATE]
+        names = [name for name in names if name not in CONSOLIDATE]
+        if hosted:
+            command = [sys.executable, "-u", os.path.abspath(__file__), "host", ",".join(hosted)]
+            children.append(Child(HOST_NAME, command, env, cwd))
+    for name in names:
+        children.append(Child(name, [sys.executable, "-u", os.path.join(ROOT_DIR, COMPONENTS[name])], env, cwd))
+    return children
+
+
+class Supervisor:
+    """Starts the children, restarts them when they exit, forwards SIGTERM/SIGINT and samples their resource use."""
+
+    def __init__(self, children):
+        self.children = children
+        self.stopping = False
+        self._stopping_at = 0
+
+    def stop(self, signum=signal.SIGTERM, frame=None):
+        if not self.stopping:
+            print(f"main: received {signal.Signals(signum).name}, stopping children")
+            self.stopping = True
+            self._stopping_at = time.monotonic()
+        for child in self.children:
+            child.signal(signum)
+
+    def sample(self, python_only=False):
+        """Prints and records RSS and CPU per child; returns the total RSS in bytes."""
+        total = 0
+        for child in self.children:
+            rss, cpu = child.sample(python_only)
+            total += rss
+            metrics.set("child_resident_memory_bytes", rss, child=child.name)
+            metrics.set("child_cpu_percent", cpu, child=child.name)
+            print(f"📊 main: {child.name}: {rss / 2**20:.1f} MiB RSS, {cpu:.1f}% CPU")
+        metrics.set("children_resident_memory_bytes", total)
+        print(f"📊 main: total {total / 2**20:.1f} MiB RSS")
+        return total
+
+    def start(self):
+        for child in self.children:
+            child.start()
+
+    def step(self):
+        """Polls every child once; returns whether any child is still running or waiting to restart."""
+        running = [child.poll(self.stopping) for child in self.children]
+        if self.stopping and time.monotonic() - self._stopping_at > SHUTDOWN_GRACE_SECONDS:
+            for child in self.children:
+                child.kill()
+            return False
+        return any(running)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        metrics.start()
+        self.start()
+        print("main: initialized")
+        sampled_at = time.monotonic()
+        while self.step():
+            if time.monotonic() - sampled_at >= SAMPLE_SECONDS:
+                self.sample()
+                sampled_at = time.monotonic()
+            time.sleep(1)
+        print("main: stopped")
+
+
+def host(names):
+    """
+    Runs several components as `__main__` in threads of this interpreter, so that they share one copy
+    of the interpreter and of the libraries they all import. If one of them stops, the whole host exits
+    and the supervisor restarts it. On SIGTERM or SIGINT it runs lifecycle.shutdown(), which stops the
+    schedulers and the job queue after their running jobs, and writes out the queued logs before exiting.
+    """
+    # 各コンポーネントの print() を 1 つのキューにまとめる
+    setup_logging(HOST_NAME)
+    threads = []
+    for name in names:
+        path = os.path.join(ROOT_DIR, COMPONENTS[name])
+        # print() はそれを呼んだコンポーネントの名前でログに出す
+        register_component(name, path)
+        thread = threading.Thread(
+            target=runpy.run_path,
+            args=(path,),
+            kwargs={"run_name": "__main__"},
+            name=name,
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    print(f"main: hosting {', '.join(names)} in pid {os.getpid()}")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    while not stop.is_set() and all(thread.is_alive() for thread in threads):
+        stop.wait(1)
+
+    if stop.is_set():
+        print("main: stopping the hosted components")
+        code = 0
+    else:
+        stopped = [thread.name for thread in threads if not thread.is_alive()]
+        print(f"main: {', '.join(stopped)} stopped, exiting the host")
+        code = 1
+    # 実行中のジョブを待ってから止める (HTTP サーバーのスレッドは待たずに終わらせる)
+    shutdown()
+    for thread in threads:
+        thread.join(timeout=1)
+    running = [thread.name for thread in threads if thread.is_alive()]
+    if running:
+        print(f"main: {', '.join(running)} did not return, exiting anyway")
+    print("main: host stopped")
+    flush_logging()
+    sys.exit(code)
+
+
+def measure(settle_seconds=60):
+    """
+    Starts the components in both modes and compares the total RSS of their interpreters once they settle.
+    They run in dry-run mode (see lifecycle.DRY_RUN) in a temporary working directory, on free ports, so
+    nothing is posted, refreshed or uploaded and the live data/ and sockets are untouched.
+    """
+    report = {}
+    directory = tempfile.mkdtemp(prefix="main-measure-")
+    env = {**os.environ, "SLACKBOT_DRY_RUN": "1", "BOLT_APP_PORT": "0", "API_PORT": "0"}
+    for mode in ("processes", "consolidated"):
+        supervisor = Supervisor(build_children(mode, env, directory))
+        supervisor.start()
+        deadline = time.monotonic() + settle_seconds
+        while time.monotonic() < deadline and supervisor.step():
+            time.sleep(1)
+        print(f"📊 main: {mode} mode")
+        # Chromium は両モードで同じなので Python のプロセスだけを数える
+        report[mode] = round(supervisor.sample(python_only=True) / 2**20, 1)
+        supervisor.stop()
+        while supervisor.step():
+            time.sleep(1)
+    print(json.dumps({"total_python_rss_mib": report, "saved_mib": round(report["processes"] - report["consolidated"], 1)}))
+
+
+if __name__ == "__main__":
+    print("main: started")
+    if sys.argv[1:2] == ["host"] and len(sys.argv) == 3:
+        host(sys.argv[2].split(","))
+    elif sys.argv[1:3] == ["measure", "--dry-run"] and len(sys.argv) <= 4:
+        measure(float(sys.argv[3]) if len(sys.argv) == 4 else 60)
+    elif sys.argv[1:2] == ["measure"]:
+        # 本番と同じ設定でコンポーネントを起動するので、明示したときだけ動かす
+        print("main: measure starts every component; run it as `measure --dry-run` so that none of them does real work")
+        sys.exit(1)
+    elif len(sys.argv) == 1:
+        Supervisor(build_children()).run()
+    else:
+        print("usage: main.py [host NAMES | measure --dry-run [SECONDS]]")
+        sys.exit(1)
@@ -0,0 +1,290 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# 環境変数から設定を取得
+SOCKET_PATH = os.environ.get("METRICS_SOCKET", "data/metrics.sock")
+PUSH_INTERVAL = float(os.environ.get("METRICS_PUSH_SECONDS", 5))
+# 直近の実行結果をいくつ保持してエラー率を出すか
+RECENT_JOBS = 50
+# この割合を超えて失敗していたら /healthz を 503 にする
+UNHEALTHY_ERROR_RATE = float(os.environ.get("METRICS_UNHEALTHY_ERROR_RATE", 0.5))
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+MAX_DATAGRAM = 1024 * 1024
+
+
+class JobRun:
+    """Handed out by Metrics.job(); call fail() to count the run as an error without raising."""
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self):
+        self.ok = False
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms for one component, pushed to api.py over a Unix datagram socket.
+
+    Recording only updates a dict under a lock. A daemon thread sends the cumulative values every
+    PUSH_INTERVAL seconds, so a lost datagram loses nothing but freshness, and nothing blocks when
+    api.py is not running.
+    """
+
+    def __init__(self, component, path=SOCKET_PATH, interval=PUSH_INTERVAL):
+        self.component = component
+        self._path = path
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_functions = {}
+        self._histograms = {}
+        self._recent = deque(maxlen=RECENT_JOBS)
+        self._last_success = {}
+        self._started_at = time.time()
+        self._thread = None
+
+    def start(self):
+        """Starts the push thread; called on first use, or explicitly to report health before any job has run."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, daemon=True)
+                    self._thread.start()
+
+    def inc(self, name, value=1, **labels):
+        self.start()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.start()
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge_function(self, name, function):
+        """Registers a gauge whose value is read from `function()` at push time instead of on the hot path."""
+        self.start()
+        self._gauge_functions[name] = function
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        self.start()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0}
+            histogram["counts"][bisect_left(histogram["buckets"], value)] += 1
+            histogram["sum"] += value
+
+    @contextmanager
+    def job(self, name):
+        """Records duration, result and last success time of one run of the job `name`."""
+        run = JobRun()
+        started_at = time.monotonic()
+        try:
+            yield run
+        except BaseException:
+            run.fail()
+            raise
+        finally:
+            self.observe("job_duration_seconds", time.monotonic() - started_at, job=name)
+            self.inc("jobs_total", job=name, result="ok" if run.ok else "error")
+            with self._lock:
+                self._recent.append(run.ok)
+                if run.ok:
+                    self._last_success[name] = time.time()
+
+    def track(self, name):
+        """Decorator form of job(); the run counts as an error when the function raises."""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.job(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        gauges = {}
+        for name, function in list(self._gauge_functions.items()):
+            try:
+                gauges[(name, ())] = function()
+            except Exception as e:
+                print(f"⚠️ metrics: gauge {name} failed: {e!r}")
+        with self._lock:
+            gauges.update(self._gauges)
+            return {
+                "component": self.component,
+                "pid": os.getpid(),
+                "started_at": self._started_at,
+                "pushed_at": time.time(),
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in gauges.items()],
+                "histograms": [
+                    [name, dict(labels), {**h, "counts": list(h["counts"])}] for (name, labels), h in self._histograms.items()
+                ],
+                "recent_jobs": len(self._recent),
+                "recent_errors": self._recent.count(False),
+                "last_success": dict(self._last_success),
+            }
+
+    def push(self):
+        data = json.dumps(self.snapshot()).encode("utf-8")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            try:
+                sock.sendto(data, self._path)
+            except OSError:
+                # api.py が動いていなければ捨てる
+                pass
+
+    def _loop(self):
+        while True:
+            time.sleep(self._interval)
+            self.push()
+
+
+def _label_value(value):
+    # テキスト形式ではラベル値の \ と " と改行をエスケープする
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+class MetricsCollector:
+    """Receives snapshots pushed by Metrics and serves them as Prometheus text and health summaries."""
+
+    def __init__(self, path=SOCKET_PATH, interval=PUSH_INTERVAL):
+        self._path = path
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def start(self):
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._path)
+        threading.Thread(target=self._receive, args=(sock,), daemon=True).start()
+        print(f"📈 metrics: collecting on {self._path}")
+
+    def _receive(self, sock):
+        while True:
+            try:
+                snapshot = json.loads(sock.recv(MAX_DATAGRAM))
+            except ValueError as e:
+                print(f"⚠️ metrics: dropped a malformed snapshot: {e!r}")
+                continue
+            with self._lock:
+                self._snapshots[snapshot["component"]] = snapshot
+
+    def _fresh(self, snapshot):
+        return time.time() - snapshot["pushed_at"] < 3 * self._interval
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format, labelled by component."""
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        families = {}
+
+        def add(name, kind, line):
+            families.setdefault(name, (kind, []))[1].append(line)
+
+        for snapshot in snapshots:
+            component = {"component": snapshot["component"]}
+            # Prometheus がターゲットごとに付ける up と重ならない名前にする
+            fresh = int(self._fresh(snapshot))
+            add("slackbot_component_fresh", "gauge", f"{_series('slackbot_component_fresh', component)} {fresh}")
+            add(
+                "process_start_time_seconds",
+                "gauge",
+                f"{_series('process_start_time_seconds', component)} {snapshot['started_at']}",
+            )
+            for job, at in snapshot["last_success"].items():
+                labels = {**component, "job": job}
+                add("last_success_timestamp_seconds", "gauge", f"{_series('last_success_timestamp_seconds', labels)} {at}")
+            for name, labels, value in snapshot["counters"]:
+                add(name, "counter", f"{_series(name, {**component, **labels})} {value}")
+            for name, labels, value in snapshot["gauges"]:
+                add(name, "gauge", f"{_series(name, {**component, **labels})} {value}")
+            for name, labels, histogram in snapshot["histograms"]:
+                labels = {**component, **labels}
+                cumulative = 0
+                for bound, count in zip([*histogram["buckets"], "+Inf"], histogram["counts"]):
+                    cumulative += count
+                    add(name, "histogram", f"{_series(name + '_bucket', {**labels, 'le': bound})} {cumulative}")
+                add(name, "histogram", f"{_series(name + '_sum', labels)} {histogram['sum']}")
+                add(name, "histogram", f"{_series(name + '_count', labels)} {cumulative}")
+
+        lines = []
+        for name, (kind, samples) in sorted(families.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def health(self, component):
+        """Returns (healthy, details) for one component."""
+        with self._lock:
+            snapshot = self._snapshots.get(component)
+        if snapshot is None:
+            return False, {"component": component, "status": "unknown"}
+        error_rate = snapshot["recent_errors"] / snapshot["recent_jobs"] if snapshot["recent_jobs"] else 0.0
+        gauges = {_series(name, labels): value for name, labels, value in snapshot["gauges"]}
+        healthy = self._fresh(snapshot) and error_rate <= UNHEALTHY_ERROR_RATE
+        return healthy, {
+            "component": component,
+            "status": "ok" if healthy else "unhealthy",
+            "pid": snapshot["pid"],
+            "last_push_age_seconds": round(time.time() - snapshot["pushed_at"], 1),
+            "last_success": snapshot["last_success"],
+            "error_rate": round(error_rate, 3),
+            "recent_jobs": snapshot["recent_jobs"],
+            "queue_depth": gauges.get("queue_depth"),
+        }
+
+    def components(self):
+        with self._lock:
+            return sorted(self._snapshots)
+
+
+def bench(iterations=1_000_000):
+    """Prints the cost of the hot-path calls."""
+    metrics = Metrics("bench", path="/nonexistent/metrics.sock", interval=3600)
+    for label, call in [
+        ("inc", lambda: metrics.inc("bench_total")),
+        ("inc with labels", lambda: metrics.inc("bench_total", kind="a")),
+        ("observe", lambda: metrics.observe("bench_seconds", 0.2)),
+    ]:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        print(f"📈 metrics: {label}: {(time.perf_counter() - started_at) / iterations * 1e9:.0f} ns/call")
+    started_at = time.perf_counter()
+    metrics.push()
+    print(f"📈 metrics: push: {(time.perf_counter() - started_at) * 1e6:.0f} µs (off the hot path, every {PUSH_INTERVAL:g} s)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["bench"]:
+        print("usage: metrics.py bench")
+        sys.exit(1)
+    bench()
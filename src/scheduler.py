@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from functools import wraps
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from browser import acquire_slot
+from lifecycle import DRY_RUN, on_shutdown, stopping
+
+# 環境変数から設定を取得
+STATE_DIR = "data/scheduler"
+WORKERS = int(os.environ.get("SCHEDULER_WORKERS", 5))
+# リソースごとの同時実行枠。chromium は browser.py のコンテキスト枠 (BROWSER_MAX_CONTEXTS) をそのまま使う
+RESOURCES = {"chromium": acquire_slot}
+# 毎時 0 分などにジョブが集中しないよう、実行時刻を最大この秒数だけ後ろにずらす
+JITTER_SECONDS = int(os.environ.get("SCHEDULER_JITTER_SECONDS", 30))
+MISFIRE_GRACE_SECONDS = 60 * 60
+WAIT_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class PersistentJobStore(MemoryJobStore):
+    """
+    Keeps jobs in memory like MemoryJobStore, and saves each job's next run time to a file per component
+    in STATE_DIR, named after the job id prefix ("UTOL" for "UTOL.sendTasks").
+
+    Job functions are registered again by code on every start, so only the run times are persisted.
+    When a saved run time is earlier than the one the trigger computes, the job keeps it. A run that was
+    due while the process was down then runs on start if it is still within misfire_grace_time, and is
+    reported as missed otherwise. A component runs in exactly one process, alone or in the main.py host,
+    so no file is ever written by two processes.
+    """
+
+    def __init__(self, directory=STATE_DIR):
+        super().__init__()
+        self._directory = directory
+        self._file_lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self._directory, job_id.split(".")[0] + ".json")
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, job_id, next_run_time):
+        path = self._path(job_id)
+        with self._file_lock:
+            saved = self._read(path)
+            saved[job_id] = next_run_time.isoformat() if next_run_time else None
+            os.makedirs(self._directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=2)
+            os.replace(tmp_path, path)
+
+    def add_job(self, job):
+        with self._file_lock:
+            saved = self._read(self._path(job.id)).get(job.id)
+        if saved and job.next_run_time and datetime.fromisoformat(saved) < job.next_run_time:
+            print(f"📅 scheduler: {job.id} was due at {saved} while the process was down")
+            job.next_run_time = datetime.fromisoformat(saved)
+        super().add_job(job)
+        self._save(job.id, job.next_run_time)
+
+    def update_job(self, job):
+        super().update_job(job)
+        self._save(job.id, job.next_run_time)
+
+
+class Scheduler:
+    """
+    One background scheduler per process for every cron job in it, replacing the BlockingScheduler
+    each component used to build. Components register jobs with cron() at import and call run() last.
+    In the consolidated mode of main.py, the hosted components share the one instance.
+
+    Every job records into its component's Metrics: scheduler_job_duration_seconds,
+    scheduler_resource_wait_seconds, scheduler_jobs_missed_total, and scheduler_jobs_skipped_total
+    (the previous run was still going).
+    """
+
+    def __init__(self):
+        self._scheduler = BackgroundScheduler(
+            jobstores={"default": PersistentJobStore()},
+            executors={"default": ThreadPoolExecutor(max_workers=WORKERS)},
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": MISFIRE_GRACE_SECONDS},
+        )
+        self._scheduler.add_listener(self._on_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def cron(self, job_id, metrics, resource=None, jitter=JITTER_SECONDS, **fields):
+        """
+        Decorator that runs the function on a CronTrigger(**fields), at most `jitter` seconds late.
+        With `resource`, the run waits for one of its RESOURCES slots first and holds it until it ends.
+        """
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper():
+                waiting_since = time.monotonic()
+                with RESOURCES[resource](job_id) if resource else nullcontext():
+                    started_at = time.monotonic()
+                    if resource:
+                        metrics.observe("scheduler_resource_wait_seconds", started_at - waiting_since, WAIT_BUCKETS, job=job_id)
+                    result = "error"
+                    try:
+                        function()
+                        result = "ok"
+                    finally:
+                        duration = time.monotonic() - started_at
+                        metrics.observe("scheduler_job_duration_seconds", duration, job=job_id, result=result)
+
+            self._metrics[job_id] = metrics
+            self._scheduler.add_job(
+                wrapper, CronTrigger(jitter=jitter, **fields), id=job_id, name=job_id, replace_existing=True
+            )
+            return function
+
+        return decorator
+
+    def _on_event(self, event):
+        metrics = self._metrics.get(event.job_id)
+        if metrics is None:
+            return
+        if event.code == EVENT_JOB_MISSED:
+            print(f"⚠️ scheduler: {event.job_id} missed its run at {event.scheduled_run_time}")
+            metrics.inc("scheduler_jobs_missed_total", job=event.job_id)
+        else:
+            print(f"⚠️ scheduler: {event.job_id} skipped, the previous run is still going")
+            metrics.inc("scheduler_jobs_skipped_total", job=event.job_id)
+
+    def start(self):
+        with self._lock:
+            if not self._started:
+                # ドライランではジョブを登録するだけで実行しない
+                self._scheduler.start(paused=DRY_RUN)
+                self._started = True
+                on_shutdown(self.shutdown)
+                for job in self._scheduler.get_jobs():
+                    print(f"📅 scheduler: {job.id} next runs at {job.next_run_time}")
+
+    def shutdown(self):
+        """Stops scheduling new runs and waits for the running ones to finish."""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        print("📅 scheduler: shutting down, waiting for running jobs")
+        self._scheduler.shutdown(wait=True)
+
+    def run(self):
+        """Starts the scheduler and blocks until lifecycle.shutdown() is called."""
+        self.start()
+        stopping.wait()
+
+
+# プロセスに 1 つの共有スケジューラー
+scheduler = Scheduler()
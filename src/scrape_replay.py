@@ -0,0 +1,239 @@
+import base64
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 環境変数から設定を取得
+CAPTURE_DIR = os.environ.get("SCRAPE_CAPTURE_DIR")
+
+# 記録するリソースの種類 (画像やスタイルは browser.BLOCK_POLICIES でブロックされる)
+CAPTURED_TYPES = ["Document", "Script", "XHR", "Fetch"]
+
+# 再生時に差し替える環境変数
+SITE_BASE_URL_ENVS = {
+    "utol.ecc.u-tokyo.ac.jp": "UTOL_BASE_URL",
+    "moneyforward.com": "MF_BASE_URL",
+}
+
+
+def _slug(label):
+    return re.sub(r"[^0-9a-z]+", "-", label.lower()).strip("-")
+
+
+def load_index(capture_dir):
+    """Returns {"responses": {host: {"METHOD /path?query": entry}}, "pages": {label: file}}."""
+    path = f"{capture_dir}/index.json"
+    if not os.path.exists(path):
+        return {"responses": {}, "pages": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(capture_dir, index):
+    with open(f"{capture_dir}/index.json", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+
+def capture_page(driver, label, events):
+    """
+    Records the rendered source of the current page and the responses behind it into CAPTURE_DIR.
+    Only responses from the host of the current page are kept, since that is all the replay server can stand in for.
+    """
+    os.makedirs(f"{CAPTURE_DIR}/bodies", exist_ok=True)
+    os.makedirs(f"{CAPTURE_DIR}/pages", exist_ok=True)
+    index = load_index(CAPTURE_DIR)
+    host = urlsplit(driver.current_url).netloc
+    responses = index["responses"].setdefault(host, {})
+
+    def _key(request):
+        url = urlsplit(request["url"])
+        return f"{request['method']} {url.path}" + (f"?{url.query}" if url.query else "")
+
+    requests_by_id = {}
+    received = {}
+    # requestId -> 転送先がまだ決まっていない、このホストからのリダイレクト
+    leaving = {}
+    for message in events:
+        params = message.get("params", {})
+        if message["method"] == "Network.requestWillBeSent" and params.get("type") in CAPTURED_TYPES:
+            # リダイレクトは同じ requestId で続くので、前の URL への応答として 3xx を記録する
+            redirect = params.get("redirectResponse")
+            previous = requests_by_id.get(params["requestId"])
+            if redirect and previous:
+                location = urlsplit(params["request"]["url"])
+                if urlsplit(previous["url"]).netloc == host:
+                    hop = responses[_key(previous)] = {"status": redirect["status"], "location": location.geturl()}
+                    leaving[params["requestId"]] = hop
+                hop = leaving.get(params["requestId"])
+                if hop and location.netloc == host:
+                    # 他のホスト (ログイン画面など) を経由して戻ってきたら、その手前から直接ここへ転送する
+                    hop["location"] = location._replace(scheme="", netloc="").geturl()
+                    del leaving[params["requestId"]]
+            requests_by_id[params["requestId"]] = params["request"]
+        elif message["method"] == "Network.responseReceived":
+            received[params["requestId"]] = params["response"]
+        elif message["method"] == "Network.loadingFinished" and params["requestId"] in requests_by_id:
+            request = requests_by_id[params["requestId"]]
+            url = urlsplit(request["url"])
+            response = received.get(params["requestId"])
+            if url.netloc != host or not response:
+                continue
+            try:
+                body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+            except Exception as e:
+                print(f"⚠️ scrape_replay: failed to read body of {request['url']}: {e}")
+                continue
+            data = base64.b64decode(body["body"]) if body["base64Encoded"] else body["body"].encode("utf-8")
+
+            body_file = f"bodies/{len(os.listdir(f'{CAPTURE_DIR}/bodies')):05d}"
+            with open(f"{CAPTURE_DIR}/{body_file}", "wb") as f:
+                f.write(data)
+            headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+            responses[_key(request)] = {
+                "status": response["status"],
+                "mime": headers.get("content-type", response.get("mimeType", "application/octet-stream")),
+                "body": body_file,
+            }
+
+    page_file = f"pages/{_slug(label)}.html"
+    with open(f"{CAPTURE_DIR}/{page_file}", "w", encoding="utf-8") as f:
+        f.write(driver.page_source)
+    index["pages"][label] = page_file
+    _save_index(CAPTURE_DIR, index)
+    print(f"💾 scrape_replay: captured {label} ({len(responses)} responses from {host})")
+
+
+def _make_handler(capture_dir, responses):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def _serve(self):
+            length = int(self.headers.get("Content-Length", 0))
+            if length:
+                self.rfile.read(length)
+
+            entry = responses.get(f"{self.command} {self.path}") or responses.get(f"GET {self.path}")
+            if entry is None:
+                self.send_error(404)
+                return
+            if "location" in entry:
+                # 記録したリダイレクトはそのまま返し、同じホストへの転送先は再生サーバーに向ける
+                self.send_response(entry["status"])
+                self.send_header("Location", entry["location"])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with open(f"{capture_dir}/{entry['body']}", "rb") as f:
+                data = f.read()
+            self.send_response(entry["status"])
+            self.send_header("Content-Type", entry["mime"])
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _serve
+        do_POST = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_replay_server(capture_dir, host):
+    """Serves the responses captured from `host` on a free local port. Returns (server, base_url)."""
+    responses = load_index(capture_dir)["responses"].get(host, {})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(capture_dir, responses))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_s": statistics.median(samples),
+        "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_s": samples[0],
+        "max_s": samples[-1],
+    }
+
+
+def _bench_parser(capture_dir, page_file, parser, runs):
+    with open(f"{capture_dir}/{page_file}", "r", encoding="utf-8") as f:
+        html = f.read()
+    start = time.perf_counter()
+    for _ in range(runs):
+        parser(html)
+    elapsed = time.perf_counter() - start
+    return {"runs": runs, "pages_per_s": runs / elapsed, "mib_per_s": len(html.encode("utf-8")) * runs / elapsed / 2**20}
+
+
+def bench(capture_dir, runs=10):
+    """Replays a capture `runs` times through the real scraper code paths and prints a JSON report."""
+    # 再生中の通信を記録し直さない
+    os.environ.pop("SCRAPE_CAPTURE_DIR", None)
+    index = load_index(capture_dir)
+
+    servers = []
+    for host, env in SITE_BASE_URL_ENVS.items():
+        if host in index["responses"]:
+            server, base_url = start_replay_server(capture_dir, host)
+            os.environ[env] = base_url
+            servers.append(server)
+            print(f"🔁 scrape_replay: replaying {host} at {base_url}")
+    os.environ["UTOL_PAGE_SETTLE_SECONDS"] = "0"
+
+    # BASE_URL はインポート時に読まれるので、環境変数を差し替えてからインポートする
+    import MF
+    import UTOL
+    from browser import browser_context
+
+    report = {"capture": capture_dir, "end_to_end": {}, "parsers": {}}
+    scenarios = {
+        "utol_tasks_and_updates": (
+            "utol.ecc.u-tokyo.ac.jp",
+            lambda driver: UTOL.init(driver) and (UTOL.getTaskList(driver), UTOL.getUpdates(driver)),
+        ),
+        "mf_update_all": (
+            "moneyforward.com",
+            lambda driver: MF.init(driver) and MF.update_all(driver),
+        ),
+    }
+    with browser_context("replay") as driver:
+        for name, (host, scenario) in scenarios.items():
+            if host not in index["responses"]:
+                continue
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                scenario(driver)
+                samples.append(time.perf_counter() - start)
+            report["end_to_end"][name] = _summary(samples)
+
+    parsers = {"UTOL task list": UTOL.parseTaskList, "UTOL updates": UTOL.parseUpdates}
+    for label, parser in parsers.items():
+        if label in index["pages"]:
+            report["parsers"][label] = _bench_parser(capture_dir, index["pages"][label], parser, runs * 10)
+
+    for server in servers:
+        server.shutdown()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
+
+
+if __name__ == "__main__":
+    if not (len(sys.argv) == 4 and sys.argv[1] == "serve" or len(sys.argv) in (3, 4) and sys.argv[1] == "bench"):
+        print("usage: scrape_replay.py serve CAPTURE_DIR HOST | bench CAPTURE_DIR [RUNS]")
+        sys.exit(1)
+
+    if sys.argv[1] == "serve":
+        server, base_url = start_replay_server(sys.argv[2], sys.argv[3])
+        print(f"🔁 scrape_replay: replaying {sys.argv[3]} at {base_url}")
+        threading.Event().wait()
+    else:
+        bench(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 10)
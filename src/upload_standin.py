@@ -0,0 +1,206 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 確認用のチャンクは小さくして、少ないデータで何チャンクにも分ける
+CHECK_CHUNK_SIZE = 256 * 1024
+CHECK_FILE_SIZE = 10 * CHECK_CHUNK_SIZE + 12345
+
+
+class Crash(Exception):
+    """Stands in for the process dying in the middle of an upload."""
+
+
+class StandinState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session id -> {"data": bytearray, "total": int or None, "id": video id once complete}
+        self.sessions = {}
+        # path -> bytes, served with Range support like Slack's url_private
+        self.files = {}
+        self.bytes_received = 0
+
+
+def _make_handler(state):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, headers=None, body=b""):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _progress(self, session):
+            # 受信済みがなければ Range を付けない (プロトコルどおり)
+            data = session["data"]
+            return {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+
+        def _finish(self, session):
+            session["id"] = session["id"] or uuid.uuid4().hex[:11]
+            self._reply(200, {"Content-Type": "application/json"}, json.dumps({"id": session["id"]}).encode())
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            total = self.headers.get("X-Upload-Content-Length")
+            session_id = uuid.uuid4().hex
+            with state.lock:
+                state.sessions[session_id] = {"data": bytearray(), "total": int(total) if total else None, "id": None}
+            host = self.headers["Host"]
+            self._reply(200, {"Location": f"http://{host}/upload/session/{session_id}"})
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            session = state.sessions.get(self.path.rsplit("/", 1)[-1])
+            if session is None:
+                self._reply(404)
+                return
+
+            with state.lock:
+                match = re.fullmatch(r"bytes (\*|(\d+)-(\d+))/(\*|\d+)", self.headers.get("Content-Range", "bytes */*"))
+                if match.group(4) != "*":
+                    session["total"] = int(match.group(4))
+                if match.group(1) != "*":
+                    state.bytes_received += len(body)
+                    # 受信済みの位置と合わないチャンクは捨てて、現在の位置を返す
+                    if int(match.group(2)) == len(session["data"]):
+                        session["data"] += body
+                complete = session["total"] is not None and len(session["data"]) == session["total"]
+            if complete:
+                self._finish(session)
+            else:
+                self._reply(308, self._progress(session))
+
+        def do_GET(self):
+            data = state.files.get(self.path)
+            if data is None:
+                self._reply(404)
+                return
+            match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                headers = {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"}
+                self._reply(206, headers, data[start:])
+            else:
+                self._reply(200, {}, data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandinHandler
+
+
+def start_standin(state, port=0):
+    """Serves the resumable-upload protocol (and Slack-style file downloads) locally. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def check():
+    """Interrupts uploads mid-way against the stand-in and checks that they resume without resending data."""
+    os.environ["VIDEO_BACKUP_UPLOAD_CHUNK_SIZE"] = str(CHECK_CHUNK_SIZE)
+    from googleapiclient.http import HttpRequest, MediaFileUpload, build_http
+
+    from video_backup.pipeline import pipelined_transfer
+    from video_backup.resumable import SessionExpired, upload_chunks
+
+    state = StandinState()
+    server, base_url = start_standin(state)
+    data = os.urandom(CHECK_FILE_SIZE)
+    state.files["/files/video.mp4"] = data
+    path = f"{tempfile.mkdtemp()}/video.mp4"
+    with open(path, "wb") as f:
+        f.write(data)
+
+    def make_request(media):
+        return HttpRequest(
+            build_http(),
+            lambda resp, content: json.loads(content),
+            f"{base_url}/upload/youtube/v3/videos?uploadType=resumable&part=snippet,status",
+            method="POST",
+            body=json.dumps({"snippet": {"title": "standin"}}),
+            headers={"content-type": "application/json"},
+            resumable=media,
+        )
+
+    def file_upload(saved, crash_after=None, lose_last_ack=False):
+        def save_session(session):
+            saved["chunks"] = saved.get("chunks", 0) + 1
+            if not (lose_last_ack and saved["chunks"] == crash_after):
+                saved["session"] = session
+            if saved["chunks"] == crash_after:
+                raise Crash()
+
+        return save_session
+
+    def run(name, transfer, lose_last_ack=False):
+        state.bytes_received = 0
+        saved = {}
+        try:
+            transfer(None, file_upload(saved, crash_after=3, lose_last_ack=lose_last_ack))
+            return {"scenario": name, "ok": False, "reason": "did not crash"}
+        except Crash:
+            pass
+        resume_offset = saved["session"]["offset"]
+        response = transfer(saved["session"], file_upload(saved))
+        session = next(s for s in state.sessions.values() if s["id"] == response["id"])
+        # 保存した位置が古くても、サーバーに位置を問い合わせるので再送は起きない
+        return {
+            "scenario": name,
+            "ok": bytes(session["data"]) == data and state.bytes_received == len(data),
+            "resumed_at": resume_offset,
+            "bytes_sent": state.bytes_received,
+            "file_size": len(data),
+        }
+
+    def file_transfer(session, save_session):
+        media = MediaFileUpload(path, mimetype="video/*", chunksize=CHECK_CHUNK_SIZE, resumable=True)
+        return upload_chunks(make_request(media), 0, session, save_session, name="video.mp4")
+
+    def pipe_transfer(session, save_session):
+        url = f"{base_url}/files/video.mp4"
+        return pipelined_transfer(url, "token", make_request, size=len(data), session=session, save_session=save_session)
+
+    report = [
+        run("file upload resumed after a crash", file_transfer),
+        run("file upload resumed with the last ack lost", file_transfer, lose_last_ack=True),
+        run("pipelined transfer resumed after a crash", pipe_transfer),
+        run("pipelined transfer resumed with the last ack lost", pipe_transfer, lose_last_ack=True),
+    ]
+
+    saved = {}
+    try:
+        file_transfer(None, file_upload(saved, crash_after=1))
+    except Crash:
+        pass
+    state.sessions.clear()
+    try:
+        file_transfer(saved["session"], file_upload(saved))
+        report.append({"scenario": "expired session", "ok": False, "reason": "did not raise"})
+    except SessionExpired:
+        report.append({"scenario": "expired session", "ok": saved["session"] is None})
+
+    server.shutdown()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return all(result["ok"] for result in report)
+
+
+if __name__ == "__main__":
+    if not (len(sys.argv) in (2, 3) and sys.argv[1] == "serve" or sys.argv[1:] == ["check"]):
+        print("usage: upload_standin.py serve [PORT] | check")
+        sys.exit(1)
+
+    if sys.argv[1] == "serve":
+        server, base_url = start_standin(StandinState(), int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+        print(f"🔁 upload_standin: serving the resumable upload protocol at {base_url}/upload/youtube/v3/videos")
+        threading.Event().wait()
+    else:
+        sys.exit(0 if check() else 1)
@@ -1,19 +1,26 @@
+import hashlib
 import os
-import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
-import gspread
-import requests
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from oauth2client.service_account import ServiceAccountCredentials
-from slack_bolt import App
+from slack_bolt import App, BoltResponse
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
-print("video-backup: started")
+from lifecycle import DRY_RUN, handle_signals, on_shutdown
+from logs import setup_logging
+from metrics import Metrics
+from video_backup.clients import TokenFileCredentials, discovery_document, timed
+from video_backup.content_index import ContentIndex, DuplicateContent, content_hasher, hash_file
+from video_backup.dedup import SeenStore
+from video_backup.jobs import DONE, DOWNLOADING, FAILED, UPLOADING, JobQueue
+from video_backup.sheet_log import SheetLogWriter
+from video_backup.sheet_mirror import SheetMirror
+from video_backup.transcode import TRANSCODE_ENABLED, prepare_video, report_savings
+from video_backup.watcher import DirectoryWatcher
 
 # 環境変数から設定を取得
 SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
@@ -26,52 +33,74 @@ YOUTUBE_CLIENT_SECRET_FILE = os.environ["YOUTUBE_CLIENT_SECRET_FILE"]
 YOUTUBE_TOKEN_PATH = os.environ["YOUTUBE_TOKEN_PATH"]
 SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 BOT_USER = os.environ["BOT_USER"]
+# 内容のハッシュで重複を判定する (パイプラインでは受信しながら計算し、最後のチャンクを送る前に判定する)
+DEDUP_ENABLED = os.environ.get("VIDEO_BACKUP_DEDUP", "1") != "0"
+# Slack からのダウンロードと YouTube へのアップロードを並行して行う (変換する場合は一度保存する)
+PIPELINE_ENABLED = os.environ.get("VIDEO_BACKUP_PIPELINE", "1") != "0"
+# 1 つのメッセージに含まれる動画を並行して処理する数
+FILE_WORKERS = int(os.environ.get("VIDEO_BACKUP_FILE_WORKERS", 2))
+PROGRESS_UPDATE_INTERVAL = 15
+# このディレクトリに置かれた動画を Slack を介さずにバックアップする
+WATCH_DIR = os.environ.get("VIDEO_BACKUP_WATCH_DIR")
 
 extensions = [".mov", ".MOV", ".mp4", ".MP4"]
 
+metrics = Metrics("video-backup")
+
 # Slack アプリの初期化
 bolt_app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
 
 
-# Google Sheets API の認証
+# Google Sheets API の認証 (ワークシートはプロセス内で使い回す)
+@lru_cache(maxsize=1)
 def get_google_sheet():
-    creds = ServiceAccountCredentials.from_json_keyfile_name(
-        GOOGLE_SERVICE_ACCOUNT_FILE,
-        [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive",
-        ],
-    )
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_ID).sheet1
+    # Google のクライアントは読み込みが重いので、起動時ではなく使うときにインポートする
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    with timed("Opening the Google Sheet"):
+        creds = ServiceAccountCredentials.from_json_keyfile_name(
+            GOOGLE_SERVICE_ACCOUNT_FILE,
+            [
+                "https://spreadsheets.google.com/feeds",
+                "https://www.googleapis.com/auth/drive",
+            ],
+        )
+        client = gspread.authorize(creds)
+        sheet = client.open_by_key(SPREADSHEET_ID).sheet1
     return sheet
 
 
 # YouTube API の認証
+youtube_credentials = TokenFileCredentials(YOUTUBE_TOKEN_PATH, ["https://www.googleapis.com/auth/youtube.upload"])
+
+
 def get_youtube_service():
+    from googleapiclient.discovery import build_from_document
+
     credentials = None
 
-    # Check if the token file exists
-    if os.path.exists(YOUTUBE_TOKEN_PATH):
+    with timed("Building the YouTube service"):
         try:
-            credentials = Credentials.from_authorized_user_file(
-                YOUTUBE_TOKEN_PATH,
-                ["https://www.googleapis.com/auth/youtube.upload"],
-            )
+            credentials = youtube_credentials.get()
         except Exception as e:
             print(f"video-backup: Error loading credentials: {e!r}")
             youtube_auth()
 
-    # If there are no valid credentials available, request authorization
-    if not credentials or not credentials.valid:
-        youtube_auth()
+        # If there are no valid credentials available, request authorization
+        if not credentials or not credentials.valid:
+            youtube_auth()
 
-    # Build the YouTube service
-    youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, credentials=credentials)
+        # 同梱の discovery document から組み立てるので通信しない
+        youtube = build_from_document(
+            discovery_document(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION), credentials=credentials
+        )
     return youtube
 
 
 def youtube_auth():
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     flow = InstalledAppFlow.from_client_secrets_file(
         YOUTUBE_CLIENT_SECRET_FILE,
         ["https://www.googleapis.com/auth/youtube.upload"],
@@ -81,22 +110,14 @@ def youtube_auth():
     raise Exception(f"Credentials are not valid or expired. Please authorize at: {auth_url} ")
 
 
-# ファイル名を定義
-status_file = "data/video-backup/thread_status.pkl"
-
-
-# ステータスを読み込む関数
-def load_status():
-    if os.path.exists(status_file):
-        with open(status_file, "rb") as file:
-            return pickle.load(file)
-    return []
-
-
-# ステータスを保存する関数
-def save_status(status):
-    with open(status_file, "wb") as file:
-        pickle.dump(status, file)
+# 受信済みのイベントを記録する
+seen_events = SeenStore()
+# 重複チェック用のスプレッドシートのコピー
+sheet_mirror = SheetMirror()
+# スプレッドシートへの書き込みをまとめる
+sheet_log = SheetLogWriter(get_google_sheet)
+# 内容のハッシュからアップロード済みの動画を引く
+content_index = ContentIndex()
 
 
 def terminate(message):
@@ -104,6 +125,15 @@ def terminate(message):
     print("---------------- video-backup ended ----------------")
 
 
+# Slack の再送はディスクに触れる前に捨てる
+@bolt_app.middleware
+def skip_slack_retries(req, resp, next):
+    if req.headers.get("x-slack-retry-num") and req.body.get("event", {}).get("ts") in seen_events:
+        print(f"video-backup: Skipped Slack retry #{req.headers['x-slack-retry-num'][0]} of {req.body['event']['ts']}")
+        return BoltResponse(status=200, body="")
+    return next()
+
+
 @bolt_app.event("message")
 def handle_message_events(body, say):
     print("---------------- video-backup started ----------------")
@@ -112,18 +142,11 @@ def handle_message_events(body, say):
     channel_id = event.get("channel")
     thread_ts = event.get("ts")
 
-    # ステータスを読み込む
-    status = load_status()
-
-    # 既に処理済みかどうかを確認
-    if thread_ts in status:
+    # 既に受信済みかどうかを確認し、同時に受信済みにする
+    if not seen_events.add(thread_ts):
         terminate(f"Thread {thread_ts} is already received")
         return
 
-    # 処理中に設定
-    status.append(thread_ts)
-    save_status(status)
-
     try:
         if event.get("subtype") in ["message_deleted", "message_changed"]:
             terminate("Invalid event.subtype")
@@ -141,110 +164,339 @@ def handle_message_events(body, say):
             youtube_auth()
             return
 
-        video_filename = None
-        is_local = False
-        for ext in extensions:
-            if event.get("text", "").split("\n")[0].endswith(ext):
-                video_filename = event.get("text", "").split("\n")[0]
-                is_local = True
-                break
-        if not video_filename:
-            video = find_latest_video(event)
-            if not video:
-                post_message_to_slack(channel_id, thread_ts, "*Video not found*")
-                terminate("Video not found")
-                return
-            if check_if_video_exists(video["name"]):
-                post_message_to_slack(channel_id, thread_ts, "*This video has already been uploaded*")
-                terminate("This video has already been uploaded")
-                return
-            video_filename = download_slack_file(video["url"])
+        # 重い処理はワーカーに任せてすぐに返す
+        if job_queue.enqueue(thread_ts, event):
+            metrics.inc("video_backup_jobs_queued_total", source="slack")
+            terminate(f"Queued job {thread_ts}")
+        else:
+            terminate(f"Job {thread_ts} is already queued")
+    except Exception as e:
+        post_message_to_slack(channel_id, thread_ts, f"*Error*\n```{e!r}```")
+        terminate(f"Error: {e!r}")
 
-        upload_response = upload_video_to_youtube(
-            video_filename,
-            event.get("text", "").split("\n")[0] if event.get("text", "").split("\n")[0] != "" else video_filename,
-            "\n".join(event.get("text", "").split("\n")[1:]),
+
+@metrics.track("backup")
+def process_backup_job(job, update):
+    event = job["payload"]
+    channel_id = event.get("channel")
+    thread_ts = event.get("ts")
+    print(f"video-backup: Started job {thread_ts} (attempt {job['attempts']})")
+
+    if "watch_path" in event:
+        backup_watched_video(job, update)
+        return
+
+    for ext in extensions:
+        if event.get("text", "").split("\n")[0].endswith(ext):
+            backup_local_video(job, update)
+            return
+
+    videos = find_videos(event)
+    if not videos:
+        post_message_to_slack(channel_id, thread_ts, "*Video not found*")
+        update(result="Video not found")
+        return
+
+    # ファイルごとの状態を記録し、再試行では失敗したファイルだけを処理する
+    files = job.get("files", {})
+    files_lock = threading.Lock()
+
+    def set_file(video, **fields):
+        nonlocal files
+        with files_lock:
+            # 保存中の dict を書き換えないように作り直す
+            files = {**files, video["id"]: {**files.get(video["id"], {"name": video["name"]}), **fields}}
+            update(files=files)
+
+    pending = [video for video in videos if files.get(video["id"], {}).get("state") != DONE]
+    update(state=UPLOADING)
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as pool:
+        list(
+            pool.map(
+                lambda video: backup_slack_video(job["id"], event, video, len(videos), set_file, files.get(video["id"], {})),
+                pending,
+            )
         )
 
-        if upload_response.get("id"):
-            video_url = f"https://www.youtube.com/watch?v={upload_response['id']}"
-            post_message_to_slack(channel_id, thread_ts, f"*Successfully uploaded video*\n{video_url}")
-            if is_local:
-                write_data = [
-                    str(datetime.now()),
-                    video_filename,
-                    video_filename,
-                    "\n".join(event.get("text", "").split("\n")[1:]),
-                    video_url,
-                    "succeeded",
-                ]
-            else:
-                write_data = [
-                    str(datetime.now()),
-                    video["name"],
-                    video["url"],
-                    event.get("text", ""),
-                    video_url,
-                    "succeeded",
-                ]
-            os.remove(video_filename)
+    failed = [file["name"] for file in files.values() if file["state"] == FAILED]
+    update(result=f"{len(videos) - len(failed)}/{len(videos)} videos backed up")
+    print(f"video-backup: Finished job {thread_ts} ({len(videos) - len(failed)}/{len(videos)} videos backed up)")
+    if failed:
+        raise Exception(f"Failed to back up {', '.join(failed)}")
+
+
+def backup_slack_video(job_id, event, video, total, set_file, saved):
+    from video_backup.download import download_path, download_slack_file
+
+    channel_id = event.get("channel")
+    thread_ts = event.get("ts")
+    label = f"{video['name']} ({video['index']}/{total})" if total > 1 else video["name"]
+    session = saved.get("upload")
+    # 前回の試行でアップロードまで済んでいれば、送り直さずに残りの処理だけを行う
+    video_id = saved.get("video_id")
+
+    if not video_id and check_if_video_exists(video["name"]):
+        post_message_to_slack(channel_id, thread_ts, f"*This video has already been uploaded*\n{label}")
+        set_file(video, state=DONE, video_url=None)
+        return
+
+    title = event.get("text", "").split("\n")[0]
+    if title == "":
+        title = video["name"]
+    elif total > 1:
+        title = f"{title} ({video['index']}/{total})"
+    description = "\n".join(event.get("text", "").split("\n")[1:])
+
+    progress_ts = post_message_to_slack(channel_id, thread_ts, f"*Uploading video*\n{label}")
+    on_progress = progress_reporter(channel_id, progress_ts, label)
+
+    # アップロードセッションをチャンクごとに保存し、再起動後はその続きから送る
+    def save_session(upload):
+        set_file(video, upload=upload)
+
+    # ダウンロード中に計算した内容のハッシュで重複を判定する
+    digest = {"value": saved["digest"]} if saved.get("digest") else {}
+
+    def check_content(value):
+        digest["value"] = value
+        set_file(video, digest=value)
+        content_index.check(value)
+
+    try:
+        if video_id:
+            upload_response = {"id": video_id}
+        elif PIPELINE_ENABLED and not TRANSCODE_ENABLED:
+            set_file(video, state=UPLOADING)
+            upload_response = transfer_video_to_youtube(
+                video, title, description, on_progress, session, save_session, check_content if DEDUP_ENABLED else None
+            )
+            if upload_response.get("id"):
+                set_file(video, video_id=upload_response["id"])
         else:
-            post_message_to_slack(
-                channel_id,
-                thread_ts,
-                f"*Failed to upload video*\n```{upload_response}```",
+            set_file(video, state=DOWNLOADING)
+            hasher = content_hasher() if DEDUP_ENABLED else None
+            video_filename = download_slack_file(
+                video["url"], SLACK_BOT_TOKEN, download_path(job_id, video["id"], video["name"]), hasher=hasher
             )
-            if is_local:
-                write_data = [
-                    str(datetime.now()),
-                    video_filename,
-                    video_filename,
-                    "\n".join(event.get("text", "").split("\n")[1:]),
-                    video_url,
-                    "failed",
-                ]
-            else:
-                write_data = [
-                    str(datetime.now()),
-                    video["name"],
-                    video["url"],
-                    event.get("text", ""),
-                    video_url,
-                    "failed",
-                ]
-
-        sheet = get_google_sheet()
-        sheet.append_row(write_data)
-        terminate("terminated")
+            try:
+                if hasher:
+                    check_content(hasher.hexdigest())
+            except DuplicateContent:
+                os.remove(video_filename)
+                raise
+            prepared = prepare_video(video_filename)
+            set_file(video, state=UPLOADING)
+            started_at = time.monotonic()
+            try:
+                upload_response = upload_video_to_youtube(
+                    prepared["path"], title, description, on_progress, session, save_session
+                )
+            except Exception:
+                # 変換後のファイルは下で消すので、次の試行はアップロードを最初からやり直す
+                if prepared["path"] != video_filename:
+                    set_file(video, upload=None)
+                raise
+            finally:
+                if prepared["path"] != video_filename:
+                    os.remove(prepared["path"])
+            if upload_response.get("id"):
+                set_file(video, video_id=upload_response["id"])
+            report_savings(prepared, time.monotonic() - started_at)
+            os.remove(video_filename)
+    except DuplicateContent as e:
+        print(f"video-backup: Skipped {video['name']}: {e}")
+        metrics.inc("video_backup_videos_total", source="slack", result="duplicate")
+        update_slack_message(
+            channel_id, progress_ts, f"*This video has already been uploaded*\n{label}\n{e.entry['video_url']}"
+        )
+        # パイプラインでは最後のチャンクの前で中止したセッションが残っている
+        set_file(video, state=DONE, video_url=e.entry["video_url"], error=None, upload=None)
+        return
     except Exception as e:
-        post_message_to_slack(channel_id, thread_ts, f"*Error*\n```{e!r}```")
-        terminate(f"Error: {e!r}")
+        print(f"video-backup: Failed to back up {video['name']}: {e!r}")
+        update_slack_message(channel_id, progress_ts, f"*Error*\n{label}\n```{e!r}```")
+        set_file(video, state=FAILED, error=repr(e))
+        return
 
+    if upload_response.get("id"):
+        video_url = f"https://www.youtube.com/watch?v={upload_response['id']}"
+        update_slack_message(channel_id, progress_ts, f"*Successfully uploaded video*\n{label}\n{video_url}")
+        set_file(video, state=DONE, video_url=video_url, error=None)
+        if "value" in digest:
+            content_index.add(digest["value"], video["name"], video_url, video.get("size"))
+        status = "succeeded"
+    else:
+        video_url = ""
+        update_slack_message(channel_id, progress_ts, f"*Failed to upload video*\n{label}\n```{upload_response}```")
+        set_file(video, state=FAILED, error=str(upload_response))
+        status = "failed"
+
+    metrics.inc("video_backup_videos_total", source="slack", result=status)
+    # スプレッドシートへの書き込みはまとめて後で行う
+    write_data = [str(datetime.now()), video["name"], video["url"], event.get("text", ""), video_url, status]
+    sheet_log.append(write_data)
+    sheet_mirror.record(write_data)
+
+
+def backup_local_video(job, update):
+    event = job["payload"]
+    channel_id = event.get("channel")
+    thread_ts = event.get("ts")
+    video_filename = event.get("text", "").split("\n")[0]
+    description = "\n".join(event.get("text", "").split("\n")[1:])
+
+    upload_response, _ = upload_once(job, update, video_filename, video_filename, description)
+    if upload_response.get("id"):
+        video_url = f"https://www.youtube.com/watch?v={upload_response['id']}"
+        post_message_to_slack(channel_id, thread_ts, f"*Successfully uploaded video*\n{video_url}")
+        status = "succeeded"
+        os.remove(video_filename)
+    else:
+        video_url = ""
+        post_message_to_slack(channel_id, thread_ts, f"*Failed to upload video*\n```{upload_response}```")
+        status = "failed"
+
+    # スプレッドシートへの書き込みはまとめて後で行う
+    write_data = [str(datetime.now()), video_filename, video_filename, description, video_url, status]
+    sheet_log.append(write_data)
+    sheet_mirror.record(write_data)
+    update(result=status)
+    print(f"video-backup: Finished job {thread_ts}")
+
+
+# 監視しているディレクトリのファイルは Slack に投稿せずにアップロードし、済んだものは uploaded/ へ移す
+def backup_watched_video(job, update):
+    path = job["payload"]["watch_path"]
+    name = os.path.basename(path)
+    if not os.path.exists(path):
+        update(result="File no longer exists")
+        return
 
-def find_latest_video(message):
-    for file in message.get("files", []):
-        for ext in extensions:
-            if file["url_private"].endswith(ext):
-                return {"url": file["url_private"], "name": file["name"]}
-    return None
+    digest = hash_file(path)
+    update(digest=digest)
+    entry = content_index.get(digest) if DEDUP_ENABLED else None
+    if entry:
+        print(f"video-backup: Skipped {path}: same content as {entry['name']} ({entry['video_url']})")
+        move_to_uploaded(path)
+        update(result=f"Duplicate of {entry['video_url']}")
+        return
+
+    upload_response, original_size = upload_once(job, update, path, os.path.splitext(name)[0], "")
+    if not upload_response.get("id"):
+        metrics.inc("video_backup_videos_total", source="watch", result="failed")
+        sheet_log.append([str(datetime.now()), name, path, "", "", "failed"])
+        raise Exception(f"Failed to upload {path}: {upload_response}")
+
+    video_url = f"https://www.youtube.com/watch?v={upload_response['id']}"
+    metrics.inc("video_backup_videos_total", source="watch", result="succeeded")
+    content_index.add(digest, name, video_url, original_size)
+    write_data = [str(datetime.now()), name, path, "", video_url, "succeeded"]
+    sheet_log.append(write_data)
+    sheet_mirror.record(write_data)
+    move_to_uploaded(path)
+    update(result=video_url)
+    print(f"video-backup: Uploaded watched file {path}: {video_url}")
+
+
+def upload_once(job, update, source, title, description):
+    """
+    Transcodes `source` if enabled and uploads it, unless an earlier attempt of this job already did.
+    The video id is saved as soon as the upload finishes, so a retry after a later step failed does not
+    upload the video again. Returns (upload_response, original_size).
+    """
+    if job.get("video_id"):
+        return {"id": job["video_id"]}, job.get("original_size")
+
+    prepared = prepare_video(source)
+    update(state=UPLOADING)
+    started_at = time.monotonic()
+    try:
+        upload_response = upload_video_to_youtube(
+            prepared["path"],
+            title,
+            description,
+            session=job.get("upload"),
+            save_session=lambda session: update(upload=session),
+        )
+    except Exception:
+        # 変換後のファイルは下で消すので、次の試行はアップロードを最初からやり直す
+        if prepared["path"] != source:
+            update(upload=None)
+        raise
+    finally:
+        if prepared["path"] != source:
+            os.remove(prepared["path"])
+    if upload_response.get("id"):
+        update(video_id=upload_response["id"], original_size=prepared["original_size"])
+        report_savings(prepared, time.monotonic() - started_at)
+    return upload_response, prepared["original_size"]
+
+
+def move_to_uploaded(path):
+    uploaded_dir = os.path.join(os.path.dirname(path), "uploaded")
+    os.makedirs(uploaded_dir, exist_ok=True)
+    os.replace(path, os.path.join(uploaded_dir, os.path.basename(path)))
+
+
+# 監視しているディレクトリで見つかったファイルをまとめてジョブにする
+def enqueue_watched_files(paths):
+    queued = []
+    for path in paths:
+        stat = os.stat(path)
+        job_id = "watch-" + hashlib.blake2b(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=8).hexdigest()
+        if job_queue.enqueue(job_id, {"watch_path": path, "channel": SLACK_CHANNEL_ID}):
+            queued.append(path)
+    metrics.inc("video_backup_jobs_queued_total", len(queued), source="watch")
+    if queued:
+        print(f"video-backup: Queued {len(queued)} watched files")
+        names = "\n".join(os.path.basename(path) for path in queued[:20])
+        more = f"\n... and {len(queued) - 20} more" if len(queued) > 20 else ""
+        post_message_to_slack(SLACK_CHANNEL_ID, None, f"*Queued {len(queued)} local videos*\n{names}{more}")
+
+
+# Slack のスレッドの進捗メッセージを間引いて更新する
+def progress_reporter(channel_id, ts, label):
+    last_report = [time.monotonic()]
+
+    def report(done, total):
+        if ts is None or time.monotonic() - last_report[0] < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_report[0] = time.monotonic()
+        percent = f" ({done / total:.0%})" if total else ""
+        update_slack_message(channel_id, ts, f"*Uploading video*\n{label}\n{done / 2**20:.0f} MiB{percent}")
 
+    return report
 
-def download_slack_file(file_url):
-    print(f"video-backup: Started downloading file from {file_url}")
-    headers = {"Authorization": f"Bearer {SLACK_BOT_TOKEN}"}
-    response = requests.get(file_url, headers=headers)
-    response.raise_for_status()
 
-    file_name = file_url.split("/")[-1]
-    if not os.path.exists(file_name):
-        with open(file_name, "wb") as f:
-            f.write(response.content)
-    print(f"video-backup: Downloaded file from {file_url}")
-    return file_name
+def notify_job_failed(job, error):
+    event = job["payload"]
+    post_message_to_slack(event.get("channel"), event.get("ts"), f"*Error*\n```{error!r}```")
 
 
-def upload_video_to_youtube(filename, title, description):
-    body = {
+job_queue = JobQueue(process_backup_job, on_failed=notify_job_failed)
+metrics.gauge_function("queue_depth", job_queue.pending)
+
+
+def find_videos(message):
+    videos = []
+    for file in message.get("files", []):
+        for ext in extensions:
+            if file["url_private"].endswith(ext):
+                videos.append(
+                    {
+                        "id": file.get("id", file["name"]),
+                        "url": file["url_private"],
+                        "name": file["name"],
+                        "size": file.get("size"),
+                        "index": len(videos) + 1,
+                    }
+                )
+                break
+    return videos
+
+
+def video_body(title, description):
+    return {
         "snippet": {
             "title": title,
             "description": description,
@@ -253,30 +505,77 @@ def upload_video_to_youtube(filename, title, description):
             "privacyStatus": "private",
         },
     }
-    media = MediaFileUpload(filename, mimetype="video/*", resumable=True)
+
+
+def upload_video_to_youtube(filename, title, description, on_progress=None, session=None, save_session=None):
+    from googleapiclient.http import MediaFileUpload
+
+    from video_backup.pipeline import UPLOAD_CHUNK_SIZE, UPLOAD_RETRIES
+    from video_backup.resumable import upload_chunks
+
+    media = MediaFileUpload(filename, mimetype="video/*", chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
     youtube = get_youtube_service()
-    request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
-    response = request.execute()
-    return response
+    request = youtube.videos().insert(part="snippet,status", body=video_body(title, description), media_body=media)
+    return upload_chunks(request, UPLOAD_RETRIES, session, save_session, on_progress, filename)
 
 
+# Slack のファイルを一時ファイルを作らずに YouTube へ転送する
+def transfer_video_to_youtube(video, title, description, on_progress=None, session=None, save_session=None, check_content=None):
+    from video_backup.pipeline import pipelined_transfer
+
+    youtube = get_youtube_service()
+    return pipelined_transfer(
+        video["url"],
+        SLACK_BOT_TOKEN,
+        lambda media: youtube.videos().insert(part="snippet,status", body=video_body(title, description), media_body=media),
+        size=video.get("size"),
+        name=video["name"],
+        on_progress=on_progress,
+        session=session,
+        save_session=save_session,
+        check_content=check_content,
+    )
+
+
+# ハッシュの索引に載っているファイル名は内容で判定するので、ここでは索引より前の動画だけを見る
 def check_if_video_exists(title):
-    sheet = get_google_sheet()
-    records = sheet.get_all_records()
-    for record in records:
-        if record["File Name"] == title and record["Status"] == "succeeded":
-            print(f'video-backup: Found existing video with title: "{title}"')
-            return True
+    if content_index.has_name(title):
+        return False
+    sheet_mirror.sync(get_google_sheet())
+    if sheet_mirror.exists(title):
+        print(f'video-backup: Found existing video with title: "{title}"')
+        return True
     return False
 
 
 def post_message_to_slack(channel_id, thread_ts, message):
+    """Returns the ts of the posted message, or None if posting failed."""
     client = WebClient(token=SLACK_BOT_TOKEN)
     try:
         response = client.chat_postMessage(channel=channel_id, thread_ts=thread_ts, text=message)
+        return response["ts"]
     except SlackApiError as e:
         print(f"video-backup: Failed to post message to Slack: {e.response['error']}")
 
 
+def update_slack_message(channel_id, ts, message):
+    if ts is None:
+        return
+    client = WebClient(token=SLACK_BOT_TOKEN)
+    try:
+        client.chat_update(channel=channel_id, ts=ts, text=message)
+    except SlackApiError as e:
+        print(f"video-backup: Failed to update message on Slack: {e.response['error']}")
+
+
 if __name__ == "__main__":
+    setup_logging("video-backup")
+    handle_signals()
+    print("video-backup: started")
+    sheet_log.start()
+    on_shutdown(job_queue.shutdown)
+    if not DRY_RUN:
+        job_queue.recover()
+    if WATCH_DIR and not DRY_RUN:
+        DirectoryWatcher(WATCH_DIR, enqueue_watched_files, extensions).start()
     bolt_app.start(port=int(os.environ.get("BOLT_APP_PORT", 8000)))
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# 環境変数から設定を取得
+DISCOVERY_DIR = "data/video-backup"
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{service}/{version}/rest"
+# 有効期限のこの秒数前にトークンを更新する
+TOKEN_REFRESH_MARGIN = float(os.environ.get("VIDEO_BACKUP_TOKEN_REFRESH_MARGIN", 5 * 60))
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+@contextmanager
+def timed(label):
+    """Prints how long the block took."""
+    start = time.perf_counter()
+    yield
+    print(f"video-backup: {label} took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def discovery_document(service, version):
+    """
+    Returns the parsed discovery document of an API, parsed once per process.
+
+    A copy in DISCOVERY_DIR takes precedence, then the one bundled with googleapiclient. Only when
+    neither exists is it fetched over the network, and then saved to DISCOVERY_DIR.
+    """
+    import requests
+    from googleapiclient.discovery_cache import get_static_doc
+
+    with _documents_lock:
+        if (service, version) not in _documents:
+            path = f"{DISCOVERY_DIR}/discovery-{service}-{version}.json"
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+            else:
+                content = get_static_doc(service, version)
+            if content is None:
+                response = requests.get(DISCOVERY_URL.format(service=service, version=version), timeout=30)
+                response.raise_for_status()
+                content = response.text
+                os.makedirs(DISCOVERY_DIR, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(content)
+            _documents[(service, version)] = json.loads(content)
+        return _documents[(service, version)]
+
+
+class TokenFileCredentials:
+    """
+    Authorized-user credentials kept in memory and reloaded only when the token file changes.
+
+    get() refreshes the access token `margin` seconds before it expires and writes the new token back,
+    so uploads never start with a token that runs out halfway.
+    """
+
+    def __init__(self, path, scopes, margin=TOKEN_REFRESH_MARGIN):
+        self._path = path
+        self._scopes = scopes
+        self._margin = timedelta(seconds=margin)
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._mtime = None
+
+    def _expiring(self):
+        expiry = self._credentials.expiry
+        # google-auth は naive な UTC で有効期限を持つ
+        return expiry is not None and expiry - self._margin <= datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def get(self):
+        """Returns the credentials, or None if the token file does not exist."""
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        with self._lock:
+            mtime = os.path.getmtime(self._path) if os.path.exists(self._path) else None
+            if mtime != self._mtime:
+                self._credentials = Credentials.from_authorized_user_file(self._path, self._scopes) if mtime else None
+                self._mtime = mtime
+            if self._credentials and self._credentials.refresh_token and self._expiring():
+                with timed("Refreshing the access token"):
+                    self._credentials.refresh(Request())
+                with open(self._path, "w") as f:
+                    f.write(self._credentials.to_json())
+                self._mtime = os.path.getmtime(self._path)
+            return self._credentials
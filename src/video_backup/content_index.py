@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+
+# 環境変数から設定を取得
+INDEX_FILE = "data/video-backup/content_index.json"
+
+
+class DuplicateContent(Exception):
+    """The file has the same content as a video that is already on YouTube."""
+
+    def __init__(self, entry):
+        super().__init__(f"same content as {entry['name']} ({entry['video_url']})")
+        self.entry = entry
+
+
+def content_hasher():
+    """Returns the streaming hash used for the index; feed it with update() as the data arrives."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(path, hasher=None, chunk_size=8 * 1024 * 1024):
+    """Returns the content hash of a file on disk. With `hasher`, feeds that one (e.g. with the part downloaded so far)."""
+    hasher = hasher or content_hasher()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ContentIndex:
+    """Maps content hashes of uploaded videos to {"name", "video_url", "size"}, saved as JSON."""
+
+    def __init__(self, path=INDEX_FILE):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        self._names = {entry["name"] for entry in self._entries.values()}
+
+    def get(self, digest):
+        return self._entries.get(digest)
+
+    def has_name(self, name):
+        """Whether a video with this file name was uploaded since the index exists."""
+        return name in self._names
+
+    def add(self, digest, name, video_url, size):
+        with self._lock:
+            self._entries[digest] = {"name": name, "video_url": video_url, "size": size}
+            self._names.add(name)
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path)
+
+    def check(self, digest):
+        """Raises DuplicateContent if `digest` is already in the index."""
+        entry = self.get(digest)
+        if entry:
+            raise DuplicateContent(entry)
@@ -0,0 +1,88 @@
+import os
+import pickle
+import threading
+import time
+
+# 環境変数から設定を取得
+SEEN_FILE = "data/video-backup/seen.log"
+LEGACY_STATUS_FILE = "data/video-backup/thread_status.pkl"
+SEEN_TTL = float(os.environ.get("VIDEO_BACKUP_SEEN_TTL_DAYS", 30)) * 24 * 60 * 60
+
+
+class SeenStore:
+    """
+    Remembers which event keys (message ts) have been received.
+
+    Keys are held in a dict for O(1) lookups and appended to `path` as "key<TAB>seen_at" lines, so recording
+    one costs a single small write. Keys older than `ttl` seconds are evicted when the log is compacted,
+    which happens once it holds more dead lines than live keys.
+    """
+
+    def __init__(self, path=SEEN_FILE, ttl=SEEN_TTL, legacy_path=LEGACY_STATUS_FILE):
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._log_lines = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+        elif legacy_path and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
+        self._compact_if_needed()
+
+    def _load(self):
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, seen_at = line.rstrip("\n").partition("\t")
+                if not seen_at:
+                    # 書き込み途中で止まった行は捨てる
+                    continue
+                self._seen[key] = float(seen_at)
+                self._log_lines += 1
+
+    def _migrate(self, legacy_path):
+        # 旧形式は thread_ts のリストなので、ts 自体を受信時刻として扱う
+        with open(legacy_path, "rb") as f:
+            for key in pickle.load(f):
+                if key:
+                    self._seen[key] = float(key)
+        self._compact()
+        print(f"video-backup: Migrated {len(self._seen)} thread_ts from {legacy_path}")
+
+    def _compact(self):
+        cutoff = time.time() - self._ttl
+        self._seen = {key: seen_at for key, seen_at in self._seen.items() if seen_at >= cutoff}
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\t{seen_at}\n" for key, seen_at in self._seen.items())
+        os.replace(tmp_path, self._path)
+        self._log_lines = len(self._seen)
+
+    def _compact_if_needed(self):
+        if self._log_lines > 2 * len(self._seen) + 1000 or self._oldest_expired():
+            self._compact()
+
+    def _oldest_expired(self):
+        # dict は挿入順なので先頭が最も古い
+        oldest = next(iter(self._seen.values()), None)
+        return oldest is not None and oldest < time.time() - self._ttl - 24 * 60 * 60
+
+    def __contains__(self, key):
+        """Checks memory only, without touching the disk."""
+        seen_at = self._seen.get(key)
+        return seen_at is not None and seen_at >= time.time() - self._ttl
+
+    def add(self, key):
+        """Records `key` and returns True, or returns False if it was already seen. Safe to call from several threads."""
+        with self._lock:
+            if key in self:
+                return False
+            seen_at = time.time()
+            self._seen.pop(key, None)
+            self._seen[key] = seen_at
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(f"{key}\t{seen_at}\n")
+            self._log_lines += 1
+            self._compact_if_needed()
+            return True
@@ -0,0 +1,129 @@
+import os
+import time
+
+import requests
+
+from video_backup.content_index import hash_file
+
+# 環境変数から設定を取得
+CHUNK_SIZE = int(os.environ.get("VIDEO_BACKUP_CHUNK_SIZE", 8 * 1024 * 1024))
+DOWNLOAD_RETRIES = int(os.environ.get("VIDEO_BACKUP_DOWNLOAD_RETRIES", 3))
+DOWNLOAD_DIR = "data/video-backup/downloads"
+PROGRESS_INTERVAL = 5
+
+
+class Progress:
+    """Prints transferred bytes, percentage and throughput at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, label, total=None, done=0):
+        self.label = label
+        self.total = total
+        self.done = done
+        self.started_at = time.monotonic()
+        self.started_from = done
+        self.printed_at = 0
+
+    def update(self, size):
+        self.done += size
+        if time.monotonic() - self.printed_at >= PROGRESS_INTERVAL:
+            self.report()
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started_at
+        return (self.done - self.started_from) / elapsed if elapsed > 0 else 0
+
+    def report(self, final=False):
+        self.printed_at = time.monotonic()
+        percent = f" ({self.done / self.total:.0%})" if self.total else ""
+        state = "done" if final else "in progress"
+        print(
+            f"video-backup: {self.label} {state}: {self.done / 2**20:.1f} MiB{percent}, {self.throughput() / 2**20:.1f} MiB/s"
+        )
+
+
+def _content_length(response, offset):
+    if "Content-Range" in response.headers:
+        return int(response.headers["Content-Range"].split("/")[-1])
+    if "Content-Length" in response.headers:
+        return offset + int(response.headers["Content-Length"])
+    return None
+
+
+def iter_slack_file(file_url, token, progress, offset=0):
+    """
+    Yields a Slack file from `offset` in CHUNK_SIZE pieces. When the connection drops, it reconnects
+    with an HTTP Range request for the rest, up to DOWNLOAD_RETRIES times.
+    """
+    progress.done = progress.started_from = offset
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            headers = {"Authorization": f"Bearer {token}"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                print(f"video-backup: Resuming download at {offset / 2**20:.1f} MiB")
+
+            with requests.get(file_url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if offset and response.status_code == 416:
+                    # 既に最後まで受信済み
+                    return
+                response.raise_for_status()
+                progress.total = _content_length(response, offset if response.status_code == 206 else 0)
+                # Range を無視されたときは受信済みの部分を読み飛ばす
+                skip = offset if response.status_code != 206 else 0
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if skip:
+                        chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                        if not chunk:
+                            continue
+                    offset += len(chunk)
+                    progress.update(len(chunk))
+                    yield chunk
+
+            # urllib3 は Content-Length より短いレスポンスをエラーにしない
+            if progress.total and offset < progress.total:
+                raise requests.exceptions.ConnectionError(f"connection closed at {offset} of {progress.total} bytes")
+            return
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            print(f"video-backup: Download interrupted ({e!r}), retrying ({attempt}/{DOWNLOAD_RETRIES})")
+            time.sleep(2**attempt)
+
+
+def download_path(job_id, file_id, name):
+    """Returns where a Slack file of one job is downloaded; only a retry of the same job resumes or reuses it."""
+    return os.path.join(DOWNLOAD_DIR, f"{job_id}-{file_id}{os.path.splitext(name)[1]}")
+
+
+def download_slack_file(file_url, token, file_name, hasher=None):
+    """
+    Streams a Slack file to disk CHUNK_SIZE bytes at a time, so memory use does not depend on the file size.
+    Data is written to <file_name>.part first; after a dropped connection (or a restart) the download
+    resumes from the end of that file with an HTTP Range request. `file_name` should come from
+    download_path(), so that a file left by another job is never taken for this one.
+    If `hasher` is given, it is fed with the file content as it is written.
+    """
+    print(f"video-backup: Started downloading file from {file_url}")
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    if os.path.exists(file_name):
+        print(f"video-backup: {file_name} already exists, skipping download")
+        if hasher:
+            hash_file(file_name, hasher, CHUNK_SIZE)
+        return file_name
+
+    part_name = file_name + ".part"
+    offset = os.path.getsize(part_name) if os.path.exists(part_name) else 0
+    if offset and hasher:
+        # 前回受信した部分だけ読み直す
+        hash_file(part_name, hasher, CHUNK_SIZE)
+    progress = Progress(f"Download of {file_name}")
+    with open(part_name, "ab") as f:
+        for chunk in iter_slack_file(file_url, token, progress, offset):
+            if hasher:
+                hasher.update(chunk)
+            f.write(chunk)
+
+    os.replace(part_name, file_name)
+    progress.report(final=True)
+    print(f"video-backup: Downloaded file from {file_url}")
+    return file_name
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 環境変数から設定を取得
+JOBS_DIR = "data/video-backup/jobs"
+WORKERS = int(os.environ.get("VIDEO_BACKUP_WORKERS", 2))
+MAX_ATTEMPTS = int(os.environ.get("VIDEO_BACKUP_MAX_ATTEMPTS", 3))
+RETRY_DELAY = float(os.environ.get("VIDEO_BACKUP_RETRY_DELAY", 60))
+# 終了時に実行中のジョブを待つ秒数 (アップロードはチャンクごとに保存されるので、残りは次の起動で再開する)
+SHUTDOWN_TIMEOUT = float(os.environ.get("VIDEO_BACKUP_SHUTDOWN_SECONDS", 15))
+# 終わったジョブのファイルを残す日数 (0 なら消さない)。消えた後は同じ id のジョブを受け付け直す
+JOB_TTL = float(os.environ.get("VIDEO_BACKUP_JOB_TTL_DAYS", 7)) * 24 * 60 * 60
+PRUNE_INTERVAL = 60 * 60
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = [DONE, FAILED]
+
+
+class JobQueue:
+    """
+    A durable job queue backed by one JSON file per job in `jobs_dir`.
+
+    `process(job, update)` does the work; it may call `update(state=..., **fields)` to persist progress and
+    returns normally when the job is done. If it raises, the job goes back to the queue after
+    RETRY_DELAY * 2^(attempt - 1) seconds, and after MAX_ATTEMPTS attempts `on_failed(job, error)` is called
+    and the job is marked failed. Jobs that were not finished when the process stopped are picked up again
+    by recover(), so process() must persist non-idempotent results (such as an uploaded video id) with
+    update() as soon as it has them. Files of jobs that finished more than `job_ttl` seconds ago are
+    deleted by recover() and then at most every PRUNE_INTERVAL seconds after a job ends.
+    """
+
+    def __init__(self, process, on_failed=None, jobs_dir=JOBS_DIR, workers=WORKERS, max_attempts=MAX_ATTEMPTS, job_ttl=JOB_TTL):
+        self._process = process
+        self._on_failed = on_failed
+        self._jobs_dir = jobs_dir
+        self._max_attempts = max_attempts
+        self._job_ttl = job_ttl
+        self._pruned_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="video-backup-job")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._idle = threading.Condition(self._lock)
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return f"{self._jobs_dir}/{job_id}.json"
+
+    def load(self, job_id):
+        with open(self._path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, job):
+        job["updated_at"] = time.time()
+        tmp_path = self._path(job["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def enqueue(self, job_id, payload):
+        """Stores a new job and schedules it. Returns False if a job with the same id already exists."""
+        with self._lock:
+            if os.path.exists(self._path(job_id)):
+                return False
+            job = {"id": job_id, "state": QUEUED, "attempts": 0, "payload": payload, "created_at": time.time()}
+            self._save(job)
+        self._submit(job_id)
+        return True
+
+    def recover(self):
+        """Requeues every job that was queued or in progress when the process last stopped, and prunes the finished ones."""
+        self.prune()
+        recovered = 0
+        for file_name in sorted(os.listdir(self._jobs_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            job = self.load(file_name[: -len(".json")])
+            if job["state"] in FINISHED_STATES:
+                continue
+            job["state"] = QUEUED
+            self._save(job)
+            self._submit(job["id"])
+            recovered += 1
+        print(f"video-backup: Recovered {recovered} unfinished jobs")
+        return recovered
+
+    def prune(self):
+        """Deletes the files of jobs that finished more than `job_ttl` seconds ago. Returns how many were deleted."""
+        self._pruned_at = time.monotonic()
+        if self._job_ttl <= 0:
+            return 0
+        expires_before = time.time() - self._job_ttl
+        pruned = 0
+        for file_name in os.listdir(self._jobs_dir):
+            if not file_name.endswith(".json"):
+                continue
+            job_id = file_name[: -len(".json")]
+            # enqueue() と同じロックで、判定から削除までの間に同じ id のジョブが作られないようにする
+            with self._lock:
+                try:
+                    job = self.load(job_id)
+                except FileNotFoundError:
+                    continue
+                if job["state"] in FINISHED_STATES and job.get("updated_at", 0) < expires_before:
+                    os.remove(self._path(job_id))
+                    pruned += 1
+        if pruned:
+            print(f"video-backup: Pruned {pruned} jobs finished more than {self._job_ttl / 86400:g} days ago")
+        return pruned
+
+    def counts(self):
+        """Returns the number of jobs in each state."""
+        counts = {}
+        for file_name in os.listdir(self._jobs_dir):
+            if file_name.endswith(".json"):
+                try:
+                    state = self.load(file_name[: -len(".json")])["state"]
+                except FileNotFoundError:
+                    # prune() が消した
+                    continue
+                counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def pending(self):
+        """Returns the number of jobs that are queued, running or waiting for a retry in this process."""
+        return self._pending
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Drops the queued jobs and waits up to `timeout` seconds for the running ones. Jobs left unfinished
+        keep their state file and are requeued by recover() on the next start.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._idle:
+            if not self._idle.wait_for(lambda: self._running == 0, timeout):
+                print(f"video-backup: {self._running} jobs still running at shutdown, they resume on the next start")
+
+    def _submit(self, job_id, delay=0):
+        with self._lock:
+            self._pending += 1
+        if delay:
+            timer = threading.Timer(delay, self._execute, args=(job_id,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._execute(job_id)
+
+    def _execute(self, job_id):
+        try:
+            self._executor.submit(self._run, job_id)
+        except RuntimeError:
+            # shutdown() の後。ジョブのファイルは残るので、次の起動で recover() が拾う
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, job_id):
+        with self._lock:
+            self._running += 1
+        try:
+            self._attempt(job_id)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._running -= 1
+                self._idle.notify_all()
+        if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            try:
+                self.prune()
+            except OSError as e:
+                print(f"⚠️ video-backup: Failed to prune finished jobs: {e!r}")
+
+    def _attempt(self, job_id):
+        job = self.load(job_id)
+        job["attempts"] += 1
+        self._save(job)
+
+        def update(**fields):
+            job.update(fields)
+            self._save(job)
+
+        try:
+            self._process(job, update)
+            update(state=DONE, error=None)
+        except Exception as e:
+            print(f"video-backup: Job {job_id} attempt {job['attempts']}/{self._max_attempts} failed: {e!r}")
+            if job["attempts"] >= self._max_attempts:
+                update(state=FAILED, error=repr(e))
+                if self._on_failed:
+                    self._on_failed(job, e)
+                return
+            update(state=QUEUED, error=repr(e))
+            self._submit(job_id, delay=RETRY_DELAY * 2 ** (job["attempts"] - 1))
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+from googleapiclient.http import MediaUpload
+
+from video_backup.content_index import content_hasher
+from video_backup.download import Progress, iter_slack_file
+from video_backup.resumable import upload_chunks
+
+# 環境変数から設定を取得
+# YouTube の resumable upload はチャンクを 256 KiB の倍数にする必要がある
+UPLOAD_CHUNK_SIZE = int(os.environ.get("VIDEO_BACKUP_UPLOAD_CHUNK_SIZE", 32 * 1024 * 1024)) // (256 * 1024) * (256 * 1024)
+PIPE_BUFFER_SIZE = int(os.environ.get("VIDEO_BACKUP_PIPE_BUFFER_SIZE", 64 * 1024 * 1024))
+UPLOAD_RETRIES = int(os.environ.get("VIDEO_BACKUP_UPLOAD_RETRIES", 5))
+
+
+class PipeMediaUpload(MediaUpload):
+    """
+    A resumable MediaUpload fed by another thread through a bounded buffer.
+
+    The producer calls write() and close(); googleapiclient calls getbytes() from the uploading thread.
+    getbytes() is only asked for offsets the server has acknowledged everything before, so bytes below
+    that offset are dropped. write() blocks once `buffer_size` bytes are waiting, which throttles the
+    download to the upload speed. The chunk that would complete an upload of known size is held back
+    until close(), so the producer can still call fail() to abort the upload after seeing all the data.
+    """
+
+    def __init__(self, mimetype="video/*", chunksize=UPLOAD_CHUNK_SIZE, size=None, buffer_size=PIPE_BUFFER_SIZE, offset=0):
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._size = size
+        # 1 チャンク分は必ず溜められるようにする
+        self._buffer_size = max(buffer_size, 2 * chunksize)
+        self._buffer = bytearray()
+        # 再開したアップロードでは offset より前のバイトは流れてこない
+        self._base = offset
+        self._closed = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def write(self, data):
+        with self._cond:
+            self._cond.wait_for(lambda: self._error or len(self._buffer) < self._buffer_size)
+            if self._error:
+                raise self._error
+            self._buffer += data
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        """Stops both sides; the next write() or getbytes() raises `error`."""
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def getbytes(self, begin, length):
+        with self._cond:
+            if begin < self._base:
+                raise ValueError(f"offset {begin} was already dropped from the pipe (buffer starts at {self._base})")
+            # 再開時にサーバーが保存済みの位置より先まで受け取っていた場合は、そこまで届くのを待つ
+            self._cond.wait_for(lambda: self._error or self._closed or len(self._buffer) >= begin - self._base)
+            if self._error:
+                raise self._error
+            # 送信済みの部分を捨てて、下流の write() を再開させる
+            del self._buffer[: begin - self._base]
+            self._base = begin
+            self._cond.notify_all()
+            # 最後のチャンクは close() されるまで送らない
+            self._cond.wait_for(
+                lambda: (
+                    self._error
+                    or self._closed
+                    or len(self._buffer) >= length
+                    and (self._size is None or begin + length < self._size)
+                )
+            )
+            if self._error:
+                raise self._error
+            return bytes(self._buffer[:length])
+
+    def to_json(self):
+        """
+        Always raises TypeError: the data comes from a live download and cannot be rebuilt from JSON.
+        Persist the upload session with the `save_session` of upload_chunks() instead.
+        """
+        raise TypeError(
+            "PipeMediaUpload is fed by a running download and cannot be serialized; save the upload session instead"
+        )
+
+
+def pipelined_transfer(
+    file_url, token, make_request, size=None, name=None, on_progress=None, session=None, save_session=None, check_content=None
+):
+    """
+    Streams a Slack file straight into a YouTube resumable upload session.
+
+    `make_request(media)` must return the videos().insert() request built with `media` as media_body.
+    The download runs in a background thread and the upload in the calling thread, so the total time
+    approaches the slower of the two instead of their sum, and nothing is written to disk.
+    `on_progress(uploaded_bytes, size)` is called after every acknowledged chunk. `session` and
+    `save_session` resume and persist the upload session as in upload_chunks(); a resumed transfer
+    downloads only the part after the saved offset.
+    With `check_content(digest)`, the content hash is computed while streaming and passed to it before
+    the last chunk is sent; if it raises (e.g. DuplicateContent), the upload is aborted unfinished and
+    the exception is raised here. A resumed transfer then downloads the whole file again for the hash.
+    Returns the API response of the finished upload.
+    """
+    name = name or file_url.split("/")[-1]
+    offset = session["offset"] if session else 0
+    print(f"video-backup: Started pipelined transfer of {name}")
+    media = PipeMediaUpload(size=size, offset=offset)
+    download_progress = Progress(f"Download of {name}", total=size)
+    download_time = {}
+
+    hasher = content_hasher() if check_content else None
+
+    def produce():
+        # ハッシュには全体が要るので、再開時も先頭から受信して送信済みの部分は捨てる
+        position = 0 if hasher else offset
+        try:
+            for chunk in iter_slack_file(file_url, token, download_progress, offset=position):
+                start, position = position, position + len(chunk)
+                if hasher:
+                    hasher.update(chunk)
+                if position > offset:
+                    media.write(chunk[max(0, offset - start) :])
+            # 最後のチャンクは close() まで送られないので、重複ならここでアップロードを中止できる
+            if check_content:
+                check_content(hasher.hexdigest())
+            media.close()
+            download_time["elapsed"] = time.monotonic() - download_progress.started_at
+        except Exception as e:
+            media.fail(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    started_at = time.monotonic()
+    producer.start()
+
+    request = make_request(media)
+    try:
+        response = upload_chunks(request, UPLOAD_RETRIES, session, save_session, on_progress, name)
+    except Exception as e:
+        media.fail(e)
+        raise
+    finally:
+        producer.join()
+
+    elapsed = time.monotonic() - started_at
+    download_progress.report(final=True)
+    print(
+        f"video-backup: Pipelined transfer of {name} done in {elapsed:.1f} s "
+        f"(download alone took {download_time.get('elapsed', float('nan')):.1f} s)"
+    )
+    return response
@@ -0,0 +1,48 @@
+from googleapiclient.errors import HttpError
+
+
+class SessionExpired(Exception):
+    """The saved upload session is gone on the server side; the upload has to start over."""
+
+
+def resume_session(request, session):
+    """
+    Points `request` at a saved upload session. googleapiclient then starts by asking the server
+    how many bytes it already has, and continues from there.
+    """
+    request.resumable_uri = session["uri"]
+    request.resumable_progress = session["offset"]
+    request._in_error_state = True
+
+
+def upload_chunks(request, num_retries, session=None, save_session=None, on_progress=None, name="video"):
+    """
+    Runs a resumable upload chunk by chunk and returns the API response.
+
+    If `session` ({"uri", "offset"}) is given, the upload continues that session instead of starting a
+    new one. After every acknowledged chunk, `save_session(session)` is called so the caller can persist
+    it; a process that dies mid-upload then loses at most one chunk.
+    """
+    resuming = session is not None
+    if resuming:
+        print(f"video-backup: Resuming upload of {name} at {session['offset'] / 2**20:.1f} MiB")
+        resume_session(request, session)
+
+    response = None
+    while response is None:
+        try:
+            status, response = request.next_chunk(num_retries=num_retries)
+        except HttpError as e:
+            if resuming and e.resp.status in (404, 410):
+                if save_session:
+                    save_session(None)
+                raise SessionExpired(f"upload session of {name} has expired") from e
+            raise
+        resuming = False
+        if status:
+            if save_session:
+                save_session({"uri": request.resumable_uri, "offset": status.resumable_progress})
+            print(f"video-backup: Upload of {name} in progress: {status.resumable_progress / 2**20:.1f} MiB")
+            if on_progress:
+                on_progress(status.resumable_progress, status.total_size)
+    return response
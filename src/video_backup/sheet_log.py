@@ -0,0 +1,112 @@
+import atexit
+import json
+import os
+import threading
+
+# 環境変数から設定を取得
+SPOOL_FILE = "data/video-backup/sheet_spool.jsonl"
+BATCH_SIZE = int(os.environ.get("VIDEO_BACKUP_SHEET_BATCH_SIZE", 20))
+FLUSH_INTERVAL = float(os.environ.get("VIDEO_BACKUP_SHEET_FLUSH_SECONDS", 30))
+MAX_BACKOFF = 30 * 60
+
+
+class SheetLogWriter:
+    """
+    Write-behind log of rows for the backup spreadsheet.
+
+    append() only writes the row to a local spool file. A background thread sends everything spooled
+    in one append_rows() call every `interval` seconds, or as soon as `batch_size` rows are waiting.
+    Rows stay in the spool until Sheets accepts them, so they survive restarts and outages; failed
+    flushes are retried with exponential backoff. A crash between a successful flush and the spool
+    rewrite sends those rows again on the next start. Only one flush runs at a time, and at exit the
+    thread is stopped before the last flush.
+    """
+
+    def __init__(self, get_sheet, path=SPOOL_FILE, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self._get_sheet = get_sheet
+        self._path = path
+        self._batch_size = batch_size
+        self._interval = interval
+        self._lock = threading.Lock()
+        # 読み出し・送信・書き直しをまとめて 1 つずつ行う (append は待たせない)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._failures = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._pending = len(self._read())
+
+    def _read(self):
+        if not os.path.exists(self._path):
+            return []
+        with open(self._path, "r", encoding="utf-8") as f:
+            # 書き込み途中で止まった最終行は捨てる
+            return [json.loads(line) for line in f if line.endswith("\n")]
+
+    def append(self, row):
+        with self._lock:
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += 1
+            if self._pending >= self._batch_size:
+                self._wake.set()
+
+    def flush(self):
+        """Sends all spooled rows in one request. Returns True if the spool is empty afterwards."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            rows = self._read()
+        if not rows:
+            return True
+        try:
+            self._get_sheet().append_rows(rows)
+        except Exception as e:
+            # get_sheet() が読み込み済みなので、ここでのインポートは軽い
+            from gspread.exceptions import APIError
+
+            self._failures += 1
+            reason = "quota exceeded" if isinstance(e, APIError) and e.response.status_code == 429 else repr(e)
+            print(f"video-backup: Failed to append {len(rows)} rows to the sheet ({reason}), keeping them spooled")
+            return False
+        self._failures = 0
+
+        with self._lock:
+            # flush 中に追加された行だけを残す
+            rest = self._read()[len(rows) :]
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rest)
+            os.replace(tmp_path, self._path)
+            self._pending = len(rest)
+        print(f"video-backup: Appended {len(rows)} rows to the sheet")
+        return True
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            if self._failures:
+                # 失敗中はバッチサイズに達しても待つ
+                self._stopping.wait(min(self._interval * 2**self._failures, MAX_BACKOFF))
+            else:
+                self._wake.wait(self._interval)
+            self._wake.clear()
+            if not self._stopping.is_set():
+                self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stops the background thread, waiting for a flush in progress, then sends what is left."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
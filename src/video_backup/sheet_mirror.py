@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+# 環境変数から設定を取得
+MIRROR_FILE = "data/video-backup/sheet_mirror.json"
+NAME_COLUMN = "File Name"
+STATUS_COLUMN = "Status"
+
+
+class SheetMirror:
+    """
+    A local copy of the backup spreadsheet, indexed as {file name: [statuses]}.
+
+    sync() only fetches rows below the last row it has seen, so a duplicate check costs one small
+    request plus a dict lookup however long the history is. Rows we append ourselves are indexed
+    right away through record(); re-reading them on the next sync is harmless.
+    """
+
+    def __init__(self, path=MIRROR_FILE):
+        self._path = path
+        self._lock = threading.Lock()
+        self._header = []
+        self._row_count = 0
+        self._index = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._header = state["header"]
+            self._row_count = state["row_count"]
+            self._index = {name: set(statuses) for name, statuses in state["index"].items()}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        state = {
+            "header": self._header,
+            "row_count": self._row_count,
+            "index": {name: sorted(statuses) for name, statuses in self._index.items()},
+        }
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+
+    def _add(self, row):
+        name_at = self._header.index(NAME_COLUMN)
+        status_at = self._header.index(STATUS_COLUMN)
+        if len(row) > max(name_at, status_at):
+            self._index.setdefault(row[name_at], set()).add(row[status_at])
+
+    def sync(self, sheet):
+        """Fetches the rows added to `sheet` since the last sync. Returns the number of new rows."""
+        with self._lock:
+            # 1 行目はヘッダー
+            values = sheet.get(f"A{self._row_count + 1}:ZZ")
+            if not values:
+                return 0
+            if self._row_count == 0:
+                self._header = values.pop(0)
+                self._row_count = 1
+            for row in values:
+                self._add(row)
+            self._row_count += len(values)
+            self._save()
+            print(f"video-backup: Synced {len(values)} new rows from the sheet ({self._row_count} rows in total)")
+            return len(values)
+
+    def record(self, row):
+        """Indexes a row we are appending to the sheet ourselves."""
+        with self._lock:
+            if self._header:
+                self._add([str(value) for value in row])
+                self._save()
+
+    def exists(self, file_name, status="succeeded"):
+        return status in self._index.get(file_name, ())
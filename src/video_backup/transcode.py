@@ -0,0 +1,97 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+# 環境変数から設定を取得
+TRANSCODE_ENABLED = os.environ.get("VIDEO_BACKUP_TRANSCODE", "0") != "0"
+FFMPEG_PATH = os.environ.get("VIDEO_BACKUP_FFMPEG", "ffmpeg")
+# これより大きいファイルは再エンコードし、小さいファイルは faststart の MP4 に詰め直すだけにする
+REENCODE_THRESHOLD = int(float(os.environ.get("VIDEO_BACKUP_REENCODE_THRESHOLD_MB", 500)) * 2**20)
+CRF = os.environ.get("VIDEO_BACKUP_CRF", "23")
+PRESET = os.environ.get("VIDEO_BACKUP_PRESET", "veryfast")
+TRANSCODE_WORKERS = int(os.environ.get("VIDEO_BACKUP_TRANSCODE_WORKERS", os.cpu_count() or 1))
+# 変換後のファイルの置き場所。監視ディレクトリの外に置き、新しい動画として拾われないようにする
+TRANSCODE_DIR = os.environ.get("VIDEO_BACKUP_TRANSCODE_DIR", "data/video-backup/transcode")
+
+# ffmpeg は別プロセスなので、スレッドから直接起動して同時に動かす数だけを制限する
+_slots = threading.BoundedSemaphore(TRANSCODE_WORKERS)
+
+
+def _ffmpeg_command(source, target, reencode):
+    command = [FFMPEG_PATH, "-y", "-v", "error", "-i", source, "-map", "0:v", "-map", "0:a?"]
+    if reencode:
+        # ファイル単位で並列に動かすので、1 プロセスあたりのスレッド数を抑える
+        threads = max(1, (os.cpu_count() or 1) // TRANSCODE_WORKERS)
+        command += ["-c:v", "libx264", "-preset", PRESET, "-crf", CRF, "-threads", str(threads), "-c:a", "aac", "-b:a", "160k"]
+    else:
+        command += ["-c", "copy"]
+    return command + ["-movflags", "+faststart", "-f", "mp4", target]
+
+
+def _run_ffmpeg(source, target, reencode):
+    with _slots:
+        started_at = time.monotonic()
+        tmp_target = target + ".tmp"
+        subprocess.run(_ffmpeg_command(source, tmp_target, reencode), check=True, capture_output=True)
+        os.replace(tmp_target, target)
+        return time.monotonic() - started_at
+
+
+def prepare_video(source):
+    """
+    Remuxes `source` to a faststart MP4, or re-encodes it if it is larger than REENCODE_THRESHOLD,
+    with at most TRANSCODE_WORKERS ffmpeg processes at once. The output is written to TRANSCODE_DIR
+    under a name derived from the source path, and reused when it already exists, so an upload resumed
+    after a restart sends the same bytes again. The caller deletes it once the upload ends, successful or not.
+
+    Returns {"path", "original_size", "size", "elapsed", "mode"}. When transcoding is disabled,
+    ffmpeg is missing or fails, or a re-encode does not make the file smaller, "path" is `source`.
+    """
+    original_size = os.path.getsize(source)
+    result = {"path": source, "original_size": original_size, "size": original_size, "elapsed": 0.0, "mode": "skipped"}
+    if not TRANSCODE_ENABLED:
+        return result
+    if shutil.which(FFMPEG_PATH) is None:
+        print(f"video-backup: {FFMPEG_PATH} not found, uploading {source} as is")
+        return result
+
+    reencode = original_size > REENCODE_THRESHOLD
+    stem = os.path.splitext(os.path.basename(source))[0]
+    source_id = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:12]
+    os.makedirs(TRANSCODE_DIR, exist_ok=True)
+    target = os.path.join(TRANSCODE_DIR, f"{stem}-{source_id}.transcoded.mp4")
+    if not os.path.exists(target):
+        try:
+            result["elapsed"] = _run_ffmpeg(source, target, reencode)
+        except Exception as e:
+            stderr = getattr(e, "stderr", b"") or b""
+            print(f"video-backup: Transcoding {source} failed, uploading it as is: {e!r} {stderr.decode(errors='replace')}")
+            return result
+
+    size = os.path.getsize(target)
+    if reencode and size >= original_size:
+        print(f"video-backup: Re-encoding {source} did not make it smaller, uploading it as is")
+        os.remove(target)
+        return result
+    result.update(path=target, size=size, mode="reencode" if reencode else "remux")
+    print(
+        f"video-backup: {result['mode'].capitalize()} of {source}: {original_size / 2**20:.1f} MiB -> "
+        f"{size / 2**20:.1f} MiB in {result['elapsed']:.1f} s"
+    )
+    return result
+
+
+def report_savings(result, upload_seconds):
+    """Prints bytes saved and the upload time saved minus the time spent transcoding, based on the measured upload speed."""
+    if result["mode"] == "skipped" or upload_seconds <= 0:
+        return
+    saved = result["original_size"] - result["size"]
+    throughput = result["size"] / upload_seconds
+    net_seconds = saved / throughput - result["elapsed"]
+    print(
+        f"video-backup: Transcoding saved {saved / 2**20:.1f} MiB; at {throughput / 2**20:.1f} MiB/s "
+        f"that is {net_seconds:+.1f} s of net end-to-end time"
+    )
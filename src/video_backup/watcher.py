@@ -0,0 +1,124 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+# 環境変数から設定を取得
+WATCH_POLL_SECONDS = float(os.environ.get("VIDEO_BACKUP_WATCH_POLL_SECONDS", 10))
+# サイズと更新時刻がこの秒数変わらなければ書き込み完了とみなす
+WATCH_STABLE_SECONDS = float(os.environ.get("VIDEO_BACKUP_WATCH_STABLE_SECONDS", 30))
+# イベントが途切れてからこの秒数待って、まとめて投入する
+WATCH_BATCH_SECONDS = 2
+WATCH_BATCH_LIMIT = 100
+# 変換の出力や書き込み途中のファイルは動画として扱わない
+SKIPPED_NAME_PARTS = (".transcoded.", ".part", ".tmp")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _inotify_fd(directory):
+    """Returns an inotify fd watching `directory` for finished writes and moves, or None if inotify is unavailable."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        return fd
+    except (OSError, AttributeError) as e:
+        print(f"video-backup: inotify is not available ({e!r}), polling {directory} instead")
+        return None
+
+
+def _read_names(fd, timeout):
+    if not select.select([fd], [], [], timeout)[0]:
+        return []
+    data = os.read(fd, 64 * 1024)
+    names = []
+    offset = 0
+    while offset < len(data):
+        _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        names.append(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+        offset += length
+    return names
+
+
+class DirectoryWatcher:
+    """
+    Watches a directory for finished video files and hands them to `on_files(paths)` in batches.
+
+    Files are reported when inotify sees them closed after writing or moved in. Files that were already
+    there, or that inotify cannot see (network mounts, or no inotify at all), are reported by a periodic
+    scan once their size and mtime have not changed for WATCH_STABLE_SECONDS. Each path is reported once
+    per process; callers dedupe across restarts.
+    """
+
+    def __init__(self, directory, on_files, extensions):
+        self._directory = directory
+        self._on_files = on_files
+        self._extensions = tuple(extensions)
+        self._seen = {}
+        self._reported = set()
+
+    def _is_video(self, name):
+        return (
+            name.endswith(self._extensions)
+            and not name.startswith((".", "~"))
+            and not any(part in name for part in SKIPPED_NAME_PARTS)
+        )
+
+    def _scan(self):
+        """Returns the videos whose size and mtime stayed the same since the previous scan for long enough."""
+        stable = []
+        now = time.time()
+        for entry in os.scandir(self._directory):
+            if not entry.is_file() or not self._is_video(entry.name) or entry.path in self._reported:
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime)
+            if self._seen.get(entry.path) == signature and now - stat.st_mtime >= WATCH_STABLE_SECONDS:
+                stable.append(entry.path)
+            self._seen[entry.path] = signature
+        return stable
+
+    def _report(self, paths):
+        paths = sorted({path for path in paths if path not in self._reported and os.path.exists(path)})
+        if not paths:
+            return
+        self._reported.update(paths)
+        try:
+            self._on_files(paths)
+        except Exception as e:
+            print(f"video-backup: Failed to queue {len(paths)} watched files: {e!r}")
+            self._reported.difference_update(paths)
+
+    def run(self):
+        print(f"video-backup: Watching {self._directory} for videos")
+        fd = _inotify_fd(self._directory)
+        pending = []
+        scanned_at = 0
+        while True:
+            if fd is None:
+                time.sleep(WATCH_POLL_SECONDS)
+            else:
+                # イベントが続いている間は待ってから、まとめて投入する
+                names = _read_names(fd, WATCH_BATCH_SECONDS if pending else WATCH_POLL_SECONDS)
+                pending += [os.path.join(self._directory, name) for name in names if self._is_video(name)]
+                if names and len(pending) < WATCH_BATCH_LIMIT:
+                    continue
+            if time.monotonic() - scanned_at >= WATCH_POLL_SECONDS:
+                pending += self._scan()
+                scanned_at = time.monotonic()
+            self._report(pending)
+            pending = []
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()